@@ -0,0 +1,234 @@
+"""
+Stand-in for Krita's ``krita`` module.
+
+Only the parts of the scripting API used by the engine are provided.
+"""
+
+from sgtk.platform.qt import QtGui, Signal
+
+
+class _NotifierSignal(Signal):
+    """
+    Signal of a :class:`Notifier`, dropped while the notifier isn't active.
+    """
+
+    def __init__(self, notifier):
+        Signal.__init__(self)
+        self._notifier = notifier
+
+    def emit(self, *args):
+        if self._notifier.active():
+            Signal.emit(self, *args)
+
+
+class Notifier(object):
+    """
+    Stand-in for ``krita.Notifier``, which like Krita's only emits its
+    signals once activated.
+    """
+
+    def __init__(self):
+        self.imageCreated = _NotifierSignal(self)
+        self.imageSaved = _NotifierSignal(self)
+        self.imageClosed = _NotifierSignal(self)
+        self.viewCreated = _NotifierSignal(self)
+        self.viewClosed = _NotifierSignal(self)
+        self.windowCreated = _NotifierSignal(self)
+        self.applicationClosing = _NotifierSignal(self)
+        self._active = False
+
+    def setActive(self, active):
+        self._active = active
+
+    def active(self):
+        return self._active
+
+
+class _Rect(object):
+
+    def __init__(self, x, y, width, height):
+        self._geometry = (x, y, width, height)
+
+    def x(self):
+        return self._geometry[0]
+
+    def y(self):
+        return self._geometry[1]
+
+    def width(self):
+        return self._geometry[2]
+
+    def height(self):
+        return self._geometry[3]
+
+
+class Node(object):
+    """
+    Stand-in for ``krita.Node``, filled with a single value.
+    """
+
+    def __init__(self, name, width=64, height=64, fill=0, node_type="paintlayer", children=None):
+        self._name = name
+        self._bounds = _Rect(0, 0, width, height)
+        self.fill = fill
+        self._type = node_type
+        self._children = list(children or [])
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return self._type
+
+    def childNodes(self):
+        return list(self._children)
+
+    def bounds(self):
+        return self._bounds
+
+    def colorModel(self):
+        return "RGBA"
+
+    def colorDepth(self):
+        return "U8"
+
+    def pixelData(self, x, y, w, h):
+        return bytearray([self.fill % 256]) * (w * h * 4)
+
+    def save(self, filename, x_res, y_res, configuration=None, rect=None):
+        with open(filename, "wb") as handle:
+            handle.write(self.pixelData(0, 0, self._bounds.width(), self._bounds.height()))
+        return True
+
+
+class Document(object):
+    """
+    Stand-in for ``krita.Document``.
+    """
+
+    def __init__(self, file_name, width=64, height=64, layers=None):
+        self._file_name = file_name
+        self._width = width
+        self._height = height
+        self._modified = False
+        self._root = Node("root", width, height, node_type="grouplayer", children=layers)
+
+    def rootNode(self):
+        return self._root
+
+    def xRes(self):
+        return 300.0
+
+    def yRes(self):
+        return 300.0
+
+    def fileName(self):
+        return self._file_name
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def modified(self):
+        return self._modified
+
+    def setModified(self, modified):
+        self._modified = modified
+
+    def colorModel(self):
+        return "RGBA"
+
+    def colorDepth(self):
+        return "U8"
+
+    def pixelData(self, x, y, w, h):
+        return bytearray(w * h * 4)
+
+    def thumbnail(self, w, h):
+        return QtGui.QImage(bytes(w * h * 4), w, h, w * 4, QtGui.QImage.Format_ARGB32)
+
+
+class Window(object):
+    """
+    Stand-in for ``krita.Window``.
+    """
+
+    def __init__(self):
+        self._qwindow = QtGui.QMainWindow()
+        self.activeViewChanged = Signal()
+
+    def qwindow(self):
+        return self._qwindow
+
+
+class Krita(object):
+    """
+    Stand-in for ``krita.Krita``.
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self._documents = []
+        self._active_document = None
+        self._windows = [Window()]
+        self._notifier = Notifier()
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Drops the current instance, for a benchmark to start from scratch.
+        """
+        cls._instance = None
+
+    def version(self):
+        return "4.0.0"
+
+    def documents(self):
+        return list(self._documents)
+
+    def activeDocument(self):
+        return self._active_document
+
+    def setActiveDocument(self, document):
+        if document not in self._documents:
+            self._documents.append(document)
+        self._active_document = document
+
+    def closeDocument(self, document):
+        self._documents.remove(document)
+        if self._active_document is document:
+            self._active_document = self._documents[-1] if self._documents else None
+        self._notifier.imageClosed.emit(document.fileName())
+
+    def windows(self):
+        return list(self._windows)
+
+    def activeWindow(self):
+        return self._windows[0]
+
+    def notifier(self):
+        return self._notifier
+
+
+class InfoObject(object):
+    """
+    Stand-in for ``krita.InfoObject``.
+    """
+
+
+class Extension(object):
+    """
+    Stand-in for ``krita.Extension``.
+    """
+
+    def __init__(self, parent):
+        self._parent = parent
@@ -0,0 +1,165 @@
+"""
+Stand-in for Toolkit's ``sgtk`` package.
+
+Path resolution is simulated: ``sgtk_from_path`` and ``context_from_path``
+sleep for :data:`SIMULATED_LATENCY` seconds to stand for the reads of the
+pipeline configuration and the Shotgun queries of the real calls.
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+from . import platform
+from . import util
+
+# Seconds spent in every simulated round trip.
+SIMULATED_LATENCY = 0.002
+
+# Counts of the simulated round trips, reset by the benchmarks.
+call_counts = {"sgtk_from_path": 0, "context_from_path": 0, "shotgun": 0, "get_application": 0}
+
+
+class TankError(Exception):
+    pass
+
+
+class LogManager(object):
+    """
+    Stand-in for ``sgtk.LogManager``.
+    """
+
+    log_folder = os.path.join(tempfile.gettempdir(), "tk-krita-benchmarks", "logs")
+    base_file_handler = None
+
+    @staticmethod
+    def get_logger(name):
+        return logging.getLogger("sgtk.%s" % name)
+
+    def initialize_base_file_handler(self, name):
+        return None
+
+
+class Context(object):
+    """
+    Stand-in for ``sgtk.Context``.
+    """
+
+    def __init__(self, tk, project=None, entity=None, step=None, task=None):
+        self.sgtk = tk
+        self.project = project
+        self.entity = entity
+        self.step = step
+        self.task = task
+        self.shotgun_url = "https://example.shotgunstudio.com"
+        self.filesystem_locations = []
+
+    def __eq__(self, other):
+        if not isinstance(other, Context):
+            return False
+        return (self.project, self.entity, self.step, self.task) == \
+            (other.project, other.entity, other.step, other.task)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        if self.entity:
+            return "%s %s" % (self.entity["type"], self.entity["name"])
+        if self.project:
+            return "Project %s" % self.project["name"]
+        return "Site"
+
+
+class Shotgun(object):
+    """
+    Stand-in for a Shotgun connection, serving the entities of
+    :attr:`entities` and the events of :attr:`events`.
+    """
+
+    # (type, id) -> entity dictionary
+    entities = {}
+    # event log entries, by increasing id
+    events = []
+
+    def find_one(self, entity_type, filters, fields=None, order=None):
+        results = self.find(entity_type, filters, fields, order, limit=1)
+        return results[0] if results else None
+
+    def find(self, entity_type, filters, fields=None, order=None, limit=0):
+        call_counts["shotgun"] += 1
+        time.sleep(SIMULATED_LATENCY)
+
+        if entity_type == "EventLogEntry":
+            candidates = list(self.events)
+        else:
+            candidates = [e for ((t, _), e) in sorted(self.entities.items()) if t == entity_type]
+
+        for (field, operator, value) in filters:
+            if operator == "is":
+                candidates = [e for e in candidates if e.get(field) == value]
+            elif operator == "in":
+                candidates = [e for e in candidates if e.get(field) in value]
+            elif operator == "greater_than":
+                candidates = [e for e in candidates if e.get(field) > value]
+
+        if order and order[0]["direction"] == "desc":
+            candidates.reverse()
+        if limit:
+            candidates = candidates[:limit]
+
+        return [
+            dict([("type", entity_type), ("id", e["id"])] + [(f, e.get(f)) for f in fields or []])
+            for e in candidates
+        ]
+
+
+class PipelineConfiguration(object):
+    """
+    Stand-in for ``sgtk.pipelineconfig.PipelineConfiguration``.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def get_path(self):
+        return self._path
+
+    def get_config_location(self):
+        return os.path.join(self._path, "config")
+
+
+class Sgtk(object):
+    """
+    Stand-in for ``sgtk.Sgtk``. Documents resolve to an entity named after
+    the folder they are in.
+    """
+
+    def __init__(self, project_root):
+        self.project_root = project_root
+        self.pipeline_configuration = PipelineConfiguration(project_root)
+        self.project = {"type": "Project", "id": 1, "name": os.path.basename(project_root)}
+
+    def context_from_path(self, path, previous_context=None):
+        call_counts["context_from_path"] += 1
+        time.sleep(SIMULATED_LATENCY)
+
+        folder = os.path.basename(os.path.dirname(path))
+        entity = {"type": "Shot", "id": abs(hash(folder)) % 100000, "name": folder}
+        return Context(self, self.project, entity)
+
+
+def sgtk_from_path(path):
+    """
+    Stand-in for ``sgtk.sgtk_from_path``. Every path below a folder named
+    ``projects`` belongs to the project named after the next folder.
+    """
+    call_counts["sgtk_from_path"] += 1
+    time.sleep(SIMULATED_LATENCY)
+
+    parts = path.split(os.sep)
+    if "projects" not in parts:
+        raise TankError("%s is not in a project." % path)
+    index = parts.index("projects")
+    return Sgtk(os.sep.join(parts[:index + 2]))
@@ -0,0 +1,238 @@
+"""
+Stand-in for ``sgtk.platform``.
+
+:class:`Engine` runs the engine hooks in the same order as Toolkit does
+when an engine starts, loading apps through :mod:`application` like
+Toolkit does.
+"""
+
+import glob
+import importlib
+import logging
+import os
+import re
+
+from . import application
+
+_current_engine = None
+
+
+def current_engine():
+    return _current_engine
+
+
+class _EngineLogHandler(logging.Handler):
+    """
+    Forwards records to the engine, like Toolkit's engine log handler.
+    """
+
+    def __init__(self, engine):
+        logging.Handler.__init__(self)
+        self._engine = engine
+
+    def emit(self, record):
+        record.basename = record.name.rsplit(".", 1)[-1]
+        self._engine._emit_log_message(self, record)
+
+
+class Engine(object):
+    """
+    Stand-in for ``sgtk.platform.Engine``.
+    """
+
+    def __init__(self, tk, context, engine_instance_name, settings=None, apps=None, environment=None):
+        """
+        :param tk: Tk instance.
+        :param context: Context to start in.
+        :param str engine_instance_name: Name of the engine instance.
+        :param dict settings: Engine settings.
+        :param list apps: Objects standing for apps, see
+            :func:`application.get_application`.
+        :param environment: Callable returning the objects standing for the
+            apps of the environment of a context, used when the context
+            changes. The apps are kept as they are when omitted.
+        """
+        global _current_engine
+
+        self.sgtk = tk
+        self._context = context
+        self.instance_name = engine_instance_name
+        self.name = "tk-krita"
+        self.version = "v0.0.0"
+        self.created_qt_dialogs = []
+        self._settings = settings or {}
+        self._commands = {}
+        self._apps = {}
+        self._environment = environment
+
+        self.logger = logging.getLogger("sgtk.env.%s" % engine_instance_name)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG if self._settings.get("debug_logging") else logging.INFO)
+        self._log_handler = _EngineLogHandler(self)
+        self.logger.addHandler(self._log_handler)
+
+        _current_engine = self
+
+        self.init_engine()
+        self.pre_app_init()
+        for app in apps or []:
+            app = application.get_application(self, app)
+            app.init_app()
+            self._apps[app.instance_name] = app
+        self.post_app_init()
+
+    @property
+    def context(self):
+        return self._context
+
+    @property
+    def commands(self):
+        return self._commands
+
+    @property
+    def apps(self):
+        return self._apps
+
+    @property
+    def shotgun(self):
+        from .. import Shotgun
+        return Shotgun()
+
+    @property
+    def cache_location(self):
+        from ..util import LocalFileStorageManager
+        return os.path.join(LocalFileStorageManager.get_global_root(LocalFileStorageManager.CACHE), "project")
+
+    def import_module(self, module_name):
+        return importlib.import_module(module_name)
+
+    def async_execute_in_main_thread(self, func, *args, **kwargs):
+        from . import qt
+        qt._pending.append(lambda: func(*args, **kwargs))
+
+    def get_setting(self, key, default=None):
+        return self._settings.get(key, default)
+
+    def execute_hook_method(self, key, method_name, **kwargs):
+        return None
+
+    def register_command(self, name, callback, properties=None):
+        self._commands[name] = {"callback": callback, "properties": properties or {}}
+
+    def change_context(self, new_context):
+        old_context = self._context
+        self.pre_context_change(old_context, new_context)
+        self._context = new_context
+        if self._environment:
+            self._reload_apps(self._environment(new_context))
+        self.post_context_change(old_context, new_context)
+
+    def _reload_apps(self, apps):
+        """
+        Loads the apps of a new environment like Toolkit does, keeping the
+        loaded apps whose settings didn't change.
+        """
+        loaded = self._apps
+        self._apps = {}
+        for app in apps:
+            current = loaded.pop(app.instance_name, None)
+            if current is not None and current.settings == app.settings:
+                self._apps[app.instance_name] = current
+                continue
+            if current is not None:
+                self._unload_app(current)
+            app = application.get_application(self, app)
+            app.init_app()
+            self._apps[app.instance_name] = app
+
+        for app in loaded.values():
+            self._unload_app(app)
+
+    def _unload_app(self, app):
+        app.destroy_app()
+        for (name, command) in list(self._commands.items()):
+            if command["properties"].get("app") is app:
+                del self._commands[name]
+
+    def pre_context_change(self, old_context, new_context):
+        pass
+
+    def post_context_change(self, old_context, new_context):
+        pass
+
+    def destroy(self):
+        global _current_engine
+
+        for app in self._apps.values():
+            app.destroy_app()
+        self.destroy_engine()
+        self.logger.removeHandler(self._log_handler)
+        _current_engine = None
+
+
+class SoftwareVersion(object):
+    """
+    Stand-in for ``sgtk.platform.SoftwareVersion``.
+    """
+
+    def __init__(self, version, product, path, icon=None, args=None):
+        self.version = version
+        self.product = product
+        self.path = path
+        self.icon = icon
+        self.args = args or []
+
+    def __repr__(self):
+        return "<SoftwareVersion %s %s>" % (self.product, self.version)
+
+
+class LaunchInformation(object):
+    """
+    Stand-in for ``sgtk.platform.LaunchInformation``.
+    """
+
+    def __init__(self, path=None, args=None, environ=None):
+        self.path = path
+        self.args = args
+        self.environment = environ or {}
+
+
+class SoftwareLauncher(object):
+    """
+    Stand-in for ``sgtk.platform.SoftwareLauncher``.
+    """
+
+    def __init__(self, tk, context, engine_name, disk_location, settings=None):
+        self.sgtk = tk
+        self.context = context
+        self.engine_name = engine_name
+        self.disk_location = disk_location
+        self.logger = logging.getLogger("sgtk.launcher.%s" % engine_name)
+        self._settings = settings or {}
+
+    def get_setting(self, key, default=None):
+        return self._settings.get(key, default)
+
+    def _is_supported(self, sw_version):
+        version = [int(part) for part in sw_version.version.split(".") if part.isdigit()]
+        minimum = [int(part) for part in self.minimum_supported_version.split(".")]
+        if version < minimum:
+            return (False, "older than %s" % self.minimum_supported_version)
+        return (True, "")
+
+    def _glob_and_match(self, match_template, template_key_expressions):
+        glob_pattern = re.sub(r"\{\w+\}", "*", match_template)
+
+        regex_pattern = re.escape(match_template)
+        for (key, expression) in template_key_expressions.items():
+            regex_pattern = regex_pattern.replace(
+                re.escape("{%s}" % key), "(?P<%s>%s)" % (key, expression)
+            )
+        regex = re.compile(regex_pattern + "$", re.IGNORECASE)
+
+        matches = []
+        for path in glob.glob(glob_pattern):
+            match = regex.match(path)
+            if match:
+                matches.append((path, match.groupdict()))
+        return matches
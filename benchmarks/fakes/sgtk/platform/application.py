@@ -0,0 +1,15 @@
+"""
+Stand-in for ``sgtk.platform.application``.
+"""
+
+
+def get_application(engine, app):
+    """
+    Stand-in for ``get_application``, handing the app its engine. Apps are
+    objects with an ``instance_name``, ``version``, ``settings`` and an
+    ``init_app`` registering their commands.
+    """
+    from .. import call_counts
+    call_counts["get_application"] += 1
+    app.engine = engine
+    return app
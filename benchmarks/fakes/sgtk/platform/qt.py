@@ -0,0 +1,296 @@
+"""
+Stand-in for ``sgtk.platform.qt``.
+
+Widgets only keep the state the engine reads back. Timers don't wait, the
+callbacks they schedule run when :func:`process_events` is called.
+"""
+
+_pending = []
+
+
+def process_events():
+    """
+    Runs the scheduled timer callbacks, including the ones they schedule.
+
+    :returns: Number of callbacks run.
+    """
+    count = 0
+    while _pending:
+        callback = _pending.pop(0)
+        callback()
+        count += 1
+    return count
+
+
+class Signal(object):
+    """
+    Minimal signal implementation.
+    """
+
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots = []
+        elif slot in self._slots:
+            self._slots.remove(slot)
+        else:
+            raise TypeError("slot is not connected")
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class _QObject(object):
+
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._object_name = ""
+        self._deleted = False
+
+    def setObjectName(self, name):
+        self._object_name = name
+
+    def objectName(self):
+        return self._object_name
+
+    def deleteLater(self):
+        self._deleted = True
+
+
+class QtCore(object):
+    """
+    Stand-in for ``QtCore``.
+    """
+
+    QObject = _QObject
+
+    class Qt(object):
+        IgnoreAspectRatio = 0
+        SmoothTransformation = 1
+
+    class QTimer(_QObject):
+
+        def __init__(self, parent=None):
+            _QObject.__init__(self, parent)
+            self.timeout = Signal()
+            self._single_shot = False
+            self._generation = 0
+            self._active = False
+
+        @staticmethod
+        def singleShot(msec, callback):
+            _pending.append(callback)
+
+        def setSingleShot(self, single_shot):
+            self._single_shot = single_shot
+
+        def isActive(self):
+            return self._active
+
+        def start(self, msec=0):
+            self._generation += 1
+            self._active = True
+            generation = self._generation
+
+            def fire():
+                if self._active and generation == self._generation:
+                    self._active = not self._single_shot
+                    self.timeout.emit()
+
+            _pending.append(fire)
+
+        def stop(self):
+            self._active = False
+
+    class QEvent(object):
+        Close = 19
+
+        def __init__(self, event_type):
+            self._type = event_type
+            self._accepted = True
+
+        def type(self):
+            return self._type
+
+        def ignore(self):
+            self._accepted = False
+
+        def isAccepted(self):
+            return self._accepted
+
+    class QTextCodec(object):
+
+        @staticmethod
+        def codecForName(name):
+            return name
+
+        @staticmethod
+        def setCodecForCStrings(codec):
+            pass
+
+    class QUrl(object):
+
+        def __init__(self, url=""):
+            self.url = url
+
+        @classmethod
+        def fromLocalFile(cls, path):
+            return cls("file://%s" % path)
+
+
+class QtGui(object):
+    """
+    Stand-in for ``QtGui``, including the widget classes like PySide.
+    """
+
+    class QAction(_QObject):
+
+        def __init__(self, text=None, parent=None):
+            if not isinstance(text, str):
+                (text, parent) = ("", text)
+            _QObject.__init__(self, parent)
+            self._text = text
+            self._menu = None
+            self._visible = True
+            self._enabled = True
+            self._separator = False
+            self.triggered = Signal()
+
+        def text(self):
+            return self._text
+
+        def setText(self, text):
+            self._text = text
+
+        def menu(self):
+            return self._menu
+
+        def setVisible(self, visible):
+            self._visible = visible
+
+        def isVisible(self):
+            return self._visible
+
+        def setEnabled(self, enabled):
+            self._enabled = enabled
+
+        def setSeparator(self, separator):
+            self._separator = separator
+
+        def trigger(self):
+            self.triggered.emit(False)
+
+    class QMenu(_QObject):
+
+        def __init__(self, title=None, parent=None):
+            if not isinstance(title, str):
+                (title, parent) = ("", title)
+            _QObject.__init__(self, parent)
+            self._title = title
+            self._actions = []
+            self._menu_action = QtGui.QAction(title, self)
+            self._menu_action._menu = self
+            self.aboutToShow = Signal()
+
+        def title(self):
+            return self._title
+
+        def setTitle(self, title):
+            self._title = title
+            self._menu_action.setText(title)
+
+        def menuAction(self):
+            return self._menu_action
+
+        def actions(self):
+            return list(self._actions)
+
+        def addAction(self, action):
+            self._actions.append(action)
+
+        def insertAction(self, before, action):
+            if action in self._actions:
+                self._actions.remove(action)
+            if before is None or before not in self._actions:
+                self._actions.append(action)
+            else:
+                self._actions.insert(self._actions.index(before), action)
+
+        def removeAction(self, action):
+            if action in self._actions:
+                self._actions.remove(action)
+
+        def clear(self):
+            self._actions = []
+
+        def show(self):
+            """
+            Simulates the menu being opened.
+            """
+            self.aboutToShow.emit()
+
+    class QMenuBar(_QObject):
+
+        def __init__(self, parent=None):
+            _QObject.__init__(self, parent)
+            self._actions = []
+
+        def actions(self):
+            return list(self._actions)
+
+        def addMenu(self, menu):
+            action = menu.menuAction()
+            self._actions.append(action)
+            return action
+
+        def removeAction(self, action):
+            if action in self._actions:
+                self._actions.remove(action)
+
+    class QMainWindow(_QObject):
+
+        def __init__(self, parent=None):
+            _QObject.__init__(self, parent)
+            self._menu_bar = QtGui.QMenuBar(self)
+
+        def menuBar(self):
+            return self._menu_bar
+
+    class QImage(object):
+
+        Format_ARGB32 = 5
+
+        def __init__(self, data, width, height, bytes_per_line, image_format):
+            self._data = data
+            self._width = width
+            self._height = height
+
+        def width(self):
+            return self._width
+
+        def height(self):
+            return self._height
+
+        def copy(self):
+            return QtGui.QImage(bytes(self._data), self._width, self._height, self._width * 4, self.Format_ARGB32)
+
+        def scaled(self, width, height, aspect_ratio_mode=None, transformation_mode=None):
+            return QtGui.QImage(bytes(width * height * 4), width, height, width * 4, self.Format_ARGB32)
+
+    class QMessageBox(object):
+
+        @staticmethod
+        def information(parent, title, text):
+            pass
+
+    class QDesktopServices(object):
+
+        @staticmethod
+        def openUrl(url):
+            return True
@@ -0,0 +1,29 @@
+"""
+Stand-in for ``sgtk.util``.
+"""
+
+import os
+import tempfile
+
+
+class LocalFileStorageManager(object):
+    """
+    Stand-in for ``sgtk.util.LocalFileStorageManager``, rooted in the
+    folder set as :attr:`root`.
+    """
+
+    CACHE = "cache"
+    LOGGING = "logs"
+
+    root = os.path.join(tempfile.gettempdir(), "tk-krita-benchmarks")
+
+    @classmethod
+    def get_global_root(cls, path_type):
+        return os.path.join(cls.root, path_type)
+
+
+def append_path_to_env_var(env_var_name, path):
+    paths = [p for p in os.environ.get(env_var_name, "").split(os.pathsep) if p]
+    if path not in paths:
+        paths.append(path)
+    os.environ[env_var_name] = os.pathsep.join(paths)
@@ -0,0 +1,816 @@
+"""
+Benchmarks of the Krita engine and launcher.
+
+The engine runs headless against the stand-in ``krita`` and ``sgtk``
+modules found in ``benchmarks/fakes``, so the numbers measure the engine's
+own overhead. Simulated Toolkit round trips sleep for
+``sgtk.SIMULATED_LATENCY`` seconds.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<revision>.json
+
+Results are written to ``benchmarks/results/<git revision>.json`` unless
+``--output`` is given.
+"""
+
+import argparse
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_ROOT = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_ROOT)
+
+sys.path.insert(0, os.path.join(BENCHMARKS_ROOT, "fakes"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "python"))
+
+import sgtk
+from sgtk.platform import qt
+from krita import Document, Krita, Node
+
+
+def _load_module(name, file_name):
+    """
+    Loads one of the engine's top level files as a module.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+engine_module = _load_module("tk_krita_engine", "engine.py")
+startup_module = _load_module("tk_krita_startup", "startup.py")
+
+
+##########################################################################################
+# helpers
+
+def _measure(func, repeat, setup=None):
+    """
+    Times a function.
+
+    :param func: Callable to time.
+    :param int repeat: Number of timed runs.
+    :param setup: Optional callable run, untimed, before every run.
+    :returns: Dictionary of statistics, in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+
+    return _statistics(durations)
+
+
+def _statistics(durations):
+    """
+    Returns the statistics of durations, in seconds, like :func:`_measure`.
+    """
+    durations = sorted(durations)
+    repeat = len(durations)
+    return {
+        "runs": repeat,
+        "min": durations[0],
+        "median": durations[len(durations) // 2],
+        "mean": sum(durations) / len(durations),
+    }
+
+
+class _App(object):
+    """
+    Stand-in for an app instance registering commands, its initialization
+    taking ``init_duration`` seconds like importing its modules would.
+    """
+
+    def __init__(self, instance_name, command_count, init_duration=0.0):
+        self.instance_name = instance_name
+        self.display_name = instance_name.replace("-", " ").title()
+        self.version = "v1.0.0"
+        self.settings = {"command_count": command_count}
+        self.engine = None
+        self._command_count = command_count
+        self._init_duration = init_duration
+
+    def init_app(self):
+        time.sleep(self._init_duration)
+        for index in range(self._command_count):
+            self.engine.register_command(
+                "%s command %d" % (self.display_name, index),
+                lambda: None,
+                {"app": self}
+            )
+
+    def destroy_app(self):
+        pass
+
+
+def _start_engine(settings=None, apps=None, environment=None):
+    """
+    Starts the engine in a fresh stand-in Krita.
+    """
+    Krita.reset()
+    engine_settings = {
+        "automatic_context_switch": False,
+        "startup_trace": False,
+        "run_at_startup": [],
+        "run_at_startup_budget": 0,
+        "menu_favourites": [],
+        "entity_cache": False,
+    }
+    engine_settings.update(settings or {})
+
+    tk = sgtk.Sgtk(os.path.join(os.sep, "projects", "demo"))
+    context = sgtk.Context(tk, tk.project)
+    engine = engine_module.KritaEngine(tk, context, "tk-krita", engine_settings, apps, environment)
+    qt.process_events()
+    return engine
+
+
+def _stop_engine(engine):
+    engine.destroy()
+    qt.process_events()
+
+
+##########################################################################################
+# benchmarks
+
+def bench_scan_software(count=2000, repeat=5):
+    """
+    Scans a folder of fake AppImages, with and without the software index.
+    """
+    install_root = tempfile.mkdtemp()
+    cache_root = tempfile.mkdtemp()
+    try:
+        for index in range(count):
+            file_name = "krita-4.%d.%d-x86_64.appimage" % (index // 100, index % 100)
+            open(os.path.join(install_root, file_name), "w").close()
+
+        sgtk.util.LocalFileStorageManager.root = cache_root
+
+        class Launcher(startup_module.KritaLauncher):
+            EXECUTABLE_TEMPLATES = {
+                sys.platform: [os.path.join(install_root, "krita-{version}-{mach}.appimage")]
+            }
+
+        launcher = Launcher(None, None, "tk-krita", REPO_ROOT)
+        found = len(launcher.rescan_software())
+        if found != count:
+            raise RuntimeError("Found %d Krita versions instead of %d." % (found, count))
+
+        return {
+            "scan_software_cold": _measure(launcher.rescan_software, repeat),
+            "scan_software_warm": _measure(launcher.scan_software, repeat),
+        }
+    finally:
+        shutil.rmtree(install_root)
+        shutil.rmtree(cache_root)
+
+
+def bench_refresh_engine(document_count=20, switches=200, repeat=5):
+    """
+    Switches the active document and refreshes the engine, with an empty
+    and with a warm context cache.
+    """
+    engine = _start_engine()
+    krita = Krita.instance()
+
+    documents = []
+    for index in range(document_count):
+        path = os.path.join(
+            os.sep, "projects", "demo", "shots", "sh%03d" % (index % 5 * 10), "paint_v%03d.kra" % index
+        )
+        documents.append(Document(path))
+
+    def switch():
+        for index in range(switches):
+            krita.setActiveDocument(documents[index % document_count])
+            task = engine_module.refresh_engine(engine.instance_name, engine.context, "Shotgun")
+            if task:
+                task.wait()
+            qt.process_events()
+
+    try:
+        return {
+            "refresh_engine_cold": _measure(switch, repeat, setup=engine.context_cache.clear),
+            "refresh_engine_warm": _measure(switch, repeat),
+        }
+    finally:
+        _stop_engine(engine)
+
+
+def bench_menu(app_count=30, commands_per_app=10, repeat=5):
+    """
+    Builds, updates, toggles and tears down the Shotgun menu.
+    """
+    apps = [_App("tk-multi-app%02d" % index, commands_per_app) for index in range(app_count)]
+    engine = _start_engine(apps=apps)
+    generator = engine.menu_generator
+
+    def build():
+        generator.destroy()
+        engine.create_shotgun_menu()
+        generator._menu.show()
+
+    def toggle():
+        engine_module.create_sgtk_disabled_menu("Shotgun")
+        engine_module.remove_sgtk_disabled_menu()
+
+    try:
+        results = {
+            "menu_build": _measure(build, repeat),
+            "menu_update_unchanged": _measure(generator._menu.show, repeat),
+            "menu_toggle_disabled": _measure(toggle, repeat),
+        }
+        results["menu_teardown"] = _measure(generator.destroy, repeat, setup=build)
+        return results
+    finally:
+        _stop_engine(engine)
+
+
+def bench_context_change(app_count=30, changed_count=2, commands_per_app=10, switches=100, repeat=5):
+    """
+    Changes the context back and forth with the menu built. The settings of
+    ``changed_count`` apps depend on the shot, Toolkit loads those again on
+    every switch and reuses the others.
+    """
+    def environment(context):
+        apps = [_App("tk-multi-app%02d" % index, commands_per_app) for index in range(app_count)]
+        for app in apps[:changed_count]:
+            app.settings["shot"] = context.entity["id"] if context.entity else None
+        return apps
+
+    tk = sgtk.Sgtk(os.path.join(os.sep, "projects", "demo"))
+    contexts = [
+        sgtk.Context(tk, tk.project, {"type": "Shot", "id": index, "name": "sh%03d" % index})
+        for index in range(2)
+    ]
+    engine = _start_engine(apps=environment(contexts[1]), environment=environment)
+    engine.menu_generator._menu.show()
+
+    def switch():
+        for index in range(switches):
+            engine.change_context(contexts[index % 2])
+
+    try:
+        sgtk.call_counts["get_application"] = 0
+        stats = _measure(switch, repeat)
+        loaded = sgtk.call_counts["get_application"] / float(switches * repeat)
+        if loaded != changed_count:
+            raise RuntimeError("Loaded %s apps per context change instead of %d." % (loaded, changed_count))
+        stats["apps_loaded_per_switch"] = loaded
+        return {"context_change": stats}
+    finally:
+        _stop_engine(engine)
+
+
+def bench_thumbnails(width=2048, height=2048, sizes=(512, 256, 128), repeat=5):
+    """
+    Captures thumbnails of the active document, the first time and once
+    they are cached.
+    """
+    engine = _start_engine()
+    document = Document(os.path.join(os.sep, "projects", "demo", "paint.kra"), width, height)
+    Krita.instance().setActiveDocument(document)
+    results = []
+
+    def capture():
+        task = engine.capture_thumbnail(sizes, results.append)
+        if task:
+            task.wait()
+        qt.process_events()
+
+    try:
+        return {
+            "thumbnail_capture": _measure(capture, repeat, setup=engine._thumbnail_cache.clear),
+            "thumbnail_cached": _measure(capture, repeat),
+        }
+    finally:
+        _stop_engine(engine)
+
+
+def bench_entity_cache(shot_count=200, lookups=50, repeat=5):
+    """
+    Reads the fields of the context entities the way apps opening do,
+    straight from the stand-in Shotgun and through the entity cache once
+    prefetched.
+    """
+    fields = {
+        "Project": ["name", "sg_status"],
+        "Shot": ["code", "description", "sg_status_list"],
+        "Task": ["content", "sg_status_list"],
+    }
+    project = {"type": "Project", "id": 1, "name": "demo"}
+    sgtk.Shotgun.entities = {("Project", 1): dict(project, sg_status="Active")}
+    for index in range(shot_count):
+        sgtk.Shotgun.entities[("Shot", index)] = {
+            "type": "Shot", "id": index, "code": "sh%03d" % index, "sg_status_list": "ip",
+        }
+        sgtk.Shotgun.entities[("Task", index)] = {
+            "type": "Task", "id": index, "content": "paint", "sg_status_list": "ip",
+        }
+    sgtk.Shotgun.events = []
+
+    engine = _start_engine(settings={"entity_cache": True, "entity_cache_fields": fields})
+    cache = engine.entity_cache
+    context = sgtk.Context(
+        engine.sgtk, project, {"type": "Shot", "id": 7, "name": "sh007"}, task={"type": "Task", "id": 7}
+    )
+    shotgun = engine.shotgun
+
+    def read_shotgun():
+        for _ in range(lookups):
+            for entity in (context.project, context.entity, context.task):
+                shotgun.find_one(entity["type"], [["id", "is", entity["id"]]], fields[entity["type"]])
+
+    def read_cache():
+        for _ in range(lookups):
+            for entity in (context.project, context.entity, context.task):
+                cache.find_one(entity["type"], entity["id"], fields[entity["type"]])
+
+    def prefetch():
+        engine.prefetch_context_entities(context).wait()
+        qt.process_events()
+
+    try:
+        results = {
+            "entity_read_shotgun": _measure(read_shotgun, repeat),
+            "entity_prefetch": _measure(prefetch, repeat, setup=cache.invalidate),
+        }
+        prefetch()
+        results["entity_read_cached"] = _measure(read_cache, repeat)
+        return results
+    finally:
+        _stop_engine(engine)
+        sgtk.Shotgun.entities = {}
+
+
+def bench_save_hooks(document_count=4, saves_per_document=25, hook_duration=0.05, repeat=5):
+    """
+    Saves documents in bursts with a slow save hook, measuring the time the
+    saves take on the main thread and until every result was delivered.
+    """
+    engine = _start_engine()
+    notifier = Krita.instance().notifier()
+    paths = [
+        os.path.join(os.sep, "projects", "demo", "paint%02d.kra" % index) for index in range(document_count)
+    ]
+    results = []
+    engine.register_save_hook("benchmark", lambda path, saves, autosave: time.sleep(hook_duration))
+    engine.save_queue.connect(results.append)
+
+    def save():
+        for index in range(saves_per_document):
+            for path in paths:
+                notifier.imageSaved.emit(path)
+        # Krita's autosaves belong to the same documents
+        for path in paths:
+            folder, file_name = os.path.split(path)
+            notifier.imageSaved.emit(os.path.join(folder, ".%s-autosave.kra" % file_name))
+
+    def save_and_wait():
+        del results[:]
+        save()
+        qt.process_events()
+        while len(results) < document_count:
+            time.sleep(0.001)
+            qt.process_events()
+
+    try:
+        return {
+            "save_notify": _measure(save, repeat, setup=engine.save_queue.stop),
+            "save_hooks_complete": _measure(save_and_wait, repeat),
+        }
+    finally:
+        _stop_engine(engine)
+
+
+def bench_layer_export(layer_count=200, size=256, repeat=5):
+    """
+    Exports the layers of a document, the first time and after one layer
+    out of all of them changed.
+    """
+    engine = _start_engine()
+    layers = [Node("Layer %d" % index, size, size, fill=index) for index in range(layer_count)]
+    document = Document(os.path.join(os.sep, "projects", "demo", "paint.kra"), size, size, layers)
+    folder = os.path.join(sgtk.util.LocalFileStorageManager.root, "layer_export")
+    cache_root = os.path.join(engine.cache_location, "layers")
+
+    def clear():
+        shutil.rmtree(folder, ignore_errors=True)
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+    def change_one_layer():
+        layers[0].fill += 1
+
+    def export():
+        engine.export_layers(folder, document=document)
+
+    try:
+        return {
+            "layer_export_cold": _measure(export, repeat, setup=clear),
+            "layer_export_one_changed": _measure(export, repeat, setup=change_one_layer),
+        }
+    finally:
+        clear()
+        _stop_engine(engine)
+
+
+# Imports the modules of the benchmark, with the module location cache
+# when a cache file is given, and saves the cache.
+_IMPORT_SCRIPT = """
+import importlib, importlib.util, sys
+(paths, module_count, cache_file, import_cache) = (sys.argv[1].split("|"), int(sys.argv[2]), sys.argv[3], sys.argv[4])
+sys.path.extend(paths)
+cache = None
+if cache_file:
+    spec = importlib.util.spec_from_file_location("import_cache", import_cache)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    cache = module.ModuleLocationCache(cache_file, paths)
+    cache.install()
+for index in range(module_count):
+    __import__("bench_module_%d" % index)
+if cache:
+    cache.save()
+"""
+
+
+def bench_import_path(path_count=40, module_count=200, repeat=5):
+    """
+    Imports modules from the last of many sys.path entries in a new
+    interpreter, with and without the module location cache. Timings are
+    the cumulative import times reported by -X importtime.
+    """
+    root = tempfile.mkdtemp()
+    paths = [os.path.join(root, "path%02d" % index) for index in range(path_count)]
+    for path in paths:
+        os.makedirs(path)
+    for index in range(module_count):
+        with open(os.path.join(paths[-1], "bench_module_%d.py" % index), "w") as fh:
+            fh.write("VALUE = %d\n" % index)
+
+    import_cache = os.path.join(REPO_ROOT, "startup", "shotgun_krita", "import_cache.py")
+    cache_file = os.path.join(root, "module_locations.json")
+
+    def run(with_cache):
+        environment = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+        process = subprocess.run(
+            [
+                sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT,
+                "|".join(paths), str(module_count), cache_file if with_cache else "", import_cache,
+            ],
+            stderr=subprocess.PIPE, env=environment, universal_newlines=True, check=True,
+        )
+        total = 0
+        for line in process.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip().startswith("bench_module_"):
+                total += int(fields[1])
+        return total / 1e6
+
+    try:
+        # the first run with the cache writes it
+        run(True)
+        return {
+            "import_path_scan": _statistics([run(False) for _ in range(repeat)]),
+            "import_path_cached": _statistics([run(True) for _ in range(repeat)]),
+        }
+    finally:
+        shutil.rmtree(root)
+
+
+def _write_kra(path, layer_count, size, sources=None):
+    """
+    Writes a minimal .kra archive with a preview and a merged image.
+    """
+    import struct
+    import zlib
+    import zipfile
+
+    def png(width, height):
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        rows = b"".join(b"\0" + os.urandom(width * 3) for _ in range(height))
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b"")
+        )
+
+    layers = "".join(
+        '<layer name="Layer %d" filename="layer%d" nodetype="paintlayer"/>' % (index, index)
+        for index in range(layer_count)
+    )
+    layers += "".join(
+        '<layer name="File %d" nodetype="filelayer" source="%s"/>' % (index, source)
+        for (index, source) in enumerate(sources or [])
+    )
+    maindoc = (
+        '<?xml version="1.0" encoding="UTF-8"?><DOC><IMAGE width="%d" height="%d" '
+        'colorspacename="RGBA" x-res="300" y-res="300"><layers>%s</layers></IMAGE></DOC>'
+        % (size, size, layers)
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("mimetype", "application/x-krita")
+        archive.writestr("maindoc.xml", maindoc)
+        archive.writestr("preview.png", png(64, 64))
+        archive.writestr("mergedimage.png", png(size, size))
+
+
+def bench_kra_batch(file_count=200, layer_count=50, size=256, repeat=3):
+    """
+    Reads the metadata of .kra files in headless mode, in a process pool
+    and in a thread pool.
+    """
+    folder = tempfile.mkdtemp()
+    paths = [os.path.join(folder, "paint_%04d.kra" % index) for index in range(file_count)]
+    for path in paths:
+        _write_kra(path, layer_count, size)
+
+    os.environ[engine_module.KritaEngine.HEADLESS_ENV_VAR] = "1"
+    try:
+        engine = _start_engine()
+    finally:
+        del os.environ[engine_module.KritaEngine.HEADLESS_ENV_VAR]
+    kra_batch = engine.import_module("tk_krita").kra_batch
+
+    try:
+        report = kra_batch.process_files(paths)
+        if report.failed:
+            raise RuntimeError("Failed to read %d .kra files: %s" % (
+                report.failed, [result.error for result in report.results if result.error][:3]))
+
+        return {
+            "kra_batch_processes": _measure(lambda: engine.process_kra_files(paths), repeat),
+            "kra_batch_threads": _measure(lambda: kra_batch.process_files(paths, use_threads=True), repeat),
+        }
+    finally:
+        _stop_engine(engine)
+        shutil.rmtree(folder)
+
+
+def bench_dependency_index(file_count=500, repeat=5):
+    """
+    Indexes the references of .kra files, from scratch and again with one
+    document changed.
+    """
+    folder = tempfile.mkdtemp()
+    paths = [os.path.join(folder, "paint_%04d.kra" % index) for index in range(file_count)]
+    for (index, path) in enumerate(paths):
+        _write_kra(path, 10, 16, ["textures/tex_%d.png" % (index % 20), "../shared/background.png"])
+
+    engine = _start_engine()
+    index_path = os.path.join(engine.cache_location, "kra_dependencies.json")
+
+    def clear():
+        engine._dependency_index = None
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+    def change_one():
+        _write_kra(paths[0], 10, 16, ["textures/other.png"])
+
+    try:
+        engine.index_kra_files(folder)
+        users = engine.dependency_index.referenced_by(os.path.join(folder, "textures", "tex_3.png"))
+        if len(users) != file_count // 20:
+            raise RuntimeError("Found %d users of tex_3.png instead of %d." % (len(users), file_count // 20))
+
+        return {
+            "dependency_index_full": _measure(lambda: engine.index_kra_files(folder), repeat, setup=clear),
+            "dependency_index_one_changed": _measure(
+                lambda: engine.index_kra_files(folder), repeat, setup=change_one
+            ),
+        }
+    finally:
+        _stop_engine(engine)
+        shutil.rmtree(folder)
+
+
+def bench_metrics(app_count=30, commands_per_app=10, runs=20000, repeat=5):
+    """
+    Runs menu commands and menu updates with metrics disabled and enabled,
+    measuring the overhead of the instrumentation.
+    """
+    apps = [_App("tk-multi-app%02d" % index, commands_per_app) for index in range(app_count)]
+    engine = _start_engine(apps=apps)
+    generator = engine.menu_generator
+    generator._menu.show()
+    command_names = sorted(engine.commands)
+
+    def run_commands():
+        for index in range(runs):
+            generator._run_command(command_names[index % len(command_names)])
+
+    def update_menu():
+        for _ in range(runs // 100):
+            generator.update()
+
+    results = {}
+    try:
+        for enabled in (False, True):
+            engine.metrics.enabled = enabled
+            suffix = "enabled" if enabled else "disabled"
+            results["run_commands_metrics_%s" % suffix] = _measure(run_commands, repeat)
+            results["menu_update_metrics_%s" % suffix] = _measure(update_menu, repeat)
+        engine.metrics.snapshot()
+        results["metrics_snapshot"] = _measure(engine.metrics.snapshot, repeat)
+        return results
+    finally:
+        engine.metrics.enabled = False
+        _stop_engine(engine)
+
+
+def bench_lazy_apps(app_count=20, commands_per_app=5, init_duration=0.02, repeat=5):
+    """
+    Starts the engine with apps taking a while to initialize, with and
+    without lazy apps, and runs the first command of a deferred app.
+    """
+    manifest_path = os.path.join(
+        sgtk.util.LocalFileStorageManager.get_global_root(sgtk.util.LocalFileStorageManager.CACHE),
+        "project",
+        "app_commands.json",
+    )
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    def make_apps():
+        return [
+            _App("tk-multi-app%02d" % index, commands_per_app, init_duration) for index in range(app_count)
+        ]
+
+    def start_stop(lazy):
+        _stop_engine(_start_engine(settings={"lazy_apps": lazy}, apps=make_apps()))
+
+    results = {"engine_start_eager": _measure(lambda: start_stop(False), repeat)}
+    # the first session records the commands of the apps
+    start_stop(True)
+    results["engine_start_lazy"] = _measure(lambda: start_stop(True), repeat)
+
+    durations = []
+    for _ in range(repeat):
+        engine = _start_engine(settings={"lazy_apps": True}, apps=make_apps())
+        try:
+            generator = engine.menu_generator
+            command_name = sorted(engine.commands)[0]
+            start = time.perf_counter()
+            generator._run_command(command_name)
+            durations.append(time.perf_counter() - start)
+        finally:
+            _stop_engine(engine)
+    results["lazy_app_first_command"] = _statistics(durations)
+    return results
+
+
+def bench_startup_commands(app_count=50, commands_per_app=10, repeat=5):
+    """
+    Queues and runs the run_at_startup commands of many apps.
+    """
+    apps = [_App("tk-multi-app%02d" % index, commands_per_app) for index in range(app_count)]
+    run_at_startup = [{"app_instance": app.instance_name, "name": ""} for app in apps]
+    engine = _start_engine(settings={"run_at_startup": run_at_startup}, apps=apps)
+
+    def run():
+        engine._run_app_instance_commands()
+        qt.process_events()
+
+    try:
+        return {"run_app_instance_commands": _measure(run, repeat)}
+    finally:
+        _stop_engine(engine)
+
+
+def bench_logging(count=20000, repeat=3):
+    """
+    Logs messages through the engine, measuring the time spent by the
+    logging thread and the time until everything was written.
+    """
+    engine = _start_engine(settings={"debug_logging": True})
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    def emit():
+        for index in range(count):
+            engine.logger.debug("benchmark message %d", index)
+
+    def emit_and_flush():
+        emit()
+        engine.log_sink.stop()
+        engine.log_sink.start()
+
+    try:
+        return {
+            "log_emit": _measure(emit, repeat),
+            "log_emit_and_flush": _measure(emit_and_flush, repeat),
+        }
+    finally:
+        _stop_engine(engine)
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+BENCHMARKS = [
+    bench_scan_software,
+    bench_refresh_engine,
+    bench_menu,
+    bench_context_change,
+    bench_entity_cache,
+    bench_thumbnails,
+    bench_save_hooks,
+    bench_layer_export,
+    bench_import_path,
+    bench_kra_batch,
+    bench_dependency_index,
+    bench_metrics,
+    bench_lazy_apps,
+    bench_startup_commands,
+    bench_logging,
+]
+
+
+##########################################################################################
+# reporting
+
+def _git_revision():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.STDOUT
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return output.decode("utf-8").strip()
+
+
+def _compare(results, baseline):
+    """
+    Prints the median of every benchmark against a baseline.
+    """
+    print("%-32s %12s %12s %8s" % ("benchmark", "baseline ms", "current ms", "ratio"))
+    for (name, stats) in sorted(results["results"].items()):
+        current = stats["median"] * 1000
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print("%-32s %12s %12.3f %8s" % (name, "-", current, "-"))
+            continue
+        previous = previous["median"] * 1000
+        ratio = current / previous if previous else float("inf")
+        print("%-32s %12.3f %12.3f %7.2fx" % (name, previous, current, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="File to write the results to.")
+    parser.add_argument("--compare", help="Results file to compare against.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this.")
+    args = parser.parse_args()
+
+    # keep the engine's debug output out of the report
+    logging.getLogger("sgtk").setLevel(logging.CRITICAL)
+
+    revision = _git_revision()
+    results = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "created": datetime.datetime.now().isoformat(),
+        "simulated_latency": sgtk.SIMULATED_LATENCY,
+        "results": {},
+    }
+
+    for benchmark in BENCHMARKS:
+        if args.filter not in benchmark.__name__:
+            continue
+        print("Running %s..." % benchmark.__name__)
+        results["results"].update(benchmark())
+
+    output = args.output or os.path.join(BENCHMARKS_ROOT, "results", "%s.json" % revision)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, "w") as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+    print("Wrote %s" % output)
+
+    baseline = results
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    _compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
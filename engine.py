@@ -4,13 +4,35 @@ A Krita engine for Tank.
 """
 
 import logging
+import os
+import threading
+import time
 
-from krita import Krita
+try:
+    from krita import Krita
+except ImportError:
+    # running outside of Krita, in headless mode
+    Krita = None
 
 import sgtk
 from sgtk.platform import Engine
 from sgtk.platform.qt import QtGui
 
+# Formatters of the engine's log messages, created once rather than for every record:
+#     Shotgun <basename>: <message>
+# where "basename" is the leaf part of the logging record name,
+# for example "tk-multi-shotgunpanel" or "qt_importer".
+LOG_FORMATTERS = {
+    logging.DEBUG: logging.Formatter("Debug: Shotgun %(basename)s: %(message)s"),
+    logging.INFO: logging.Formatter("Shotgun %(basename)s: %(message)s"),
+}
+
+# Group of the background tasks resolving the context of the active document.
+REFRESH_TASK_GROUP = "refresh_engine"
+
+# Group of the background tasks prefetching the Shotgun data of the context.
+PREFETCH_TASK_GROUP = "entity_prefetch"
+
 ###############################################################################################
 # methods to support the state when the engine cannot start up
 # for example if a non-sgtk file is loaded in maya
@@ -20,7 +42,7 @@ def _active_document():
     """
     Returns the current document.
     """
-    if not Krita.instance():
+    if Krita is None or not Krita.instance():
         return None
 
     if not Krita.instance().documents():
@@ -29,50 +51,133 @@ def _active_document():
     return Krita.instance().activeDocument()
 
 
-def refresh_engine(engine_name, prev_context, menu_name):
+def refresh_engine(engine_name, prev_context, menu_name, is_stale=None, on_applied=None):
     """
     Refresh the current engine
+
+    The pipeline configuration and context of a document that wasn't seen
+    before are resolved on the engine's task runner, since that means
+    filesystem and Shotgun round trips, and applied on the main thread once
+    available. A refresh supersedes the one still being resolved.
+
+    :param is_stale: Optional callable returning True when the active document
+        changed again since this refresh was requested, in which case the
+        refresh is abandoned before it touches the engine.
+    :param on_applied: Optional callable invoked without arguments once the
+        refresh was applied, i.e. neither abandoned nor failed.
+    :returns: The :class:`~tk_krita.Task` resolving the context, None if the
+        refresh completed or had nothing to do.
     """
     current_engine = sgtk.platform.current_engine()
 
     if not current_engine:
         # If we don't have an engine for some reason then we don't have
         # anything to do.
-        return
+        return None
 
     document = _active_document()
 
     if not document:
         # There is no active document so we leave the engine in it's current
         # state.
-        return
+        return None
+
+    if not document.fileName():
+        # The document was never saved so there is no path to get a context
+        # from.
+        return None
 
-    # determine the tk instance and ctx to use:
-    tk = current_engine.sgtk
+    metrics = current_engine.metrics
+    metrics.increment("refresh_engine.calls")
 
     # loading a scene file
-    new_path = document.fileName().abspath()
-
-    # this file could be in another project altogether, so create a new
-    # API instance.
-    try:
-        tk = sgtk.sgtk_from_path(new_path)
-    except sgtk.TankError, e:
-        logging.warning("Shotgun: Engine cannot be started: %s" % e)
-        # build disabled menu
-        create_sgtk_disabled_menu(menu_name)
+    new_path = os.path.abspath(document.fileName())
+
+    task_runner = current_engine.task_runner
+    task_runner.cancel_group(REFRESH_TASK_GROUP)
+
+    # switching back to a document or opening one next to it doesn't need
+    # another round trip through the pipeline configuration and Shotgun.
+    cached = current_engine.context_cache.lookup(new_path, prev_context)
+
+    if cached:
+        metrics.increment("context_cache.hits")
+        with metrics.timer("refresh_engine.apply"):
+            _apply_context(
+                current_engine, new_path, prev_context, menu_name, is_stale, on_applied, cached
+            )
+        return None
+
+    metrics.increment("context_cache.misses")
+    return task_runner.submit(
+        _resolve_context,
+        (new_path, prev_context, metrics),
+        group=REFRESH_TASK_GROUP,
+        callback=lambda resolved: _apply_context(
+            current_engine, new_path, prev_context, menu_name, is_stale, on_applied, resolved
+        ),
+        errback=lambda error: _context_failed(current_engine, new_path, menu_name, on_applied, error),
+    )
+
+
+def _resolve_context(path, prev_context, metrics):
+    """
+    Resolves the API instance and context of a path, on a worker thread.
+
+    :returns: Tuple of the API instance and the context.
+    """
+    with metrics.timer("refresh_engine.resolve"):
+        # this file could be in another project altogether, so create a new
+        # API instance.
+        tk = sgtk.sgtk_from_path(path)
+        # and construct the new context for this path:
+        return (tk, tk.context_from_path(path, prev_context))
+
+
+def _apply_context(current_engine, path, prev_context, menu_name, is_stale, on_applied, resolved):
+    """
+    Switches the engine to a resolved context, on the main thread.
+    """
+    if current_engine is not sgtk.platform.current_engine():
         return
 
+    if is_stale and is_stale():
+        current_engine.logger.debug("Dropping stale context refresh for %s.", path)
+        return
+
+    (tk, ctx) = resolved
+    current_engine.context_cache.store(path, prev_context, tk, ctx)
+
     # shotgun menu may have been removed, so add it back in if its not already there.
     current_engine.create_shotgun_menu()
     # now remove the shotgun disabled menu if it exists.
     remove_sgtk_disabled_menu()
 
-    # and construct the new context for this path:
-    ctx = tk.context_from_path(new_path, prev_context)
+    if ctx != current_engine.context:
+        with current_engine.metrics.timer("change_context"):
+            current_engine.change_context(ctx)
 
-    if ctx != sgtk.platform.current_engine().context:
-        current_engine.change_context(ctx)
+    if on_applied:
+        on_applied()
+
+
+def _context_failed(current_engine, path, menu_name, on_applied, error):
+    """
+    Reports a path outside of any pipeline configuration, on the main thread.
+    """
+    if current_engine is not sgtk.platform.current_engine():
+        return
+
+    if not isinstance(error, sgtk.TankError):
+        current_engine.logger.error("Failed to resolve the context of %s: %s", path, error)
+        return
+
+    logging.warning("Shotgun: Engine cannot be started: %s" % error)
+    # build disabled menu
+    create_sgtk_disabled_menu(menu_name)
+
+    if on_applied:
+        on_applied()
 
 
 def sgtk_disabled_message():
@@ -83,7 +188,7 @@ def sgtk_disabled_message():
            "the currently opened file.  Try opening another file or restarting "
            "Krita.")
 
-    win = Krita.instance().window().qwindow()
+    win = Krita.instance().activeWindow().qwindow()
     QtGui.QMessageBox.information(win,
                                   "Sgtk is disabled.",
                                   msg)
@@ -93,30 +198,14 @@ def create_sgtk_disabled_menu(menu_name):
     """
     Render a special "shotgun is disabled" menu
     """
-    win = Krita.instance().window().qwindow()
-
-    # Find the shotgun menu
-    menuBar = win.menuBar()
-    sg_menu = None
-    for action in menuBar.actions():
-        if action.objectName == "shotgun":
-            sg_menu = action.menu()
-            break
-
-    if sg_menu:
-        # Clear all the actions before adding our item
-        sg_menu.clear()
-    else:
-        # we need to create a new shotgun menu
-        sg_menu = QtGui.QMenu("Shotgun", menuBar)
-        sg_menu.setObjectName("shotgun")
-        menu_action = menuBar.addMenu(sg_menu)
-        menu_action.setObjectName("shotgun")
-
-    # add the disabled action to our menu
-    disabled_action = QtGui.QAction("Sgtk is disabled.")
-    disabled_action.triggered.connect(sgtk_disabled_message)
-    disabled_action.setObjectName("shotgun_disabled")
+    current_engine = sgtk.platform.current_engine()
+    if not current_engine:
+        return
+
+    # the disabled item replaces the commands without tearing them down,
+    # so switching back is cheap.
+    current_engine.create_shotgun_menu()
+    current_engine.menu_generator.set_enabled(False)
 
 
 def remove_sgtk_disabled_menu():
@@ -125,24 +214,11 @@ def remove_sgtk_disabled_menu():
 
     :returns: True if the menu existed and was deleted
     """
-    win = Krita.instance().window().qwindow()
-
-    menuBar = win.menuBar()
-    sg_menu = None
-    for action in menuBar.actions():
-        if action.objectName == "shotgun":
-            sg_menu = action.menu()
-            break
-
-    if not sg_menu:
+    current_engine = sgtk.platform.current_engine()
+    if not current_engine:
         return False
 
-    for action in sg_menu.actions():
-        if action.objectName() == "shotgun_disabled":
-            sg_menu.removeAction(action)
-            return True
-
-    return False
+    return current_engine.menu_generator.set_enabled(True)
 
 
 ###############################################################################################
@@ -153,12 +229,33 @@ class KritaEngine(Engine):
     Toolkit engine for Krita.
     """
 
+    # Log messages are printed directly until the log sink is started.
+    _log_sink = None
+
+    # Number of threads running background tasks.
+    TASK_RUNNER_THREADS = 4
+
+    # Milliseconds between the checks of the pipeline configurations of the
+    # cached contexts.
+    CONTEXT_CACHE_CHECK_INTERVAL = 10000
+
+    # Name of the metrics files, unique to the session.
+    METRICS_FILE_NAME = "%Y%m%d-%H%M%S-{pid}.json"
+
+    # Setting this environment variable starts the engine without UI, for
+    # batch jobs processing .kra files. It is implied outside of Krita.
+    HEADLESS_ENV_VAR = "SG_KRITA_HEADLESS"
+
     @property
     def context_change_allowed(self):
         """
         Whether the engine allows a context change without the need for a restart.
+
+        Toolkit keeps the apps whose settings are the same in both environments
+        and only loads the others, the engine then updates the menu entries that
+        changed.
         """
-        return False
+        return True
 
     @property
     def host_info(self):
@@ -180,15 +277,267 @@ class KritaEngine(Engine):
                 "version: "unknown"
             }
         """
-        inst = Krita.instance()
-
         host_info = {
             "name": "Krita",
-            "version": inst.version()
+            "version": self._kritaInstance.version() if self._kritaInstance else "unknown"
         }
 
         return host_info
 
+    @property
+    def context_cache(self):
+        """
+        The :class:`tk_krita.ContextCache` used to resolve document contexts.
+        """
+        return self._context_cache
+
+    @property
+    def menu_generator(self):
+        """
+        The :class:`tk_krita.MenuGenerator` owning the Shotgun menu.
+        """
+        return self._menu_generator
+
+    @property
+    def command_index(self):
+        """
+        The :class:`tk_krita.CommandIndex` grouping the registered commands.
+        """
+        if self._command_index.is_stale(self.commands):
+            self._command_index.sync(self.commands)
+        return self._command_index
+
+    @property
+    def task_runner(self):
+        """
+        The :class:`tk_krita.TaskRunner` apps can submit blocking work to,
+        rather than running it on Krita's UI thread. Callbacks are called on
+        the main thread.
+        """
+        return self._task_runner
+
+    def capture_thumbnail(self, sizes, callback, errback=None, document=None):
+        """
+        Captures thumbnails of a document without blocking Krita, for apps
+        publishing or reviewing it.
+
+        Thumbnails are cached until the document changes, so asking again is
+        cheap.
+
+        :param sizes: Sides of the squares the thumbnails must fit, in pixels.
+        :param callback: Called on the main thread with a dictionary of the
+            ``QImage`` thumbnails by size.
+        :param errback: Called on the main thread with the exception raised
+            while capturing.
+        :param document: Krita ``Document``, the active one when omitted.
+        :returns: The :class:`tk_krita.Task` producing the thumbnails, None
+            when they were cached and the callback was already called.
+        :raises TankError: If there is no document to capture.
+        """
+        document = document or _active_document()
+        if not document:
+            raise sgtk.TankError("There is no active document to capture a thumbnail of.")
+
+        return self._thumbnail_cache.request(document, sizes, callback, errback)
+
+    def export_layers(self, folder, extension="png", document=None):
+        """
+        Exports every layer of a document to its own file, for a publish.
+
+        Layers are cached by content, so only the ones that changed since a
+        previous export get written, the others are linked from the cache.
+
+        :param str folder: Folder to write the layer files to.
+        :param str extension: Extension of the files, which determines their
+            format.
+        :param document: Krita ``Document``, the active one when omitted.
+        :returns: :class:`tk_krita.ExportResult` with the paths of the files
+            by layer name.
+        :raises TankError: If there is no document to export.
+        """
+        document = document or _active_document()
+        if not document:
+            raise sgtk.TankError("There is no active document to export the layers of.")
+
+        return self._layer_exporter.export(document, folder, extension)
+
+    @property
+    def entity_cache(self):
+        """
+        The :class:`tk_krita.EntityCache` of the Shotgun entities of the
+        project, opened the first time. Apps can read entity fields through
+        it rather than querying Shotgun, e.g.::
+
+            engine.entity_cache.find_one("Shot", shot["id"], ["code", "sg_status_list"])
+
+        The entities of the current context are prefetched in the
+        background, with the fields of the ``entity_cache_fields`` setting.
+        """
+        with self._entity_cache_lock:
+            if self._entity_cache is None:
+                tk_krita = self.import_module("tk_krita")
+                self._entity_cache = tk_krita.EntityCache(
+                    os.path.join(self.cache_location, "entity_cache.sqlite"),
+                    lambda: self.shotgun,
+                    self.logger,
+                    self.get_setting("entity_cache_ttl", 600),
+                )
+            return self._entity_cache
+
+    def prefetch_context_entities(self, context=None):
+        """
+        Fetches the Shotgun data of the project, entity, step and task of a
+        context into the entity cache, on the task runner. The entities
+        Shotgun's event log reports as changed are fetched again.
+
+        :param context: Context to prefetch, the current one when omitted.
+        :returns: The :class:`tk_krita.Task` prefetching the entities, None
+            when the entity cache is disabled.
+        """
+        if not self.get_setting("entity_cache", False):
+            return None
+
+        context = context or self.context
+        self._task_runner.cancel_group(PREFETCH_TASK_GROUP)
+        return self._task_runner.submit(
+            self._prefetch_entities,
+            (context,),
+            group=PREFETCH_TASK_GROUP,
+            callback=lambda count: self.logger.debug(
+                "Prefetched %d Shotgun entities of %s.", count, context
+            ),
+            errback=lambda error: self.logger.debug(
+                "Could not prefetch the Shotgun entities of %s: %s", context, error
+            ),
+        )
+
+    def _prefetch_entities(self, context):
+        """
+        Prefetches the entities of a context, on a worker thread.
+
+        :returns: Number of entities fetched from Shotgun.
+        """
+        start = time.time()
+        cache = self.entity_cache
+        cache.sync_events(context.project)
+        count = cache.prefetch(
+            [context.project, context.entity, context.step, context.task],
+            self.get_setting("entity_cache_fields", {}),
+        )
+        self._metrics.observe("entity_cache.prefetch", time.time() - start)
+        return count
+
+    @property
+    def lazy_apps(self):
+        """
+        The :class:`tk_krita.LazyAppLoader` deferring the initialization of
+        apps when the ``lazy_apps`` setting is on, None otherwise.
+        """
+        return self._lazy_apps
+
+    @property
+    def save_queue(self):
+        """
+        The :class:`tk_krita.SaveQueue` running the save hooks. Apps can
+        connect to it to get the :class:`tk_krita.SaveResult` of every save
+        on the main thread.
+        """
+        return self._save_queue
+
+    def register_save_hook(self, name, callback):
+        """
+        Registers a function to run on a worker thread after a document was
+        saved, after the ``save_hook`` of the configuration.
+
+        :param str name: Name of the hook, the key of its result.
+        :param callback: Callable taking the document path, the number of
+            saves coalesced into the call and whether they were all
+            autosaves. It must not use Krita's API.
+        """
+        self._save_queue.register(name, callback)
+
+    def _execute_save_hook(self, path, saves, autosave):
+        """
+        Runs the ``save_hook`` of the configuration, on a worker thread.
+        """
+        return self.execute_hook_method(
+            "save_hook", "execute", path=path, saves=saves, autosave=autosave
+        )
+
+    def _on_image_saved(self, file_name):
+        """
+        Queues the save hooks of a document Krita saved.
+        """
+        if not file_name:
+            document = _active_document()
+            file_name = document.fileName() if document else None
+        if file_name:
+            self._metrics.increment("save_hooks.saves")
+            self._save_queue.notify(file_name)
+
+    def _on_save_hooks_done(self, result):
+        """
+        Records how long the save hooks of a document took.
+        """
+        self._metrics.increment("save_hooks.jobs")
+        self._metrics.observe("save_hooks.run", result.duration)
+        self.logger.debug(
+            "Ran the save hooks of %s for %d saves in %.2fs.", result.path, result.saves, result.duration
+        )
+
+    @property
+    def metrics(self):
+        """
+        The :class:`tk_krita.MetricsRegistry` timing the engine's hot paths,
+        enabled by the ``metrics`` setting. It can be queried from Krita's
+        Python console::
+
+            sgtk.platform.current_engine().metrics.snapshot()
+        """
+        return self._metrics
+
+    def dump_metrics(self, path=None):
+        """
+        Writes the metrics to a JSON file, the session's file in the Toolkit
+        log folder when no path is given.
+
+        :param str path: Path of the file to write.
+        :returns: The path of the file, None if it couldn't be written.
+        """
+        path = path or self._metrics_path
+        metadata = {
+            "engine_version": self.version,
+            "krita_version": self.host_info["version"],
+            "pid": os.getpid(),
+        }
+        try:
+            self._metrics.dump(path, metadata)
+        except (IOError, OSError) as e:
+            self.logger.debug("Could not write the metrics to %s: %s", path, e)
+            return None
+        return path
+
+    def _start_metrics_dumps(self):
+        """
+        Writes the metrics periodically, as set by ``metrics_dump_interval``.
+        """
+        interval = self.get_setting("metrics_dump_interval", 300)
+        if not self._metrics.enabled or interval <= 0 or not self.has_ui:
+            return
+
+        from sgtk.platform.qt import QtCore
+        self._metrics_timer = QtCore.QTimer()
+        self._metrics_timer.timeout.connect(self.dump_metrics)
+        self._metrics_timer.start(interval * 1000)
+
+    @property
+    def log_sink(self):
+        """
+        The :class:`tk_krita.LogSink` writing the engine's log messages, which
+        keeps the most recent ones in memory for a log viewer.
+        """
+        return self._log_sink
+
     ##########################################################################################
     # init and destroy
 
@@ -196,6 +545,8 @@ class KritaEngine(Engine):
         """
         Runs after the engine is set up but before any apps have been initialized.
         """
+        start = time.time()
+
         # unicode characters returned by the shotgun api need to be converted
         # to display correctly in all of the app windows
         from sgtk.platform.qt import QtCore
@@ -204,57 +555,138 @@ class KritaEngine(Engine):
         QtCore.QTextCodec.setCodecForCStrings(utf8)
         self.logger.debug("set utf-8 codec for widget text")
 
+        # Stub the commands of the apps known from earlier sessions rather
+        # than initializing the apps, until one of their commands runs.
+        if self.get_setting("lazy_apps", False):
+            tk_krita = self.import_module("tk_krita")
+            self._lazy_apps = tk_krita.LazyAppLoader(
+                self,
+                tk_krita.CommandManifest(os.path.join(self.cache_location, "app_commands.json"), self.logger),
+                self.get_setting("lazy_apps_exclude", []),
+            )
+            self._lazy_apps.install()
+
+        self._startup_trace.add_span("pre_app_init", start, time.time())
+        # apps are loaded between the end of pre_app_init and post_app_init
+        self._apps_load_start = time.time()
+
     def init_engine(self):
         """
         Initializes the Krita engine.
         """
+        start = time.time()
+
+        tk_krita = self.import_module("tk_krita")
+
+        # write log messages from a background thread from now on
+        self._log_sink = tk_krita.LogSink()
+        self._log_sink.start()
+
         self.logger.debug("%s: Initializing...", self)
 
-        self._kritaInstance = Krita.instance()
+        # counters and timers of the hot paths, next to free while disabled
+        self._metrics = tk_krita.MetricsRegistry(self.get_setting("metrics", False))
+        self._metrics_timer = None
+        self._metrics_path = os.path.join(
+            sgtk.LogManager().log_folder,
+            "tk-krita",
+            "metrics",
+            time.strftime(self.METRICS_FILE_NAME).format(pid=os.getpid())
+        )
+
+        self._headless = Krita is None or bool(os.environ.get(self.HEADLESS_ENV_VAR))
+        self._kritaInstance = Krita.instance() if Krita else None
+
+        self._context_cache = tk_krita.ContextCache(self.logger)
+        self._command_index = tk_krita.CommandIndex()
+
+        # blocking work runs on worker threads, with the results delivered
+        # on the main thread.
+        self._task_runner = tk_krita.TaskRunner(
+            self.logger, self.async_execute_in_main_thread, self.TASK_RUNNER_THREADS
+        )
+
+        self._thumbnail_cache = tk_krita.ThumbnailCache(self._task_runner, self.logger)
+        self._entity_cache = None
+        self._entity_cache_lock = threading.Lock()
+        self._dependency_index = None
+        self._dialog_pool = tk_krita.DialogPool(
+            self.logger,
+            self.get_setting("dialog_pool_size", 0),
+            self.get_setting("dialog_pool_memory", 256) * 1024 * 1024
+        )
+        self._layer_exporter = tk_krita.LayerExporter(
+            os.path.join(self.cache_location, "layers"),
+            self.logger,
+            self.TASK_RUNNER_THREADS,
+            max_size=self.get_setting("layer_cache_size", 2048) * 1024 * 1024,
+            max_age=self.get_setting("layer_cache_max_age", 30) * 24 * 60 * 60
+        )
+        # pipeline work after saves runs on the task runner, once saving
+        # went quiet.
+        self._save_queue = tk_krita.SaveQueue(
+            self._task_runner,
+            self.logger,
+            self.get_setting("save_hook_delay", 2000),
+            synchronous=not self.has_ui
+        )
+        self._save_queue.register("save_hook", self._execute_save_hook)
+        self._save_queue.connect(self._on_save_hooks_done)
+        if self._kritaInstance:
+            notifier = self._kritaInstance.notifier()
+            # Krita's notifier doesn't emit anything until it is activated
+            notifier.setActive(True)
+            notifier.imageClosed.connect(self._thumbnail_cache.forget_document)
+            notifier.imageSaved.connect(self._on_image_saved)
 
         # default menu name is Shotgun but this can be overriden
         # in the configuration to be Sgtk in case of conflicts
         self._menu_name = "Shotgun"
 
-    def _has_menu(self):
+        self._menu_generator = tk_krita.MenuGenerator(self, self._menu_name, sgtk_disabled_message)
+
+        self._document_watcher = None
+        self._context_cache_timer = None
+        self._startup_scheduler = None
+        self._apps_before_context_change = None
+        self._context_change_start = None
+
+        # the spans of the launcher and startup plugin are read from the
+        # environment when the trace gets written.
+        self._startup_trace = tk_krita.StartupTrace()
+        self._startup_trace.add_span("init_engine", start, time.time())
+        self._apps_load_start = None
+        self._lazy_apps = None
+
+    def register_command(self, name, callback, properties=None):
         """
-        Returns True when the shotgun menu has already been built once.
+        Registers a command with the engine and adds it to the command index.
         """
-        # We need the QWindow object for building the menu
-        window = self._kritaInstance.window().qwindow()
-        menuBar = window.menuBar()
+        super(KritaEngine, self).register_command(name, callback, properties)
 
-        for action in menuBar.actions():
-            if action.objectName == 'shotgun':
-                return True
+        command = self.commands.get(name)
+        if command is not None:
+            self._command_index.add(name, command)
+        if self._command_index.is_stale(self.commands):
+            self._command_index.sync(self.commands)
 
-        return False
+    def _has_menu(self):
+        """
+        Returns True when the shotgun menu has already been built once.
+        """
+        return self._menu_generator.has_menu()
 
     def create_shotgun_menu(self):
         """
         Creates the main shotgun menu in Krita.
-        Note that this only creates the menu, not the child actions.
+        Note that this only creates the menu, not the child actions, those are
+        created when the menu is first shown.
 
         :return: bool
         """
-        window = self._kritaInstance.window().qwindow()
-        menuBar = window.menuBar()
         # only create the shotgun menu if not in batch mode and menu doesn't already exist
-        if self.has_ui and not self._has_menu():
-            menu = QtGui.QMenu("Shotgun", window.menuBar())
-            menu.setObjectName("shotgun")
-
-            menu_action = menuBar.addMenu(menu)
-            menu_action.setObjectName("shotgun")
-
-            #tk_krita = self.import_module("tk_krita")
-            #self._menu_generator = tk_maya.MenuGenerator(self, self._menu_handle)
-            ## hook things up so that the menu is created every time it is clicked
-            #self._menu_handle.postMenuCommand(self._menu_generator.create_menu)
-
-            ## Restore the persisted Shotgun app panels.
-            #tk_maya.panel_generation.restore_panels(self)
-            return True
+        if self.has_ui:
+            return self._menu_generator.create_menu()
 
         return False
 
@@ -262,70 +694,227 @@ class KritaEngine(Engine):
         """
         Called when all apps have initialized
         """
+        start = time.time()
+        if self._apps_load_start:
+            self._startup_trace.add_span("load_apps", self._apps_load_start, start)
+            deferred = self._lazy_apps.deferred if self._lazy_apps else []
+            self.logger.debug(
+                "Loaded %d apps in %.3fs with lazy apps %s, %d deferred until first use.",
+                len(self.apps), start - self._apps_load_start,
+                "on" if self._lazy_apps else "off", len(deferred)
+            )
+        if self._lazy_apps:
+            self._lazy_apps.record()
+
+        # pick up the commands Toolkit renamed after loading the apps
+        self._command_index.sync(self.commands)
+
         self.create_shotgun_menu()
 
+        # Follow the active document when the context should change with it.
+        if self.has_ui and self.get_setting("automatic_context_switch", True):
+            self._start_document_watcher()
+
+        self.prefetch_context_entities()
+
         # Run a series of app instance commands at startup.
         self._run_app_instance_commands()
 
+        self._start_metrics_dumps()
+
+        self._startup_trace.add_span("post_app_init", start, time.time())
+
+        if self.get_setting("startup_trace", True):
+            if self.has_ui:
+                # Write the trace once the startup plugin recorded how long
+                # starting the engine took as a whole.
+                from sgtk.platform.qt import QtCore
+                QtCore.QTimer.singleShot(0, self._write_startup_trace)
+            else:
+                # no event loop to wait for
+                self._write_startup_trace()
+
+    def _write_startup_trace(self):
+        """
+        Writes the spans recorded from the launcher up to post_app_init as a
+        Chrome trace in the Toolkit log folder.
+        """
+        tk_krita = self.import_module("tk_krita")
+        trace = tk_krita.StartupTrace.from_environment()
+        for span in self._startup_trace.spans:
+            trace.add_span(*span)
+
+        metadata = {
+            "engine_version": self.version,
+            "krita_version": self.host_info["version"],
+            "context": str(self.context),
+            "launch_time": trace.launch_time,
+            "lazy_apps": bool(self._lazy_apps),
+            "deferred_apps": self._lazy_apps.deferred if self._lazy_apps else [],
+        }
+
+        folder = os.path.join(sgtk.LogManager().log_folder, "tk-krita", "startup_traces")
+        try:
+            path = trace.write(folder, metadata)
+        except (IOError, OSError) as e:
+            self.logger.debug("Could not write the startup trace: %s", e)
+        else:
+            self.logger.debug("Wrote startup trace %s.", path)
+
+    def _start_document_watcher(self):
+        """
+        Starts switching the context when the active document changes.
+        """
+        tk_krita = self.import_module("tk_krita")
+        self._document_watcher = tk_krita.DocumentWatcher(
+            self._kritaInstance,
+            self._on_active_document_changed,
+            self.logger
+        )
+        self._document_watcher.start()
+        self._kritaInstance.notifier().imageClosed.connect(self._context_cache.forget_document)
+
+        # drop the cached contexts whose configuration changed, reading the
+        # configurations off the main thread
+        from sgtk.platform.qt import QtCore
+        self._context_cache_timer = QtCore.QTimer()
+        self._context_cache_timer.timeout.connect(self._check_context_cache)
+        self._context_cache_timer.start(self.CONTEXT_CACHE_CHECK_INTERVAL)
+
+    def _check_context_cache(self):
+        """
+        Checks the pipeline configurations of the cached contexts.
+        """
+        self._context_cache.check_configurations(self._task_runner)
+
+    def _stop_document_watcher(self):
+        """
+        Stops following the active document.
+        """
+        if not self._document_watcher:
+            return
+
+        self._document_watcher.stop()
+        self._document_watcher = None
+        self._context_cache_timer.stop()
+        self._context_cache_timer = None
+        try:
+            self._kritaInstance.notifier().imageClosed.disconnect(self._context_cache.forget_document)
+        except (TypeError, RuntimeError):
+            pass
+
+    def _on_active_document_changed(self, path, is_stale):
+        """
+        Called by the document watcher once the active document settled.
+
+        :param str path: Path of the new active document.
+        :param is_stale: Callable returning True when the active document
+            changed again in the meantime.
+        """
+        watcher = self._document_watcher
+        refresh_engine(
+            self.instance_name, self.context, self._menu_name, is_stale,
+            on_applied=lambda: watcher.applied(path)
+        )
+
+    def pre_context_change(self, old_context, new_context):
+        """
+        Runs before a context change. Remembers the loaded apps, to report which
+        ones Toolkit could reuse, and empties the dialog pool, whose dialogs
+        may belong to apps Toolkit is about to unload.
+
+        :param old_context: The context being changed away from.
+        :param new_context: The new context being changed to.
+        """
+        self._context_change_start = time.time()
+        self._apps_before_context_change = dict(self.apps)
+        self._dialog_pool.forget_all()
+
     def post_context_change(self, old_context, new_context):
         """
-        Runs after a context change. The Krita event watching will be stopped
-        and new callbacks registered containing the new context information.
+        Runs after a context change. The commands registered by the apps Toolkit
+        loaded for the new context are picked up and only the menu entries that
+        changed are updated.
 
         :param old_context: The context being changed away from.
         :param new_context: The new context being changed to.
         """
-        print("Not implemented yet")
+        if self._lazy_apps:
+            # stubs recorded in another kind of context may be wrong here
+            self._lazy_apps.check_context()
+
+        self._command_index.sync(self.commands)
+
+        if self._menu_generator.is_built():
+            self._menu_generator.update()
+
+        self.prefetch_context_entities(new_context)
+
+        previous_apps = self._apps_before_context_change or {}
+        reused = [name for (name, app) in self.apps.items() if previous_apps.get(name) is app]
+        self.logger.debug(
+            "Changed context to %s in %.3fs, reused %d apps and loaded %d.",
+            new_context, time.time() - self._context_change_start,
+            len(reused), len(self.apps) - len(reused)
+        )
+        self._apps_before_context_change = None
 
     def _run_app_instance_commands(self):
         """
         Runs the series of app instance commands listed in the 'run_at_startup' setting
         of the environment configuration yaml file.
+
+        The commands are queued on Krita's event loop and run one at a time, so the UI
+        stays responsive while they run. Without a UI there is no event loop running
+        them, they run right away instead.
         """
 
-        # Build a dictionary mapping app instance names to dictionaries of commands they registered with the engine.
-        app_instance_commands = {}
-        for (command_name, value) in self.commands.iteritems():
-            app_instance = value["properties"].get("app")
-            if app_instance:
-                # Add entry 'command name: command function' to the command dictionary of this app instance.
-                command_dict = app_instance_commands.setdefault(app_instance.instance_name, {})
-                command_dict[command_name] = value["callback"]
+        command_index = self.command_index
+
+        budget = self.get_setting("run_at_startup_budget")
+        tk_krita = self.import_module("tk_krita")
+        self._startup_scheduler = tk_krita.StartupCommandScheduler(
+            self.logger,
+            budget / 1000.0 if budget else None
+        )
 
-        # Run the series of app instance commands listed in the 'run_at_startup' setting.
+        # Queue the series of app instance commands listed in the 'run_at_startup' setting.
         for app_setting_dict in self.get_setting("run_at_startup", []):
 
             app_instance_name = app_setting_dict["app_instance"]
             # Menu name of the command to run or '' to run all commands of the given app instance.
             setting_command_name = app_setting_dict["name"]
+            priority = app_setting_dict.get("priority") or 0
 
             # Retrieve the command dictionary of the given app instance.
-            command_dict = app_instance_commands.get(app_instance_name)
+            command_dict = command_index.commands_for_app(app_instance_name)
 
-            if command_dict is None:
+            if not command_dict:
                 self.logger.warning(
                     "%s configuration setting 'run_at_startup' requests app '%s' that is not installed.",
                     self.name, app_instance_name)
             else:
                 if not setting_command_name:
                     # Run all commands of the given app instance.
-                    # Run these commands once Maya will have completed its UI update and be idle
-                    # in order to run them after the ones that restore the persisted Shotgun app panels.
-                    for (command_name, command_function) in command_dict.iteritems():
-                        self.logger.debug("%s startup running app '%s' command '%s'.",
+                    for (command_name, command) in command_dict.items():
+                        self.logger.debug("%s startup queuing app '%s' command '%s'.",
                                           self.name, app_instance_name, command_name)
-                        command_function()
-                        # maya.utils.executeDeferred(command_function)
+                        self._startup_scheduler.add(
+                            "%s: %s" % (app_instance_name, command_name),
+                            command["callback"],
+                            priority
+                        )
                 else:
                     # Run the command whose name is listed in the 'run_at_startup' setting.
-                    # Run this command once Maya will have completed its UI update and be idle
-                    # in order to run it after the ones that restore the persisted Shotgun app panels.
-                    command_function = command_dict.get(setting_command_name)
-                    if command_function:
-                        self.logger.debug("%s startup running app '%s' command '%s'.",
+                    command = command_index.find(app_instance_name, setting_command_name)
+                    if command:
+                        self.logger.debug("%s startup queuing app '%s' command '%s'.",
                                           self.name, app_instance_name, setting_command_name)
-                        command_function()
-                        # maya.utils.executeDeferred(command_function)
+                        self._startup_scheduler.add(
+                            "%s: %s" % (app_instance_name, setting_command_name),
+                            command["callback"],
+                            priority
+                        )
                     else:
                         known_commands = ', '.join("'%s'" % name for name in command_dict)
                         self.logger.warning(
@@ -333,35 +922,152 @@ class KritaEngine(Engine):
                             "Known commands: %s",
                             self.name, app_instance_name, setting_command_name, known_commands)
 
+        # Run the queued commands once Krita completed its UI update and is idle.
+        if self.has_ui:
+            self._startup_scheduler.start()
+        else:
+            self._startup_scheduler.run()
+
     def destroy_engine(self):
         """
         Stops watching scene events and tears down menu.
         """
         self.logger.debug("%s: Destroying...", self)
 
+        self._stop_document_watcher()
+        self._save_queue.stop()
+        if self._lazy_apps:
+            self._lazy_apps.uninstall()
+        self._task_runner.stop()
+        if self._entity_cache:
+            self._entity_cache.close()
+        if self._metrics_timer:
+            self._metrics_timer.stop()
+            self._metrics_timer = None
+        if self._metrics.enabled:
+            path = self.dump_metrics()
+            if path:
+                self.logger.debug("Wrote metrics %s.", path)
+        try:
+            notifier = self._kritaInstance.notifier()
+            notifier.imageClosed.disconnect(self._thumbnail_cache.forget_document)
+            notifier.imageSaved.disconnect(self._on_image_saved)
+        except (AttributeError, TypeError, RuntimeError):
+            pass
+
         # clean up UI:
-        if self.has_ui and self._has_menu():
-            shotgun_action = None
-            for action in self._kritaInstance.menuBar().actions():
-                if action.objectName() == "shotgun":
-                    shotgun_action = action
-                    break
-            self._kritaInstance.menuBar().removeAction(shotgun_action)
+        if self.has_ui:
+            self._dialog_pool.clear()
+            self.close_windows()
+            self._menu_generator.destroy()
+
+        # flush the pending log messages, later ones are printed directly
+        if self._log_sink:
+            self._log_sink.stop()
+            self._log_sink = None
+
+    def show_dialog(self, title, bundle, widget_class, *args, **kwargs):
+        """
+        Shows a non-modal dialog window, reusing the one the app closed last
+        time when dialog pooling is enabled with the ``dialog_pool_size``
+        setting.
+
+        :param title: The title of the window
+        :param bundle: The app, engine or framework object that is associated with this window
+        :param widget_class: The class of the UI to be constructed. This must derive from QWidget.
+
+        Additional parameters specified will be passed through to the widget_class constructor.
+
+        :returns: the created widget_class instance
+        """
+        if not self.has_ui or not self.get_setting("dialog_pool_size", 0):
+            return super(KritaEngine, self).show_dialog(title, bundle, widget_class, *args, **kwargs)
+
+        key = self._dialog_pool.key(bundle, widget_class, title, args, kwargs)
+        pooled = self._dialog_pool.acquire(key, self._get_dialog_parent())
+        if pooled:
+            (dialog, widget) = pooled
+            self.logger.debug("Showing pooled dialog %s.", title)
+        else:
+            (dialog, widget) = self._create_dialog_with_widget(title, bundle, widget_class, *args, **kwargs)
+            self._dialog_pool.add(key, dialog, widget)
+
+        dialog.show()
+        dialog.raise_()
+        dialog.activateWindow()
+        return widget
 
     def _get_dialog_parent(self):
         """
         Get the QWidget parent for all dialogs created through
         show_dialog & show_modal.
         """
-        parent = self._kritaInstance.window().qwindow()
+        parent = self._kritaInstance.activeWindow().qwindow()
         return parent
 
     @property
     def has_ui(self):
         """
-        Detect and return if maya is running in batch mode
+        Detect and return if Krita is running in batch mode, which is the case
+        outside of Krita or when the SG_KRITA_HEADLESS environment variable is
+        set.
         """
-        return True
+        return not self._headless
+
+    @property
+    def dependency_index(self):
+        """
+        The :class:`tk_krita.DependencyIndex` of the files the .kra documents
+        of the project reference, loaded from the cache the first time.
+        """
+        if not self._dependency_index:
+            tk_krita = self.import_module("tk_krita")
+            self._dependency_index = tk_krita.DependencyIndex(
+                os.path.join(self.cache_location, "kra_dependencies.json"), self.logger
+            )
+        return self._dependency_index
+
+    def index_kra_files(self, folder):
+        """
+        Updates the dependency index with the .kra files below a folder,
+        parsing only the ones that changed since they were last indexed.
+
+        :param str folder: Folder to look for .kra files in, e.g. a shot.
+        :returns: The :class:`tk_krita.DependencyIndex`.
+        """
+        index = self.dependency_index
+        # inside Krita new processes would be Krita itself
+        index.scan(folder, use_threads=True if self.has_ui else None)
+        index.save()
+        return index
+
+    def process_kra_files(self, paths, job=None, processes=None):
+        """
+        Runs a job on many .kra files, reading them as zip archives rather
+        than opening them in Krita.
+
+        Jobs run in forked processes when headless on a platform that forks,
+        and in a thread pool otherwise, including inside a Krita session,
+        where new processes would be Krita itself. See
+        :func:`tk_krita.kra_batch.process_files` for what a job must be.
+
+        :param paths: Paths to the .kra files.
+        :param job: Callable taking a path, reading the document metadata
+            when omitted.
+        :param int processes: Size of the pool, the number of CPUs when omitted.
+        :returns: :class:`tk_krita.BatchReport` with the result of every file,
+            the throughput and the latency statistics.
+        """
+        kra_batch = self.import_module("tk_krita").kra_batch
+        report = kra_batch.process_files(
+            paths, job or kra_batch.read_metadata, processes, use_threads=True if self.has_ui else None
+        )
+        self.logger.info(
+            "Processed %d .kra files in %.2fs, %.1f files/s, %d failed, median latency %.3fs.",
+            report.files, report.duration, report.throughput, report.failed,
+            report.latency["median"] or 0.0
+        )
+        return report
 
     ##########################################################################################
     # logging
@@ -377,33 +1083,34 @@ class KritaEngine(Engine):
         :param record: Standard python logging record.
         :type record: :class:`~python.logging.LogRecord`
         """
-        # Give a standard format to the message:
-        #     Shotgun <basename>: <message>
-        # where "basename" is the leaf part of the logging record name,
-        # for example "tk-multi-shotgunpanel" or "qt_importer".
         if record.levelno < logging.INFO:
-            formatter = logging.Formatter("Debug: Shotgun %(basename)s: %(message)s")
+            formatter = LOG_FORMATTERS[logging.DEBUG]
         else:
-            formatter = logging.Formatter("Shotgun %(basename)s: %(message)s")
+            formatter = LOG_FORMATTERS[logging.INFO]
 
         msg = formatter.format(record)
 
-        print(msg)
+        if self._log_sink:
+            # printing happens on the sink's writer thread
+            self._log_sink.write(record.levelno, record.created, msg)
+        else:
+            print(msg)
 
     def close_windows(self):
         """
         Closes the various windows (dialogs, panels, etc.) opened by the engine.
         """
-        # Make a copy of the list of Tank dialogs that have been created by the engine and
-        # are still opened since the original list will be updated when each dialog is closed.
-        opened_dialog_list = self.created_qt_dialogs[:]
-
-        # Loop through the list of opened Tank dialogs.
-        for dialog in opened_dialog_list:
-            dialog_window_title = dialog.windowTitle()
-            try:
-                # Close the dialog and let its close callback remove it from the original dialog list.
-                self.logger.debug("Closing dialog %s.", dialog_window_title)
-                dialog.close()
-            except Exception, exception:
-                self.logger.error("Cannot close dialog %s: %s", dialog_window_title, exception)
+        with self._metrics.timer("close_windows"):
+            # Make a copy of the list of Tank dialogs that have been created by the engine and
+            # are still opened since the original list will be updated when each dialog is closed.
+            opened_dialog_list = self.created_qt_dialogs[:]
+
+            # Loop through the list of opened Tank dialogs.
+            for dialog in opened_dialog_list:
+                dialog_window_title = dialog.windowTitle()
+                try:
+                    # Close the dialog and let its close callback remove it from the original dialog list.
+                    self.logger.debug("Closing dialog %s.", dialog_window_title)
+                    dialog.close()
+                except Exception as exception:
+                    self.logger.error("Cannot close dialog %s: %s", dialog_window_title, exception)
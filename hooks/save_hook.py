@@ -0,0 +1,34 @@
+"""
+Hook run after a document was saved in Krita.
+"""
+
+import sgtk
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+
+class SaveHook(HookBaseClass):
+    """
+    Pipeline work to do when a document is saved: version checks, thumbnail
+    refreshes, Shotgun status updates...
+
+    The hook runs on a worker thread once saving went quiet, a burst of
+    saves and autosaves of a document making a single call. It must not use
+    Krita's API nor create widgets. What it returns is handed to the
+    listeners of the engine's save queue on the main thread.
+    """
+
+    def execute(self, path, saves, autosave, **kwargs):
+        """
+        Checks that the document was saved to a path the pipeline knows.
+
+        :param str path: Path of the saved document.
+        :param int saves: Number of saves since the hook last ran.
+        :param bool autosave: True when all the saves were autosaves.
+        :returns: Dictionary with the name of the ``template`` matching the
+            path, None when there is none.
+        """
+        template = self.parent.sgtk.template_from_path(path)
+        if template is None and not autosave:
+            self.logger.warning("%s was saved outside of the pipeline folders.", path)
+        return {"template": template.name if template else None}
@@ -0,0 +1,21 @@
+"""
+Python modules of the Krita engine, imported through ``engine.import_module``.
+"""
+
+from .command_index import CommandIndex
+from .context_cache import ContextCache
+from .dialog_pool import DialogPool
+from .dependency_index import DependencyIndex
+from .document_watcher import DocumentWatcher
+from .entity_cache import EntityCache
+from .kra_batch import BatchReport, FileResult
+from .lazy_apps import CommandManifest, LazyAppLoader
+from .layer_export import ExportResult, LayerExporter
+from .log_sink import LogEntry, LogSink
+from .menu_generation import MenuGenerator
+from .metrics import MetricsRegistry
+from .save_queue import SaveQueue, SaveResult
+from .startup_scheduler import StartupCommandScheduler
+from .startup_trace import StartupTrace
+from .task_runner import Task, TaskCancelled, TaskRunner
+from .thumbnails import ThumbnailCache
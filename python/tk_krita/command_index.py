@@ -0,0 +1,181 @@
+"""
+Index of the commands registered with the engine.
+"""
+
+
+class CommandIndex(object):
+    """
+    Groups the engine's commands by app instance, by display name and by
+    type, so lookups don't have to go through every registered command.
+
+    The index is updated as commands are registered. :meth:`sync` rebuilds
+    it when the engine's command dictionary changed behind its back, e.g.
+    when Toolkit clears the commands during a context change.
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._by_app = {}
+        self._by_display_name = {}
+        self._by_type = {}
+
+    def __len__(self):
+        return len(self._commands)
+
+    def __contains__(self, command_name):
+        return command_name in self._commands
+
+    def add(self, command_name, command):
+        """
+        Indexes a command, replacing any command with the same name.
+
+        :param str command_name: Name the command is registered under.
+        :param dict command: The engine's command dictionary, holding the
+            ``callback`` and ``properties`` keys.
+        """
+        if command_name in self._commands:
+            self.remove(command_name)
+
+        properties = command["properties"]
+        self._commands[command_name] = command
+
+        app = properties.get("app")
+        app_instance_name = app.instance_name if app else None
+        self._by_app.setdefault(app_instance_name, {})[command_name] = command
+
+        display_name = properties.get("short_name") or command_name
+        self._by_display_name.setdefault(display_name, set()).add(command_name)
+
+        command_type = properties.get("type", "default")
+        self._by_type.setdefault(command_type, set()).add(command_name)
+
+    def remove(self, command_name):
+        """
+        Removes a command from the index.
+
+        :param str command_name: Name the command is registered under.
+        :returns: True if the command was indexed.
+        """
+        command = self._commands.pop(command_name, None)
+        if command is None:
+            return False
+
+        properties = command["properties"]
+        app = properties.get("app")
+        _discard(self._by_app, app.instance_name if app else None, command_name)
+        _discard(self._by_display_name, properties.get("short_name") or command_name, command_name)
+        _discard(self._by_type, properties.get("type", "default"), command_name)
+        return True
+
+    def clear(self):
+        """
+        Empties the index.
+        """
+        self._commands.clear()
+        self._by_app.clear()
+        self._by_display_name.clear()
+        self._by_type.clear()
+
+    def sync(self, commands):
+        """
+        Rebuilds the index if it doesn't match the engine's commands.
+
+        Only the number of commands and their identity are compared, which
+        catches commands being cleared or replaced wholesale.
+
+        :param dict commands: The engine's command dictionary.
+        :returns: True if the index was rebuilt.
+        """
+        if len(commands) == len(self._commands) and all(
+            self._commands.get(name) is command for (name, command) in commands.items()
+        ):
+            return False
+
+        self.clear()
+        for (command_name, command) in commands.items():
+            self.add(command_name, command)
+        return True
+
+    def is_stale(self, commands):
+        """
+        Cheap check whether :meth:`sync` needs to run, comparing sizes only.
+
+        :param dict commands: The engine's command dictionary.
+        """
+        return len(commands) != len(self._commands)
+
+    def get(self, command_name):
+        """
+        Returns the command registered under a name, or None.
+        """
+        return self._commands.get(command_name)
+
+    def commands_for_app(self, app_instance_name):
+        """
+        Returns the commands of an app instance.
+
+        :param str app_instance_name: Name of the app instance.
+        :returns: Dictionary mapping command names to command dictionaries,
+            empty if the app didn't register any command.
+        """
+        return dict(self._by_app.get(app_instance_name, {}))
+
+    def resolve_name(self, app_instance_name, command_name):
+        """
+        Returns the name an app instance registered a command under.
+
+        :param str app_instance_name: Name of the app instance.
+        :param str command_name: Registered or display name of the command.
+        :returns: The registered name, or None if the app has no such command.
+        """
+        app_commands = self._by_app.get(app_instance_name, {})
+        if command_name in app_commands:
+            return command_name
+
+        for name in self._by_display_name.get(command_name, ()):
+            if name in app_commands:
+                return name
+        return None
+
+    def find(self, app_instance_name, command_name):
+        """
+        Returns the command an app instance registered, or None.
+
+        :param str app_instance_name: Name of the app instance.
+        :param str command_name: Registered or display name of the command.
+        """
+        return self._commands.get(self.resolve_name(app_instance_name, command_name))
+
+    def app_instance_names(self):
+        """
+        Returns the names of the app instances that registered commands.
+        """
+        return [name for name in self._by_app if name is not None]
+
+    def names_for_display_name(self, display_name):
+        """
+        Returns the names of the commands shown under a display name.
+        """
+        return set(self._by_display_name.get(display_name, ()))
+
+    def names_for_type(self, command_type):
+        """
+        Returns the names of the commands of a type, e.g. ``context_menu``.
+        """
+        return set(self._by_type.get(command_type, ()))
+
+
+def _discard(index, key, command_name):
+    """
+    Removes a command name from a grouping, dropping empty groups.
+    """
+    group = index.get(key)
+    if group is None:
+        return
+
+    if isinstance(group, dict):
+        group.pop(command_name, None)
+    else:
+        group.discard(command_name)
+    if not group:
+        del index[key]
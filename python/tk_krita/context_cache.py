@@ -0,0 +1,167 @@
+"""
+Caching of the tk instances and contexts resolved from document paths.
+"""
+
+import os
+from collections import OrderedDict
+
+
+class ContextCache(object):
+    """
+    Bounded LRU cache of the tk instance and context resolved for a path.
+
+    Resolving a context means calling ``sgtk.sgtk_from_path`` and
+    ``tk.context_from_path``, which read the pipeline configuration and may
+    query Shotgun. Documents in the same folder resolve to the same
+    context, so entries are keyed on the folder of the path along with the
+    previous context the resolution was extended from. This assumes the
+    templates of the configuration don't tell documents of a folder apart by
+    their file name, which would give them different contexts.
+
+    On top of that the cache remembers the context of every open document,
+    so switching between documents is a single dictionary lookup.
+
+    Every entry records a signature of its pipeline configuration. Looking
+    up an entry doesn't read the configuration again, the entries whose
+    configuration changed on disk are dropped by
+    :meth:`check_configurations`, which the engine runs periodically.
+    """
+
+    def __init__(self, logger, max_entries=64):
+        """
+        :param logger: Logger to report cache activity to.
+        :param int max_entries: Maximum number of folders to remember.
+        """
+        self._logger = logger
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._documents = {}
+
+    def lookup(self, path, prev_context):
+        """
+        Returns the cached tk instance and context for a document path.
+
+        :param str path: Absolute path of the document.
+        :param prev_context: Context the resolution would be extended from.
+        :returns: ``(tk, context)`` tuple or None on a cache miss.
+        """
+        entry = self._documents.get(path)
+        if entry:
+            return entry[:2]
+
+        key = (os.path.dirname(path), _context_key(prev_context))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        # re-insert to mark the entry as most recently used
+        self._entries[key] = entry
+        self._documents[path] = entry
+        return entry[:2]
+
+    def store(self, path, prev_context, tk, context):
+        """
+        Remembers the tk instance and context resolved for a document path.
+
+        :param str path: Absolute path of the document.
+        :param prev_context: Context the resolution was extended from.
+        :param tk: Tk instance returned by ``sgtk.sgtk_from_path``.
+        :param context: Context returned by ``tk.context_from_path``.
+        """
+        entry = (tk, context, _config_signature(tk))
+        key = (os.path.dirname(path), _context_key(prev_context))
+
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+        self._documents[path] = entry
+
+    def forget_document(self, path):
+        """
+        Forgets the context of a document, typically once it is closed.
+
+        :param str path: Absolute path of the document.
+        """
+        self._documents.pop(path, None)
+
+    def clear(self):
+        """
+        Drops every cached entry.
+        """
+        self._entries.clear()
+        self._documents.clear()
+
+    def check_configurations(self, task_runner):
+        """
+        Drops the entries whose pipeline configuration changed on disk since
+        they were stored. The configuration files are read on the task
+        runner, the entries are dropped on the main thread once it is done.
+
+        :param task_runner: :class:`TaskRunner` reading the configurations.
+        :returns: The :class:`Task` checking the configurations, None when
+            nothing is cached.
+        """
+        recorded = {}
+        for entry in list(self._entries.values()) + list(self._documents.values()):
+            recorded[(id(entry[0]), entry[2])] = entry[0]
+        if not recorded:
+            return None
+
+        return task_runner.submit(_changed_configurations, (recorded,), callback=self._drop_configurations)
+
+    def _drop_configurations(self, changed):
+        """
+        Drops the entries recorded with a configuration that changed.
+
+        :param changed: Set of ``(id(tk), signature)`` tuples.
+        """
+        if not changed:
+            return
+
+        for entries in (self._entries, self._documents):
+            for (key, entry) in list(entries.items()):
+                if (id(entry[0]), entry[2]) in changed:
+                    del entries[key]
+        self._logger.debug("Pipeline configuration changed, dropped the cached contexts.")
+
+
+def _context_key(context):
+    """
+    Returns a hashable key identifying a context, or None.
+    """
+    if context is None:
+        return None
+
+    key = []
+    for entity in (context.project, context.entity, context.step, context.task):
+        key.append((entity["type"], entity["id"]) if entity else None)
+    return tuple(key)
+
+
+def _changed_configurations(recorded):
+    """
+    Returns the configurations that changed, on a worker thread.
+
+    :param dict recorded: Tk instances by ``(id(tk), signature)`` tuple.
+    :returns: Set of the keys whose signature is no longer the current one.
+    """
+    return set(key for (key, tk) in recorded.items() if _config_signature(tk) != key[1])
+
+
+def _config_signature(tk):
+    """
+    Returns a value that changes whenever the pipeline configuration of
+    a tk instance is modified in a way that affects path resolution.
+    """
+    pipeline_configuration = tk.pipeline_configuration
+    config_location = pipeline_configuration.get_config_location()
+
+    signature = [pipeline_configuration.get_path()]
+    for file_name in ("templates.yml", "roots.yml"):
+        try:
+            signature.append(os.path.getmtime(os.path.join(config_location, "core", file_name)))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
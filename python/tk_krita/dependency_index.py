@@ -0,0 +1,254 @@
+"""
+Persistent index of the external files ``.kra`` documents reference.
+"""
+
+import errno
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+from . import kra_batch
+
+# Bump this whenever the layout of the index file changes.
+INDEX_VERSION = 1
+
+# Attributes holding paths to external files, by layer node type. Only file
+# layers are recorded, other links, e.g. reference images linked rather than
+# embedded, are not.
+REFERENCE_ATTRIBUTES = {
+    "filelayer": ("source",),
+}
+
+
+def normalize_path(path):
+    """
+    Returns the form paths are compared in by the index.
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+def read_references(path):
+    """
+    Returns the external files a ``.kra`` document references, e.g. the
+    sources of its file layers.
+
+    ``maindoc.xml`` is parsed as it is read from the archive, element by
+    element, every element being dropped once it was handled so that large
+    documents are never held in memory. Relative references are resolved
+    against the folder of the document, like Krita does.
+
+    :param str path: Path to the ``.kra`` file.
+    :returns: Sorted list of normalized paths.
+    """
+    folder = os.path.dirname(path)
+    references = set()
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(kra_batch.MAINDOC) as handle:
+            for (_, element) in ElementTree.iterparse(handle, events=("end",)):
+                if element.tag.rsplit("}", 1)[-1] == "layer":
+                    for attribute in REFERENCE_ATTRIBUTES.get(element.get("nodetype"), ()):
+                        value = element.get(attribute)
+                        if value:
+                            references.add(normalize_path(os.path.join(folder, value)))
+                # the children of the element were handled already
+                element.clear()
+    return sorted(references)
+
+
+class DependencyIndex(object):
+    """
+    Index of the files referenced by ``.kra`` documents, kept on disk between
+    sessions.
+
+    Documents are keyed by path, size and modification time, so updating
+    the index only parses the documents that changed since. Both the
+    references of a document and the documents referencing a file are
+    dictionary lookups, the reverse mapping being rebuilt in memory when
+    the index is loaded.
+    """
+
+    def __init__(self, path, logger):
+        """
+        :param str path: Path to the index file.
+        :param logger: Logger to report to.
+        """
+        self._path = path
+        self._logger = logger
+        # document -> [size, mtime, references]
+        self._documents = {}
+        # referenced file -> set of documents
+        self._users = {}
+        self._dirty = False
+        self._load()
+
+    def update(self, paths, processes=None, use_threads=None):
+        """
+        Indexes documents, parsing only the new and changed ones. Documents
+        that can't be read keep what was indexed for them before, if
+        anything, and are parsed again next time.
+
+        :param paths: Paths to the ``.kra`` files.
+        :param int processes: Size of the pool parsing the documents.
+        :param use_threads: Whether to parse in threads rather than in
+            processes, see :func:`kra_batch.process_files`.
+        :returns: Number of documents parsed.
+        """
+        stats = {}
+        for path in paths:
+            path = normalize_path(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.remove(path)
+                continue
+            entry = self._documents.get(path)
+            if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+                stats[path] = (stat.st_size, stat.st_mtime)
+
+        if not stats:
+            return 0
+
+        report = kra_batch.process_files(list(stats), read_references, processes, use_threads)
+        for result in report.results:
+            if result.error:
+                self._logger.debug("Could not index %s: %s", result.path, result.error)
+                continue
+            (size, mtime) = stats[result.path]
+            self._set(result.path, size, mtime, result.result)
+
+        self._logger.debug(
+            "Indexed %d documents in %.2fs, %.1f documents/s.",
+            report.files, report.duration, report.throughput
+        )
+        return report.files
+
+    def scan(self, folder, processes=None, use_threads=None):
+        """
+        Indexes the ``.kra`` files below a folder and forgets the documents
+        of that folder that are gone.
+
+        :param str folder: Folder to walk.
+        :param int processes: Size of the pool parsing the documents.
+        :param use_threads: Whether to parse in threads rather than in
+            processes, see :func:`kra_batch.process_files`.
+        :returns: Number of documents parsed.
+        """
+        folder = normalize_path(folder)
+        paths = []
+        for (root, _, file_names) in os.walk(folder):
+            paths.extend(
+                os.path.join(root, file_name) for file_name in file_names
+                if file_name.lower().endswith(".kra")
+            )
+
+        found = set(normalize_path(path) for path in paths)
+        prefix = os.path.join(folder, "")
+        for document in list(self._documents):
+            if document.startswith(prefix) and document not in found:
+                self.remove(document)
+
+        return self.update(paths, processes, use_threads)
+
+    def references(self, document):
+        """
+        Returns the files a document references.
+
+        :param str document: Path to the ``.kra`` file.
+        :returns: List of normalized paths, empty for unknown documents.
+        """
+        entry = self._documents.get(normalize_path(document))
+        return list(entry[2]) if entry else []
+
+    def referenced_by(self, path):
+        """
+        Returns the documents referencing a file.
+
+        :param str path: Path to the referenced file.
+        :returns: Sorted list of normalized document paths.
+        """
+        return sorted(self._users.get(normalize_path(path), ()))
+
+    def documents(self):
+        """
+        Returns the indexed documents.
+        """
+        return sorted(self._documents)
+
+    def remove(self, document):
+        """
+        Forgets a document.
+
+        :param str document: Path to the ``.kra`` file.
+        """
+        entry = self._documents.pop(normalize_path(document), None)
+        if not entry:
+            return
+
+        for reference in entry[2]:
+            users = self._users.get(reference)
+            if users:
+                users.discard(normalize_path(document))
+                if not users:
+                    del self._users[reference]
+        self._dirty = True
+
+    def save(self):
+        """
+        Writes the index to disk if it changed since it was loaded. Failing
+        to write it is not fatal, the documents are parsed again next time.
+        """
+        if not self._dirty:
+            return
+
+        data = {"version": INDEX_VERSION, "documents": self._documents}
+        tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        try:
+            try:
+                os.makedirs(os.path.dirname(self._path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(tmp_path, "w") as fh:
+                json.dump(data, fh)
+            try:
+                os.rename(tmp_path, self._path)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(self._path)
+                os.rename(tmp_path, self._path)
+        except (IOError, OSError) as e:
+            self._logger.debug("Could not write dependency index %s: %s", self._path, e)
+            return
+
+        self._dirty = False
+
+    def _set(self, document, size, mtime, references):
+        """
+        Records the references of a document, replacing the previous ones.
+        """
+        self.remove(document)
+        self._documents[document] = [size, mtime, references]
+        for reference in references:
+            self._users.setdefault(reference, set()).add(document)
+        self._dirty = True
+
+    def _load(self):
+        """
+        Reads the index from disk, discarding it when it is unusable.
+        """
+        try:
+            with open(self._path, "r") as fh:
+                data = json.load(fh)
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            self._logger.debug("Ignoring corrupt dependency index %s: %s", self._path, e)
+            return
+
+        if data.get("version") != INDEX_VERSION:
+            return
+
+        for (document, (size, mtime, references)) in (data.get("documents") or {}).items():
+            self._set(document, size, mtime, references)
+        self._dirty = False
@@ -0,0 +1,210 @@
+"""
+Reuse of the dialogs apps open, instead of building them again.
+"""
+
+import collections
+
+from sgtk.platform.qt import QtCore
+
+# Rough memory cost of a Qt object and of an item model cell, used to
+# estimate what a hidden dialog keeps alive.
+ESTIMATED_OBJECT_SIZE = 2 * 1024
+ESTIMATED_CELL_SIZE = 256
+
+
+def estimate_dialog_size(dialog):
+    """
+    Estimates the memory held by a dialog, from the number of objects it
+    owns and the size of the item models among them.
+
+    :param dialog: ``QWidget`` to estimate.
+    :returns: Estimate in bytes.
+    """
+    children = dialog.findChildren(QtCore.QObject)
+    size = (len(children) + 1) * ESTIMATED_OBJECT_SIZE
+    for child in children:
+        if isinstance(child, QtCore.QAbstractItemModel):
+            size += child.rowCount() * max(child.columnCount(), 1) * ESTIMATED_CELL_SIZE
+    return size
+
+
+class _CloseFilter(QtCore.QObject):
+    """
+    Turns the close events of a pooled dialog into hiding it.
+    """
+
+    def __init__(self, pool, key, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._pool = pool
+        self._key = key
+
+    def eventFilter(self, watched, event):
+        if event.type() != QtCore.QEvent.Close:
+            return False
+
+        event.ignore()
+        watched.hide()
+        self._pool._release(self._key)
+        return True
+
+
+class DialogPool(object):
+    """
+    Keeps the dialogs of apps hidden once closed, to show them again at
+    once the next time they are opened.
+
+    Dialogs are pooled by app, widget class, title and arguments, so only a
+    dialog that would be built the same way is reused. The engine empties
+    the pool when the context changes, as the apps may be loaded again.
+    Hidden dialogs are
+    evicted, least recently closed first, when there are more than
+    ``max_dialogs`` of them or when their estimated memory goes over
+    ``memory_budget``. Evicted dialogs are closed for good, which runs the
+    usual Toolkit clean up.
+    """
+
+    def __init__(self, logger, max_dialogs, memory_budget, estimate=None):
+        """
+        :param logger: Logger to report to.
+        :param int max_dialogs: Maximum number of hidden dialogs kept.
+        :param int memory_budget: Maximum estimated memory of the hidden
+            dialogs, in bytes.
+        :param estimate: Callable returning the memory held by a dialog,
+            :func:`estimate_dialog_size` when omitted.
+        """
+        self._logger = logger
+        self._max_dialogs = max_dialogs
+        self._memory_budget = memory_budget
+        self._estimate = estimate or estimate_dialog_size
+        # key -> (dialog, widget, close filter), of all the pooled dialogs
+        self._dialogs = {}
+        # key -> estimated size, of the hidden ones, least recently closed first
+        self._hidden = collections.OrderedDict()
+
+    @staticmethod
+    def key(bundle, widget_class, title, args, kwargs):
+        """
+        Returns the key a dialog is pooled by.
+        """
+        return (
+            bundle.instance_name,
+            "%s.%s" % (widget_class.__module__, widget_class.__name__),
+            title,
+            repr(args),
+            repr(sorted(kwargs.items())),
+        )
+
+    def acquire(self, key, parent):
+        """
+        Takes a hidden dialog out of the pool.
+
+        :param key: Key returned by :meth:`key`.
+        :param parent: Widget to parent the dialog to, which may have
+            changed since the dialog was hidden.
+        :returns: Tuple of the dialog and its widget, None if there is no
+            hidden dialog for the key.
+        """
+        if key not in self._hidden:
+            return None
+
+        del self._hidden[key]
+        (dialog, widget, _) = self._dialogs[key]
+        try:
+            if dialog.parent() is not parent:
+                # setParent resets the window flags
+                dialog.setParent(parent, dialog.windowFlags())
+            # hidden along with the dialog when the app closed it
+            if widget.isHidden():
+                widget.show()
+        except RuntimeError:
+            # deleted by Qt along with its former parent
+            del self._dialogs[key]
+            return None
+        return (dialog, widget)
+
+    def add(self, key, dialog, widget):
+        """
+        Pools a dialog that was just created and shown. Only one dialog is
+        pooled by key, a second one opened while the first is still shown
+        is closed as usual.
+
+        A dialog ended with ``done()``, e.g. accepted or rejected, is torn
+        down by Toolkit once it emits ``finished`` and leaves the pool.
+
+        :param key: Key returned by :meth:`key`.
+        :param dialog: Toolkit dialog.
+        :param widget: App widget in the dialog.
+        """
+        if key in self._dialogs:
+            return
+
+        close_filter = _CloseFilter(self, key, dialog)
+        dialog.installEventFilter(close_filter)
+        dialog.finished.connect(lambda *args: self._discard(key, dialog))
+        self._dialogs[key] = (dialog, widget, close_filter)
+
+    def clear(self):
+        """
+        Closes all the pooled dialogs for good, hidden or not.
+        """
+        for key in list(self._dialogs):
+            self._close(key)
+
+    def forget_all(self):
+        """
+        Empties the pool when the apps may have been loaded again, e.g. after
+        a context change. Hidden dialogs are closed for good, the ones shown
+        are left open and close as usual.
+        """
+        for (key, (dialog, _, _)) in list(self._dialogs.items()):
+            if key in self._hidden:
+                self._close(key)
+            else:
+                self._discard(key, dialog)
+
+    def _release(self, key):
+        """
+        Records a pooled dialog was hidden and evicts what goes over the
+        limits.
+        """
+        if key not in self._dialogs:
+            return
+
+        self._hidden.pop(key, None)
+        self._hidden[key] = self._estimate(self._dialogs[key][0])
+
+        while self._hidden and (
+            len(self._hidden) > self._max_dialogs or sum(self._hidden.values()) > self._memory_budget
+        ):
+            evicted = next(iter(self._hidden))
+            self._logger.debug("Evicting dialog %s from the pool.", evicted[2])
+            self._close(evicted)
+
+    def _discard(self, key, dialog):
+        """
+        Removes a dialog Toolkit tears down from the pool, without closing it.
+        """
+        entry = self._dialogs.get(key)
+        if entry is None or entry[0] is not dialog:
+            # a dialog pooled later under the same key
+            return
+
+        del self._dialogs[key]
+        self._hidden.pop(key, None)
+        try:
+            dialog.removeEventFilter(entry[2])
+        except RuntimeError:
+            pass
+
+    def _close(self, key):
+        """
+        Removes a dialog from the pool and closes it.
+        """
+        self._hidden.pop(key, None)
+        (dialog, _, close_filter) = self._dialogs.pop(key)
+        try:
+            dialog.removeEventFilter(close_filter)
+            dialog.close()
+        except RuntimeError:
+            # already deleted by Qt
+            pass
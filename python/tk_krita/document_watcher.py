@@ -0,0 +1,163 @@
+"""
+Watching of Krita's document notifications to drive context switches.
+"""
+
+from sgtk.platform.qt import QtCore
+
+
+class DocumentWatcher(object):
+    """
+    Turns Krita's document and view notifications into context switches.
+
+    Opening a batch of files or cycling through tabs emits a burst of
+    notifications. Rather than resolving a context for each of them, every
+    notification restarts a single shot timer and only the document that
+    is active once the burst is over gets resolved.
+
+    Each burst bumps a generation counter. The resolve callback is handed a
+    function telling whether a newer burst started since, so resolutions
+    that are still in flight when the artist moves on can be dropped.
+    """
+
+    def __init__(self, krita, resolve_callback, logger, delay=250, timer=None):
+        """
+        :param krita: The ``Krita`` instance, or any object providing
+            ``notifier()``, ``windows()`` and ``activeDocument()``.
+        :param resolve_callback: Callable invoked as
+            ``resolve_callback(path, is_stale)`` once a burst is over. It
+            must call :meth:`applied` once the context was applied.
+        :param logger: Logger to report activity to.
+        :param int delay: Milliseconds without notifications before the
+            active document is resolved.
+        :param timer: Single shot timer to use, a ``QtCore.QTimer`` is
+            created when omitted. It must provide ``start(msec)``,
+            ``stop()`` and a ``timeout`` signal.
+        """
+        self._krita = krita
+        self._resolve_callback = resolve_callback
+        self._logger = logger
+        self._delay = delay
+
+        if timer is None:
+            timer = QtCore.QTimer()
+            timer.setSingleShot(True)
+        self._timer = timer
+        self._timer.timeout.connect(self._flush)
+
+        self._generation = 0
+        self._last_path = None
+        self._watched_windows = []
+        self._active = False
+
+    def start(self):
+        """
+        Starts listening to Krita's notifications.
+        """
+        if self._active:
+            return
+
+        notifier = self._krita.notifier()
+        notifier.setActive(True)
+        notifier.imageCreated.connect(self.notify)
+        notifier.imageClosed.connect(self._on_image_closed)
+        notifier.viewCreated.connect(self.notify)
+        notifier.viewClosed.connect(self.notify)
+        notifier.windowCreated.connect(self._watch_windows)
+        self._watch_windows()
+        self._active = True
+
+    def stop(self):
+        """
+        Stops listening to Krita's notifications and drops pending work.
+        """
+        if not self._active:
+            return
+
+        notifier = self._krita.notifier()
+        for (signal, slot) in (
+            (notifier.imageCreated, self.notify),
+            (notifier.imageClosed, self._on_image_closed),
+            (notifier.viewCreated, self.notify),
+            (notifier.viewClosed, self.notify),
+            (notifier.windowCreated, self._watch_windows),
+        ):
+            _disconnect(signal, slot)
+
+        for window in self._watched_windows:
+            _disconnect(window.activeViewChanged, self.notify)
+        self._watched_windows = []
+
+        self._timer.stop()
+        # invalidate whatever is still in flight
+        self._generation += 1
+        self._active = False
+
+    def notify(self, *args):
+        """
+        Records that the active document may have changed.
+
+        Accepts and ignores the arguments of the signals it is connected to.
+        """
+        self._generation += 1
+        # restarting the timer is what coalesces a burst of notifications
+        self._timer.start(self._delay)
+
+    def is_stale(self, generation):
+        """
+        Returns True if notifications arrived after the given generation.
+
+        :param int generation: Generation a resolution was started for.
+        """
+        return generation != self._generation
+
+    def applied(self, path):
+        """
+        Records that the context of a document was applied, so that it is
+        not resolved again until another document was active.
+
+        This is only called once the resolution completed: a resolution
+        dropped as stale must not prevent the next one for the same path.
+
+        :param str path: Path of the document.
+        """
+        self._last_path = path
+
+    def _flush(self):
+        """
+        Resolves the active document once a burst of notifications is over.
+        """
+        document = self._krita.activeDocument()
+        path = document.fileName() if document else None
+        if not path or path == self._last_path:
+            return
+
+        generation = self._generation
+        self._logger.debug("Active document changed to %s.", path)
+        self._resolve_callback(path, lambda: self.is_stale(generation))
+
+    def _on_image_closed(self, path):
+        """
+        Forgets the last resolved document when it gets closed.
+        """
+        if path == self._last_path:
+            self._last_path = None
+        self.notify()
+
+    def _watch_windows(self):
+        """
+        Listens to active view changes of windows not watched yet.
+        """
+        for window in self._krita.windows():
+            if window not in self._watched_windows:
+                window.activeViewChanged.connect(self.notify)
+                self._watched_windows.append(window)
+
+
+def _disconnect(signal, slot):
+    """
+    Disconnects a slot, ignoring slots that are not connected.
+    """
+    try:
+        signal.disconnect(slot)
+    except (TypeError, RuntimeError):
+        pass
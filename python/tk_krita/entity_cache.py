@@ -0,0 +1,353 @@
+"""
+Local cache of the Shotgun entities of the current context, in SQLite.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bump this whenever the schema of the cache changes.
+SCHEMA_VERSION = 2
+
+# Number of events read from Shotgun at once when invalidating entities.
+EVENT_PAGE_SIZE = 500
+
+# Number of events read at most when invalidating entities. When more
+# happened since the last sync, the whole cache is forgotten instead.
+EVENT_BACKLOG_LIMIT = 5000
+
+# Key of the JSON objects standing for a datetime, see _encode_value.
+DATETIME_KEY = "__datetime__"
+
+
+class _UTC(datetime.tzinfo):
+    """
+    UTC time zone, of the datetimes read from the cache.
+    """
+
+    def utcoffset(self, value):
+        return datetime.timedelta(0)
+
+    def dst(self, value):
+        return datetime.timedelta(0)
+
+    def tzname(self, value):
+        return "UTC"
+
+
+UTC = _UTC()
+
+
+class EntityCache(object):
+    """
+    Read-through cache of Shotgun entity fields, kept in a SQLite database
+    shared by the Krita sessions of a project.
+
+    Every field of an entity is stored on its own with the time it was
+    fetched, so asking for fields that aren't cached only queries Shotgun
+    for those. Fields are fetched again once older than the time to live,
+    or as soon as Shotgun's event log reports a change of their entity.
+
+    The cache can be used from any thread, each thread getting its own
+    database connection. Shotgun connections are not shared between
+    threads either, ``connect`` is called on the thread needing one.
+    """
+
+    def __init__(self, path, connect, logger, ttl=600, clock=None):
+        """
+        :param str path: Path to the database file.
+        :param connect: Callable returning a Shotgun connection for the
+            calling thread.
+        :param logger: Logger to report to.
+        :param float ttl: Seconds after which cached fields are fetched again.
+        :param clock: Function returning the current time in seconds,
+            ``time.time`` when omitted.
+        """
+        self._path = path
+        self._connect = connect
+        self._logger = logger
+        self.ttl = ttl
+        self._clock = clock or time.time
+        self._local = threading.local()
+        self._setup()
+
+    def find_one(self, entity_type, entity_id, fields):
+        """
+        Returns fields of an entity, from the cache when they are fresh and
+        from Shotgun otherwise, like ``Shotgun.find_one``.
+
+        :param str entity_type: Type of the entity, e.g. ``Shot``.
+        :param int entity_id: Id of the entity.
+        :param fields: Names of the fields to return.
+        :returns: Dictionary with the ``type``, ``id`` and the fields of the
+            entity, None if Shotgun doesn't have it.
+        """
+        fields = list(fields)
+        entity = self.get(entity_type, entity_id, fields)
+        missing = [field for field in fields if field not in entity]
+        if not missing:
+            return entity
+
+        fetched = self._connect().find_one(entity_type, [["id", "is", entity_id]], missing)
+        if fetched is None:
+            return None
+
+        self.store(fetched, missing)
+        entity.update((field, fetched.get(field)) for field in missing)
+        return entity
+
+    def get(self, entity_type, entity_id, fields):
+        """
+        Returns the fresh cached fields of an entity, without querying
+        Shotgun.
+
+        :returns: Dictionary with the ``type``, ``id`` and the cached fields
+            of the entity, the missing and expired ones left out.
+        """
+        entity = {"type": entity_type, "id": entity_id}
+        fields = list(fields)
+        if not fields:
+            return entity
+
+        rows = self._connection().execute(
+            "SELECT field, value FROM fields WHERE entity_type = ? AND entity_id = ? AND fetched >= ? "
+            "AND field IN (%s)" % ", ".join("?" * len(fields)),
+            [entity_type, entity_id, self._clock() - self.ttl] + fields
+        )
+        entity.update((field, _decode_value(value)) for (field, value) in rows)
+        return entity
+
+    def store(self, entity, fields=None):
+        """
+        Caches fields of an entity returned by Shotgun. Datetimes are read
+        back in UTC, other values JSON can't hold are cached as strings.
+
+        :param dict entity: Entity with its ``type`` and ``id``.
+        :param fields: Names of the fields to cache, all the fields of the
+            entity when omitted.
+        """
+        if fields is None:
+            fields = [field for field in entity if field not in ("type", "id")]
+        fetched = self._clock()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO fields (entity_type, entity_id, field, value, fetched) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (entity["type"], entity["id"], field, _encode_value(entity.get(field)), fetched)
+                    for field in fields
+                ]
+            )
+
+    def prefetch(self, entities, fields_by_type):
+        """
+        Fetches the fields of entities that aren't cached, one Shotgun query
+        per entity type.
+
+        :param entities: Entity dictionaries with a ``type`` and an ``id``,
+            e.g. the project, entity, step and task of a context. None
+            values are skipped.
+        :param dict fields_by_type: Names of the fields to fetch by entity
+            type. Entities of other types are skipped.
+        :returns: Number of entities fetched from Shotgun.
+        """
+        ids_by_type = {}
+        for entity in entities:
+            if not entity or entity.get("type") not in fields_by_type:
+                continue
+            fields = fields_by_type[entity["type"]]
+            cached = self.get(entity["type"], entity["id"], fields)
+            if len(cached) < len(fields) + 2:
+                ids_by_type.setdefault(entity["type"], set()).add(entity["id"])
+
+        count = 0
+        for (entity_type, ids) in ids_by_type.items():
+            fields = list(fields_by_type[entity_type])
+            results = self._connect().find(entity_type, [["id", "in", sorted(ids)]], fields)
+            for result in results:
+                self.store(result, fields)
+            count += len(results)
+        return count
+
+    def invalidate(self, entity_type=None, entity_id=None):
+        """
+        Forgets the cached fields of an entity, of all the entities of a type,
+        or everything.
+
+        :param str entity_type: Type of the entities to forget, all of them
+            when omitted.
+        :param int entity_id: Id of the entity to forget, all the entities
+            of the type when omitted.
+        """
+        query = "DELETE FROM fields"
+        values = []
+        if entity_type is not None:
+            query += " WHERE entity_type = ?"
+            values.append(entity_type)
+            if entity_id is not None:
+                query += " AND entity_id = ?"
+                values.append(entity_id)
+        connection = self._connection()
+        with connection:
+            connection.execute(query, values)
+
+    def sync_events(self, project=None, max_events=EVENT_BACKLOG_LIMIT):
+        """
+        Forgets the entities Shotgun's event log reports as changed since
+        the last call.
+
+        The first call only records where the event log is, forgetting
+        everything since what happened before can't be known. The same goes
+        when more than ``max_events`` events happened since the last call,
+        reading them all would take longer than fetching the entities again.
+
+        :param dict project: Project to read the events of, the whole site
+            when omitted.
+        :param int max_events: Number of events to read at most.
+        :returns: Number of events read.
+        """
+        connection = self._connection()
+        shotgun = self._connect()
+        last_id = self._get_meta("last_event_id")
+        filters = [["project", "is", project]] if project else []
+
+        if last_id is None:
+            self._skip_events(shotgun, filters)
+            return 0
+
+        count = 0
+        while True:
+            if count >= max_events:
+                self._logger.debug(
+                    "More than %d Shotgun events since the last sync, forgetting all the cached entities.",
+                    max_events
+                )
+                self._skip_events(shotgun, filters)
+                return count
+            events = shotgun.find(
+                "EventLogEntry",
+                filters + [["id", "greater_than", last_id]],
+                ["entity", "event_type"],
+                order=[{"field_name": "id", "direction": "asc"}],
+                limit=EVENT_PAGE_SIZE,
+            )
+            with connection:
+                for event in events:
+                    entity = event.get("entity")
+                    if entity:
+                        connection.execute(
+                            "DELETE FROM fields WHERE entity_type = ? AND entity_id = ?",
+                            (entity["type"], entity["id"])
+                        )
+            if events:
+                last_id = events[-1]["id"]
+                count += len(events)
+                self._set_meta("last_event_id", last_id)
+            if len(events) < EVENT_PAGE_SIZE:
+                return count
+
+    def _skip_events(self, shotgun, filters):
+        """
+        Forgets everything and records the latest event as the last one read.
+        """
+        latest = shotgun.find_one(
+            "EventLogEntry", filters, ["id"], order=[{"field_name": "id", "direction": "desc"}]
+        )
+        self.invalidate()
+        self._set_meta("last_event_id", latest["id"] if latest else 0)
+
+    def prune(self):
+        """
+        Deletes the expired fields from the database.
+
+        :returns: Number of fields deleted.
+        """
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute("DELETE FROM fields WHERE fetched < ?", (self._clock() - self.ttl,))
+        return cursor.rowcount
+
+    def close(self):
+        """
+        Closes the connection of the calling thread.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _connection(self):
+        """
+        Returns the database connection of the calling thread.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=10.0)
+            self._local.connection = connection
+        return connection
+
+    def _setup(self):
+        """
+        Creates the database, starting over when its schema is outdated.
+        """
+        folder = os.path.dirname(self._path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        connection = self._connection()
+        # readers don't wait for the other sessions writing
+        connection.execute("PRAGMA journal_mode = WAL")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        with connection:
+            if version != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS fields")
+                connection.execute("DROP TABLE IF EXISTS meta")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fields ("
+                "entity_type TEXT, entity_id INTEGER, field TEXT, value TEXT, fetched REAL, "
+                "PRIMARY KEY (entity_type, entity_id, field))"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def _get_meta(self, key):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key, value):
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def _encode_value(value):
+    """
+    Returns a field value as JSON, datetimes as objects holding their UTC
+    time so that they can be read back as datetimes.
+    """
+    def default(value):
+        if isinstance(value, datetime.datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(UTC).replace(tzinfo=None)
+                return {DATETIME_KEY: value.strftime("%Y-%m-%dT%H:%M:%S.%f"), "utc": True}
+            return {DATETIME_KEY: value.strftime("%Y-%m-%dT%H:%M:%S.%f"), "utc": False}
+        return str(value)
+
+    return json.dumps(value, default=default)
+
+
+def _decode_value(data):
+    """
+    Reads a field value written by :func:`_encode_value`.
+    """
+    def object_hook(obj):
+        if DATETIME_KEY in obj:
+            value = datetime.datetime.strptime(obj[DATETIME_KEY], "%Y-%m-%dT%H:%M:%S.%f")
+            return value.replace(tzinfo=UTC) if obj.get("utc") else value
+        return obj
+
+    return json.loads(data, object_hook=object_hook)
@@ -0,0 +1,252 @@
+"""
+Processing of Krita documents without Krita, reading ``.kra`` archives as
+zip files.
+
+A ``.kra`` file is a zip archive holding the document description in
+``maindoc.xml``, the flattened image in ``mergedimage.png`` and a small
+``preview.png``, which is all a pipeline job needs most of the time. The
+members are streamed out of the archive, nothing else gets extracted.
+"""
+
+import collections
+import multiprocessing
+import os
+import shutil
+import struct
+import time
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+MAINDOC = "maindoc.xml"
+MERGED_IMAGE = "mergedimage.png"
+PREVIEW = "preview.png"
+
+# Outcome of a job for one file. ``result`` is what the job returned, None
+# when it raised ``error``.
+FileResult = collections.namedtuple("FileResult", "path result error latency")
+
+# Outcome of a batch, see :func:`process_files`.
+BatchReport = collections.namedtuple(
+    "BatchReport", "results files failed duration throughput bytes_per_second latency"
+)
+
+
+def png_size(handle):
+    """
+    Returns the dimensions of a PNG image from its header.
+
+    :param handle: File object positioned at the start of the image.
+    :returns: Tuple of the width and height, None if it isn't a PNG image.
+    """
+    header = handle.read(24)
+    if len(header) < 24 or header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def read_maindoc(handle):
+    """
+    Reads the document attributes and layers from a ``maindoc.xml`` stream,
+    without keeping the whole tree in memory.
+
+    :param handle: File object of ``maindoc.xml``.
+    :returns: Dictionary with the ``image`` attributes and the list of
+        ``layers``, each the attributes of a layer.
+    """
+    image = {}
+    layers = []
+    for (_, element) in ElementTree.iterparse(handle, events=("end",)):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "layer":
+            layers.append(dict(element.attrib))
+        elif tag == "IMAGE":
+            image = dict(element.attrib)
+        element.clear()
+    return {"image": image, "layers": layers}
+
+
+def read_metadata(path):
+    """
+    Reads the metadata of a ``.kra`` file.
+
+    :param str path: Path to the file.
+    :returns: Dictionary with the ``width``, ``height``, ``color_space``,
+        ``resolution``, ``layer_count`` and ``layers`` names of the document,
+        and the dimensions of its ``merged_image`` and ``preview``, None if
+        the archive doesn't have them.
+    """
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(MAINDOC) as handle:
+            maindoc = read_maindoc(handle)
+        merged_image = _member_png_size(archive, MERGED_IMAGE)
+        preview = _member_png_size(archive, PREVIEW)
+
+    image = maindoc["image"]
+    return {
+        "width": int(image.get("width", 0)),
+        "height": int(image.get("height", 0)),
+        "color_space": image.get("colorspacename"),
+        "resolution": (float(image.get("x-res", 0)), float(image.get("y-res", 0))),
+        "layer_count": len(maindoc["layers"]),
+        "layers": [layer.get("name") for layer in maindoc["layers"]],
+        "merged_image": merged_image,
+        "preview": preview,
+    }
+
+
+def extract_member(path, member, destination):
+    """
+    Copies a member of a ``.kra`` file, e.g. :data:`PREVIEW`, to a file.
+
+    :param str path: Path to the ``.kra`` file.
+    :param str member: Name of the member in the archive.
+    :param str destination: Path of the file to write.
+    :returns: The destination path.
+    :raises KeyError: If the archive doesn't have the member.
+    """
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(member) as source:
+            with open(destination, "wb") as target:
+                shutil.copyfileobj(source, target)
+    return destination
+
+
+def extract_thumbnail(path, folder):
+    """
+    Extracts the preview of a ``.kra`` file, falling back to the merged
+    image when there is no preview.
+
+    :param str path: Path to the ``.kra`` file.
+    :param str folder: Folder to write ``<file name>.png`` in.
+    :returns: The path of the thumbnail.
+    """
+    destination = os.path.join(folder, "%s.png" % os.path.splitext(os.path.basename(path))[0])
+    try:
+        return extract_member(path, PREVIEW, destination)
+    except KeyError:
+        return extract_member(path, MERGED_IMAGE, destination)
+
+
+def process_files(paths, job=read_metadata, processes=None, use_threads=None, chunksize=4):
+    """
+    Runs a job on many ``.kra`` files in a pool and reports how long it took.
+
+    By default jobs run in forked processes where the platform forks, and in
+    threads elsewhere. Forked processes inherit the modules already loaded,
+    including this one when Toolkit loaded it under a name that can't be
+    imported again. Spawned processes, e.g. on Windows, would have to import
+    this module and the job by name, so they are only used when asked for
+    with ``use_threads=False``. Jobs sent to processes must be picklable:
+    functions of a module, or ``functools.partial`` objects of them. Inside
+    Krita, new processes would be Krita itself, so threads must be used.
+
+    :param paths: Paths to the files.
+    :param job: Callable taking a path. :func:`read_metadata` when omitted.
+    :param int processes: Size of the pool, the number of CPUs when omitted.
+    :param use_threads: Whether to use a thread pool rather than a process
+        pool, None to use forked processes when possible and threads
+        otherwise.
+    :param int chunksize: Number of files handed to a worker at once.
+    :returns: :class:`BatchReport`, with the :class:`FileResult` of every
+        file in ``results``, the number of ``files`` and ``failed`` ones,
+        the ``duration`` of the batch in seconds, the ``throughput`` in files
+        per second, the ``bytes_per_second`` read and ``latency`` statistics.
+    """
+    paths = list(paths)
+    pool = _make_pool(processes or multiprocessing.cpu_count(), use_threads)
+
+    start = time.time()
+    try:
+        results = list(pool.imap_unordered(_RunJob(job), paths, chunksize))
+    finally:
+        pool.close()
+        pool.join()
+    duration = time.time() - start
+
+    total_bytes = 0
+    for path in paths:
+        try:
+            total_bytes += os.path.getsize(path)
+        except OSError:
+            pass
+
+    return BatchReport(
+        results=results,
+        files=len(results),
+        failed=len([result for result in results if result.error]),
+        duration=duration,
+        throughput=len(results) / duration if duration else 0.0,
+        bytes_per_second=total_bytes / duration if duration else 0.0,
+        latency=latency_statistics([result.latency for result in results]),
+    )
+
+
+def latency_statistics(latencies):
+    """
+    Returns statistics of per file latencies.
+
+    :param latencies: Durations in seconds.
+    :returns: Dictionary with the ``min``, ``median``, ``p95``, ``max`` and
+        ``mean``, all None without latencies.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return dict.fromkeys(("min", "median", "p95", "max", "mean"))
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "min": latencies[0],
+        "median": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": latencies[-1],
+        "mean": sum(latencies) / len(latencies),
+    }
+
+
+def _make_pool(processes, use_threads):
+    """
+    Returns the pool :func:`process_files` runs jobs in.
+    """
+    if use_threads:
+        return ThreadPool(processes)
+    if use_threads is not None:
+        return multiprocessing.Pool(processes)
+
+    if not hasattr(multiprocessing, "get_context"):
+        # Python 2 forks on every platform but Windows
+        return multiprocessing.Pool(processes) if os.name == "posix" else ThreadPool(processes)
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork").Pool(processes)
+    return ThreadPool(processes)
+
+
+class _RunJob(object):
+    """
+    Picklable wrapper timing a job and catching its errors, so that one bad
+    file doesn't stop the batch.
+    """
+
+    def __init__(self, job):
+        self._job = job
+
+    def __call__(self, path):
+        start = time.time()
+        try:
+            result = self._job(path)
+        except Exception as e:
+            return FileResult(path, None, "%s: %s" % (e.__class__.__name__, e), time.time() - start)
+        return FileResult(path, result, None, time.time() - start)
+
+
+def _member_png_size(archive, member):
+    """
+    Returns the dimensions of a PNG member of an archive, None if missing.
+    """
+    try:
+        with archive.open(member) as handle:
+            return png_size(handle)
+    except KeyError:
+        return None
@@ -0,0 +1,288 @@
+"""
+Export of the layers of a document, writing only the layers that changed.
+"""
+
+import collections
+import hashlib
+import os
+import re
+import shutil
+import struct
+import time
+from multiprocessing.pool import ThreadPool
+
+# Result of :meth:`LayerExporter.export`, the exported files by layer name
+# and the number of layers written and reused from the cache.
+ExportResult = collections.namedtuple("ExportResult", "files written reused")
+
+# Characters replaced in layer names to make file names out of them.
+_UNSAFE_CHARACTERS = re.compile(r"[^\w\-. ]+")
+
+
+def layer_hash(header, data):
+    """
+    Returns the content hash of a layer.
+
+    :param tuple header: Color model, color depth, horizontal and vertical
+        resolutions of the document and bounds of the layer.
+    :param bytes data: Pixels of the layer within its bounds.
+    :returns: Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    digest.update(("%s/%s/" % header[:2]).encode("utf-8"))
+    digest.update(struct.pack("<2d4q", *header[2:]))
+    # hashlib releases the GIL on large buffers, so layers are hashed in
+    # parallel while the next one is read.
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def save_node(node, path, x_resolution, y_resolution):
+    """
+    Writes a layer to a file with Krita, in the format of its extension.
+
+    :returns: True if the file was written.
+    """
+    from krita import InfoObject
+    return node.save(path, x_resolution, y_resolution, InfoObject())
+
+
+class LayerExporter(object):
+    """
+    Exports every layer of a document to its own file, through a content
+    addressed cache.
+
+    The layers are hashed from their color space, bounds, pixels and the
+    resolution of the document, which is saved in the files, and saved to
+    ``<cache root>/<hash[:2]>/<hash>.<extension>`` the first time their
+    content is seen. The files of an export are hard links to the cached
+    ones, or copies where links aren't supported, so exporting again only
+    writes the layers that changed.
+
+    Cached files are touched whenever an export uses them. Once an export
+    wrote new files, the ones unused for longer than ``max_age`` are
+    deleted, then the least recently used ones while the cache is larger
+    than ``max_size``. Exported files are left alone, hard links keep
+    their content.
+
+    Reading the pixels and saving with Krita happens on the calling
+    thread, which must be the main thread in Krita; only the hashing uses
+    the worker threads. Nodes only need the ``name``, ``type``,
+    ``childNodes``, ``bounds``, ``colorModel``, ``colorDepth`` and
+    ``pixelData`` methods of Krita's ``Node`` for the hashing, and saving
+    goes through ``writer``, so any object providing them can be exported.
+    """
+
+    def __init__(self, cache_root, logger, max_workers=4, writer=None, max_size=None, max_age=None):
+        """
+        :param str cache_root: Folder of the cached layer files.
+        :param logger: Logger to report to.
+        :param int max_workers: Number of threads hashing layers.
+        :param writer: Callable taking a node, a path and the horizontal and
+            vertical resolutions, writing the layer and returning True on
+            success. :func:`save_node` when omitted.
+        :param int max_size: Bytes the cached files may take, unlimited when
+            None.
+        :param float max_age: Seconds a cached file is kept without being
+            used, forever when None.
+        """
+        self._cache_root = cache_root
+        self._logger = logger
+        self._max_workers = max_workers
+        self._writer = writer or save_node
+        self._max_size = max_size
+        self._max_age = max_age
+
+    def export(self, document, folder, extension="png"):
+        """
+        Exports the layers of a document.
+
+        :param document: Krita ``Document``.
+        :param str folder: Folder to write the layer files to, created if
+            needed.
+        :param str extension: Extension of the files, which determines their
+            format.
+        :returns: :class:`ExportResult`.
+        :raises IOError: If a layer can't be written.
+        """
+        layers = self.hash_layers(document)
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        files = collections.OrderedDict()
+        written = 0
+        for (name, node, digest) in layers:
+            cached_path = self._cached_path(digest, extension)
+            if os.path.exists(cached_path):
+                # the time of last use, for the eviction
+                os.utime(cached_path, None)
+            else:
+                self._write(node, cached_path, document)
+                written += 1
+
+            path = os.path.join(folder, "%s.%s" % (name, extension))
+            _link(cached_path, path)
+            files[name] = path
+
+        self._logger.debug(
+            "Exported %d layers to %s, %d written and %d from the cache.",
+            len(files), folder, written, len(files) - written
+        )
+        if written:
+            self.prune()
+        return ExportResult(files, written, len(files) - written)
+
+    def prune(self):
+        """
+        Deletes the cached files unused for longer than the maximum age, then
+        the least recently used ones until the cache fits its maximum size.
+
+        :returns: Number of files deleted.
+        """
+        if self._max_size is None and self._max_age is None:
+            return 0
+
+        entries = []
+        for (folder, _, file_names) in os.walk(self._cache_root):
+            for file_name in file_names:
+                path = os.path.join(folder, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        # least recently used first
+        entries.sort()
+
+        expired = 0
+        if self._max_age is not None:
+            oldest = time.time() - self._max_age
+            while expired < len(entries) and entries[expired][0] < oldest:
+                expired += 1
+
+        total = sum(size for (_, size, _) in entries[expired:])
+        evicted = expired
+        if self._max_size is not None:
+            while evicted < len(entries) and total > self._max_size:
+                total -= entries[evicted][1]
+                evicted += 1
+
+        deleted = 0
+        for (_, _, path) in entries[:evicted]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            deleted += 1
+        if deleted:
+            self._logger.debug("Evicted %d layers from the cache %s.", deleted, self._cache_root)
+        return deleted
+
+    def hash_layers(self, document):
+        """
+        Hashes the layers of a document.
+
+        :param document: Krita ``Document``.
+        :returns: List of tuples of a unique file name for the layer, the node
+            and its content hash, in stack order.
+        """
+        nodes = list(_layers(document.rootNode()))
+        names = _unique_names(node.name() for node in nodes)
+
+        pool = ThreadPool(self._max_workers)
+        try:
+            pending = collections.deque()
+            digests = []
+            for node in nodes:
+                bounds = node.bounds()
+                header = (
+                    node.colorModel(), node.colorDepth(), document.xRes(), document.yRes(),
+                    bounds.x(), bounds.y(), bounds.width(), bounds.height()
+                )
+                data = bytes(node.pixelData(bounds.x(), bounds.y(), bounds.width(), bounds.height()))
+                pending.append(pool.apply_async(layer_hash, (header, data)))
+
+                # hold the pixels of a few layers at most
+                if len(pending) > self._max_workers * 2:
+                    digests.append(pending.popleft().get())
+            digests.extend(result.get() for result in pending)
+        finally:
+            pool.close()
+            pool.join()
+
+        return list(zip(names, nodes, digests))
+
+    def _cached_path(self, digest, extension):
+        """
+        Returns the path of the cached file of a layer content.
+        """
+        return os.path.join(self._cache_root, digest[:2], "%s.%s" % (digest, extension))
+
+    def _write(self, node, path, document):
+        """
+        Writes a layer to the cache, through a temporary file so that an
+        interrupted export never leaves an incomplete file behind.
+        """
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # keep the extension, Krita picks the format from it
+        (root, extension) = os.path.splitext(path)
+        temporary_path = "%s.%d.tmp%s" % (root, os.getpid(), extension)
+        if not self._writer(node, temporary_path, document.xRes(), document.yRes()):
+            raise IOError("Failed to export layer %s to %s." % (node.name(), path))
+
+        if os.path.exists(path):
+            # another export got there first
+            os.remove(temporary_path)
+        else:
+            os.rename(temporary_path, path)
+
+
+def _layers(node):
+    """
+    Yields the layers below a node, groups excluded, bottom to top.
+    """
+    for child in node.childNodes():
+        if child.type() == "grouplayer":
+            for layer in _layers(child):
+                yield layer
+        else:
+            yield child
+
+
+def _unique_names(names):
+    """
+    Returns file names for layers, numbering the repeated ones.
+    """
+    unique = []
+    seen = set()
+    for name in names:
+        base = _UNSAFE_CHARACTERS.sub("_", name).strip() or "layer"
+        candidate = base
+        index = 1
+        while candidate.lower() in seen:
+            index += 1
+            candidate = "%s_%d" % (base, index)
+        seen.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+def _link(source, destination):
+    """
+    Makes a file point to the content of another one, with a hard link
+    when possible.
+    """
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+
+    try:
+        os.link(source, destination)
+    except (AttributeError, OSError):
+        # no hard links on this platform or across these volumes
+        shutil.copy2(source, destination)
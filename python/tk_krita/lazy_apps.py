@@ -0,0 +1,358 @@
+"""
+Deferred initialization of apps, until one of their commands is used.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import time
+
+# Bump this whenever the layout of the manifest file changes.
+MANIFEST_VERSION = 1
+
+# Methods Toolkit calls on every app, replaced on the apps whose
+# initialization is deferred.
+DEFERRED_METHODS = ("init_app", "post_engine_init", "destroy_app")
+
+
+def context_signature(context):
+    """
+    Returns the parts of a context the commands of apps commonly depend on,
+    the type of its entity and its step.
+    """
+    if context is None:
+        return None
+    return [(context.entity or {}).get("type"), (context.step or {}).get("id")]
+
+
+def app_signature(app, context=None):
+    """
+    Returns a key identifying an app instance along with its version,
+    settings and context, which decide the commands it registers.
+    """
+    data = json.dumps(
+        [app.instance_name, app.version, app.settings, context_signature(context)],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def serializable_properties(properties):
+    """
+    Returns the command properties that can be stored as JSON, without the
+    ``app`` the command belongs to.
+    """
+    result = {}
+    for (key, value) in properties.items():
+        if key == "app":
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        result[key] = value
+    return result
+
+
+class CommandManifest(object):
+    """
+    The commands app instances registered in earlier sessions, kept on disk
+    and discarded for an app when its version, settings or context change.
+    """
+
+    def __init__(self, path, logger):
+        """
+        :param str path: Path to the manifest file.
+        :param logger: Logger to report to.
+        """
+        self._path = path
+        self._logger = logger
+        # app instance name -> [signature, [[command name, properties], ...]]
+        self._apps = {}
+        self._dirty = False
+        self._load()
+
+    def commands(self, app, context=None):
+        """
+        Returns the commands an app registered last time it was initialized.
+
+        :param app: The app instance.
+        :param context: Context the app is initialized in.
+        :returns: List of ``(name, properties)`` tuples, None when the app
+            wasn't initialized with its current version and settings in a
+            similar context yet.
+        """
+        entry = self._apps.get(app.instance_name)
+        if not entry or entry[0] != app_signature(app, context):
+            return None
+        return [(name, dict(properties)) for (name, properties) in entry[1]]
+
+    def record(self, app, commands, context=None):
+        """
+        Remembers the commands an app registered.
+
+        :param app: The app instance.
+        :param dict commands: Command dictionaries by name, as registered
+            with the engine.
+        :param context: Context the app was initialized in.
+        """
+        entry = [
+            app_signature(app, context),
+            sorted(
+                [name, serializable_properties(command["properties"])]
+                for (name, command) in commands.items()
+            ),
+        ]
+        if self._apps.get(app.instance_name) != entry:
+            self._apps[app.instance_name] = entry
+            self._dirty = True
+
+    def save(self):
+        """
+        Writes the manifest if it changed. Failing to write it is not fatal,
+        the apps are initialized at startup next time.
+        """
+        if not self._dirty:
+            return
+
+        data = {"version": MANIFEST_VERSION, "apps": self._apps}
+        tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        try:
+            folder = os.path.dirname(self._path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(tmp_path, "w") as fh:
+                json.dump(data, fh)
+            try:
+                os.rename(tmp_path, self._path)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(self._path)
+                os.rename(tmp_path, self._path)
+        except (IOError, OSError) as e:
+            self._logger.debug("Could not write the command manifest %s: %s", self._path, e)
+            return
+
+        self._dirty = False
+
+    def _load(self):
+        """
+        Reads the manifest from disk, discarding it when it is unusable.
+        """
+        try:
+            with open(self._path, "r") as fh:
+                data = json.load(fh)
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            self._logger.debug("Ignoring corrupt command manifest %s: %s", self._path, e)
+            return
+
+        if data.get("version") == MANIFEST_VERSION:
+            self._apps = data.get("apps") or {}
+
+
+class LazyAppLoader(object):
+    """
+    Defers the initialization of apps until one of their commands runs.
+
+    Toolkit creates every app of the environment through
+    ``sgtk.platform.application.get_application`` and then calls its
+    ``init_app``, which is where apps import their modules and register
+    their commands. While installed, the loader wraps that function and,
+    for the apps whose commands are known from the :class:`CommandManifest`,
+    replaces ``init_app`` with the registration of stub commands. The menu
+    and ``run_at_startup`` work with the stubs, and the first stub called
+    initializes the app for real before running its actual command.
+
+    Only the initialization is deferred. ``get_application`` still runs for
+    every app, importing the ``app.py`` of its bundle and creating the app
+    object, which Toolkit needs to load the environment. What is saved is
+    the work apps do in ``init_app``, typically importing their own
+    modules and building their models.
+
+    Apps that never registered commands, or whose version, settings or
+    context changed since, are initialized at startup and their commands
+    recorded for the next session. The stubs of an app whose commands
+    aren't known for the context the engine changes to are replaced by its
+    actual commands, see :meth:`check_context`.
+    """
+
+    def __init__(self, engine, manifest, exclude=()):
+        """
+        :param engine: The engine loading the apps.
+        :param manifest: :class:`CommandManifest` of the commands to stub.
+        :param exclude: Names of the app instances always initialized at
+            startup, e.g. the ones other apps use directly.
+        """
+        self._engine = engine
+        self._manifest = manifest
+        self._exclude = set(exclude)
+        self._module = None
+        self._get_application = None
+        # app instance name -> (app, stub command names)
+        self._deferred = {}
+
+    @property
+    def deferred(self):
+        """
+        Names of the app instances not initialized yet.
+        """
+        return sorted(self._deferred)
+
+    def install(self):
+        """
+        Starts deferring the apps Toolkit creates.
+        """
+        if self._module is not None:
+            return
+
+        from sgtk.platform import application
+        self._module = application
+        self._get_application = application.get_application
+        application.get_application = self._wrap_get_application
+
+    def uninstall(self):
+        """
+        Stops deferring apps. The apps already deferred keep their stubs.
+        """
+        if self._module is None:
+            return
+
+        self._module.get_application = self._get_application
+        self._module = None
+        self._get_application = None
+
+    def record(self):
+        """
+        Records the commands of the apps initialized at startup, for the
+        next session.
+        """
+        commands_by_app = {}
+        for (name, command) in self._engine.commands.items():
+            app = command["properties"].get("app")
+            if app is not None and app.instance_name not in self._deferred:
+                commands_by_app.setdefault(app.instance_name, {})[name] = command
+
+        for (instance_name, app) in self._engine.apps.items():
+            if instance_name not in self._deferred:
+                self._manifest.record(app, commands_by_app.get(instance_name, {}), self._engine.context)
+        self._manifest.save()
+
+    def check_context(self):
+        """
+        Initializes the deferred apps whose commands aren't known for the
+        current context of the engine, called once the context changed.
+
+        :returns: Names of the app instances initialized.
+        """
+        initialized = []
+        for (instance_name, (app, _)) in sorted(self._deferred.items()):
+            if self._manifest.commands(app, self._engine.context) is None:
+                self.initialize(app)
+                initialized.append(instance_name)
+        return initialized
+
+    def initialize(self, app):
+        """
+        Initializes a deferred app, replacing its stub commands with the
+        ones it registers.
+
+        :returns: True if the app was initialized, False if it already was.
+        """
+        (app, stub_names) = self._deferred.pop(app.instance_name, (None, ()))
+        if app is None:
+            return False
+
+        start = time.time()
+        commands = self._engine.commands
+        command_index = self._engine.command_index
+        for name in stub_names:
+            commands.pop(name, None)
+            command_index.remove(name)
+
+        # back to the methods of the app class
+        for method_name in DEFERRED_METHODS:
+            app.__dict__.pop(method_name, None)
+
+        before = set(commands)
+        app.init_app()
+
+        registered = dict((name, commands[name]) for name in commands if name not in before)
+        for (name, command) in registered.items():
+            # Toolkit only fills the app in while it is loading the apps
+            if command["properties"].get("app") is None:
+                command_index.remove(name)
+                command["properties"]["app"] = app
+                command_index.add(name, command)
+
+        post_engine_init = getattr(app, "post_engine_init", None)
+        if post_engine_init:
+            post_engine_init()
+
+        self._manifest.record(app, registered, self._engine.context)
+        self._manifest.save()
+
+        if self._engine.menu_generator.is_built():
+            self._engine.menu_generator.update()
+
+        self._engine.metrics.observe("apps.lazy_init", time.time() - start)
+        self._engine.logger.debug("Initialized app %s in %.3fs.", app.instance_name, time.time() - start)
+        return True
+
+    def _wrap_get_application(self, *args, **kwargs):
+        """
+        Creates an app like Toolkit does, deferring its initialization when
+        its commands are known. The app is created either way, only its
+        ``init_app`` is replaced.
+        """
+        app = self._get_application(*args, **kwargs)
+        if app.instance_name in self._exclude:
+            return app
+
+        commands = self._manifest.commands(app, self._engine.context)
+        if commands:
+            app.init_app = functools.partial(self._register_stubs, app, commands)
+            app.post_engine_init = _do_nothing
+            app.destroy_app = _do_nothing
+        return app
+
+    def _register_stubs(self, app, commands):
+        """
+        Registers the stub commands of a deferred app, in place of its
+        ``init_app``.
+        """
+        for (name, properties) in commands:
+            properties["app"] = app
+            self._engine.register_command(
+                name,
+                functools.partial(self._run_stub, app, name, properties.get("short_name")),
+                properties
+            )
+        self._deferred[app.instance_name] = (app, [name for (name, _) in commands])
+
+    def _run_stub(self, app, name, short_name):
+        """
+        Initializes a deferred app and runs the command a stub stands for.
+
+        The stub has the name Toolkit gave the command in an earlier session,
+        which may have been prefixed to tell it from the command of another
+        app, so the command is looked up by its display name as well.
+        """
+        self.initialize(app)
+        command_index = self._engine.command_index
+        command = command_index.find(app.instance_name, name)
+        if command is None and short_name:
+            command = command_index.find(app.instance_name, short_name)
+        if command is None:
+            self._engine.logger.warning(
+                "App %s no longer registers the command %s.", app.instance_name, name
+            )
+            return None
+        return command["callback"]()
+
+
+def _do_nothing(*args, **kwargs):
+    pass
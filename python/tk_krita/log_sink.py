@@ -0,0 +1,184 @@
+"""
+Asynchronous output of the engine's log messages.
+"""
+
+import collections
+import logging
+import sys
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# A single record written from the logging thread, in the ring buffer.
+LogEntry = collections.namedtuple("LogEntry", "levelno created message")
+
+
+class LogSink(object):
+    """
+    Writes formatted log messages to a stream from a background thread.
+
+    Messages are queued by the thread that logs them and written in batches
+    by a writer thread, so logging never waits on the console. The most
+    recent messages are also kept in a ring buffer, for a log viewer to
+    display.
+
+    When the queue is full, which only happens when messages are produced
+    faster than the stream can take them, debug and info messages are
+    dropped while warnings and errors wait briefly for room. The number of
+    dropped messages is reported in the output once the writer catches up.
+    """
+
+    # Seconds a warning or error waits for room in a full queue before it
+    # is dropped as well.
+    FULL_QUEUE_TIMEOUT = 0.1
+
+    def __init__(self, stream=None, max_queue_size=10000, ring_size=1000, batch_size=256):
+        """
+        :param stream: File-like object to write to, ``sys.stdout`` at the
+            time of writing when omitted.
+        :param int max_queue_size: Number of messages that can wait to be
+            written.
+        :param int ring_size: Number of recent messages to keep in memory.
+        :param int batch_size: Maximum number of messages written at once.
+        """
+        self._stream = stream
+        self._queue = queue.Queue(max_queue_size)
+        self._ring = collections.deque(maxlen=ring_size)
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._dropped_total = 0
+        self._thread = None
+        # whether the writer was told to stop, it may still be writing
+        self._stopping = False
+
+    def start(self):
+        """
+        Starts the writer thread. While the writer :meth:`stop` gave up
+        waiting for is still writing, messages keep being written directly
+        and no other writer is started.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._write_loop, name="tk-krita log writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Writes the pending messages and stops the writer thread.
+
+        :param float timeout: Seconds to wait for the pending messages.
+        """
+        if not self._thread:
+            return
+
+        if not self._stopping:
+            self._stopping = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._thread = None
+            self._stopping = False
+
+    def write(self, levelno, created, message):
+        """
+        Queues a formatted message.
+
+        :param int levelno: Level of the record the message was formatted from.
+        :param float created: Creation time of that record.
+        :param str message: Formatted message.
+        """
+        if not self._thread or self._stopping:
+            # not started or stopped, write directly
+            self._write_batch([LogEntry(levelno, created, message)])
+            return
+
+        entry = LogEntry(levelno, created, message)
+        try:
+            self._queue.put_nowait(entry)
+            return
+        except queue.Full:
+            pass
+
+        if levelno >= logging.WARNING:
+            try:
+                self._queue.put(entry, timeout=self.FULL_QUEUE_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+        with self._lock:
+            self._dropped += 1
+            self._dropped_total += 1
+
+    def recent(self, count=None, min_level=logging.NOTSET):
+        """
+        Returns the most recently written messages.
+
+        :param int count: Maximum number of entries to return, all of them
+            when None.
+        :param int min_level: Only return entries of this level and above.
+        :returns: List of :class:`LogEntry`, oldest first.
+        """
+        entries = [entry for entry in list(self._ring) if entry.levelno >= min_level]
+        if count is not None:
+            entries = entries[-count:] if count else []
+        return entries
+
+    @property
+    def dropped(self):
+        """
+        Total number of messages dropped because the queue was full.
+        """
+        return self._dropped_total
+
+    def _write_loop(self):
+        """
+        Writes queued messages in batches until the sink is stopped.
+        """
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+
+            self._write_batch(batch)
+
+            if stopping:
+                return
+
+    def _write_batch(self, batch):
+        """
+        Writes a batch of entries to the stream and the ring buffer.
+        """
+        with self._lock:
+            dropped = self._dropped
+            self._dropped = 0
+
+        lines = [entry.message for entry in batch]
+        if dropped:
+            lines.append("Shotgun: %d log messages were dropped." % dropped)
+        if not lines:
+            return
+
+        self._ring.extend(batch)
+
+        stream = self._stream or sys.stdout
+        try:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except (IOError, OSError, ValueError):
+            # the console went away, there is nowhere left to report to
+            pass
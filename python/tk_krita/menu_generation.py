@@ -0,0 +1,402 @@
+"""
+Menu handling for the Krita engine.
+"""
+
+import os
+
+from sgtk.platform.qt import QtCore, QtGui
+
+# Object name of the Shotgun menu and of its action in Krita's menu bar.
+MENU_OBJECT_NAME = "shotgun"
+
+# Object name of the item shown while the integration is disabled.
+DISABLED_OBJECT_NAME = "shotgun_disabled"
+
+
+class MenuGenerator(object):
+    """
+    Owns the Shotgun menu in Krita's menu bar.
+
+    The generator keeps direct handles to the menu and to the action of
+    every command instead of looking them up in the menu bar. The menu
+    content is only built when the menu is about to be shown, and every
+    later update applies the difference between the registered commands
+    and the existing actions, so an unchanged command keeps its action.
+
+    Disabling the integration hides the command actions and shows a
+    single explanatory item, which makes toggling between both states
+    cheap regardless of the number of commands.
+    """
+
+    def __init__(self, engine, menu_name, disabled_callback):
+        """
+        :param engine: The engine owning the menu.
+        :param str menu_name: Title of the menu.
+        :param disabled_callback: Callable invoked when the disabled item is
+            triggered.
+        """
+        self._engine = engine
+        self._menu_name = menu_name
+        self._disabled_callback = disabled_callback
+
+        self._menu_bar = None
+        self._menu_action = None
+        self._menu = None
+        self._disabled_action = None
+        self._enabled = True
+
+        # Actions currently in each (sub)menu, keyed by menu key, then item
+        # key. Values are (signature, QAction) tuples.
+        self._items = {}
+        self._submenus = {}
+
+    ##########################################################################################
+    # public methods
+
+    def has_menu(self):
+        """
+        Returns True if the menu currently exists in the menu bar.
+        """
+        if self._menu_action is None:
+            return False
+
+        try:
+            self._menu_action.menu()
+        except RuntimeError:
+            # Krita deleted the menu along with its window.
+            self._forget_menu()
+            return False
+        return True
+
+    def create_menu(self):
+        """
+        Adds the (empty) menu to the menu bar if it isn't there yet.
+
+        A menu with the Shotgun object name that already exists, e.g. the
+        loading menu of the startup plugin, is adopted. The menu content is
+        built the first time it is shown.
+
+        :returns: True if the menu was created or adopted.
+        """
+        if self.has_menu():
+            return False
+
+        menu_bar = self._engine._get_dialog_parent().menuBar()
+
+        # Only look for an existing menu once, we keep a handle afterwards.
+        menu_action = None
+        for action in menu_bar.actions():
+            if action.objectName() == MENU_OBJECT_NAME and action.menu():
+                menu_action = action
+                break
+
+        if menu_action:
+            menu = menu_action.menu()
+            menu.setTitle(self._menu_name)
+            menu.clear()
+        else:
+            menu = QtGui.QMenu(self._menu_name, menu_bar)
+            menu.setObjectName(MENU_OBJECT_NAME)
+            menu_action = menu_bar.addMenu(menu)
+            menu_action.setObjectName(MENU_OBJECT_NAME)
+
+        self._menu_bar = menu_bar
+        self._menu_action = menu_action
+        self._menu = menu
+        self._items = {}
+        self._submenus = {}
+
+        self._disabled_action = QtGui.QAction("Sgtk is disabled.", menu)
+        self._disabled_action.setObjectName(DISABLED_OBJECT_NAME)
+        self._disabled_action.triggered.connect(self._disabled_callback)
+        self._disabled_action.setVisible(not self._enabled)
+        menu.addAction(self._disabled_action)
+
+        menu.aboutToShow.connect(self._on_about_to_show)
+        return True
+
+    def set_enabled(self, enabled):
+        """
+        Switches the menu between its regular and its disabled state.
+
+        :param bool enabled: Whether the integration is enabled.
+        :returns: True if the state changed.
+        """
+        if enabled == self._enabled:
+            return False
+
+        self._enabled = enabled
+        if self.has_menu():
+            for action in self._menu.actions():
+                action.setVisible(enabled)
+            self._disabled_action.setVisible(not enabled)
+        return True
+
+    def is_enabled(self):
+        """
+        Returns True unless the menu is in its disabled state.
+        """
+        return self._enabled
+
+    def is_built(self):
+        """
+        Returns True once the menu content was built, i.e. it was shown.
+        """
+        return bool(self._items)
+
+    def update(self):
+        """
+        Brings the menu content in line with the registered commands.
+
+        Only actions whose command was added, removed or changed are
+        touched. This is called automatically before the menu is shown.
+        """
+        if not self._enabled or not self.has_menu():
+            return
+
+        with self._engine.metrics.timer("menu.update"):
+            (top_level, submenus) = self._build_layout()
+
+            for (submenu_key, items) in submenus.items():
+                submenu = self._get_submenu(submenu_key)
+                self._sync(submenu_key, submenu, items)
+
+            self._sync(None, self._menu, top_level)
+
+            # drop the submenus that are no longer referenced from the menu
+            for submenu_key in list(self._submenus):
+                if submenu_key not in submenus:
+                    self._submenus.pop(submenu_key).deleteLater()
+                    self._items.pop(submenu_key, None)
+
+    def destroy(self):
+        """
+        Removes the menu from the menu bar.
+        """
+        if self.has_menu():
+            self._menu_bar.removeAction(self._menu_action)
+            self._menu.deleteLater()
+        self._forget_menu()
+
+    ##########################################################################################
+    # layout
+
+    def _build_layout(self):
+        """
+        Computes the desired menu content from the registered commands.
+
+        :returns: ``(top_level, submenus)`` tuple. ``top_level`` is a list of
+            ``(key, signature)`` tuples for the Shotgun menu, ``submenus``
+            maps submenu keys to such lists.
+        """
+        context_items = [
+            (("jump", "shotgun"), ("Jump to Shotgun",)),
+            (("jump", "filesystem"), ("Jump to File System",)),
+        ]
+        favourite_items = []
+        app_items = {}
+        app_names = {}
+
+        command_index = self._engine.command_index
+        context_command_names = command_index.names_for_type("context_menu")
+
+        for (command_name, command) in self._engine.commands.items():
+            properties = command["properties"]
+            app = properties.get("app")
+            app_instance_name = app.instance_name if app else None
+
+            if command_name in context_command_names:
+                context_items.append(
+                    (("command", command_name), ("command", command_name))
+                )
+                continue
+
+            app_name = app.display_name if app else "Other Items"
+            app_names[app_instance_name] = app_name
+            app_items.setdefault(app_instance_name, []).append(command_name)
+
+        for favourite in self._engine.get_setting("menu_favourites", []):
+            command_name = command_index.resolve_name(favourite["app_instance"], favourite["name"])
+            if command_name:
+                favourite_items.append(
+                    (("favourite", command_name), ("command", command_name))
+                )
+            else:
+                self._engine.logger.warning(
+                    "Menu favourite %s of app %s is not a known command.",
+                    favourite["name"], favourite["app_instance"]
+                )
+
+        top_level = [
+            (("context",), ("submenu", self._context_title())),
+            (("separator", 0), ("separator",)),
+        ]
+        if favourite_items:
+            top_level.extend(favourite_items)
+            top_level.append((("separator", 1), ("separator",)))
+
+        submenus = {("context",): context_items}
+
+        for app_instance_name in sorted(app_items, key=lambda name: app_names[name]):
+            command_names = sorted(app_items[app_instance_name])
+            if len(command_names) == 1:
+                top_level.append(
+                    (("command", command_names[0]), ("command", command_names[0]))
+                )
+            else:
+                submenu_key = ("app", app_instance_name)
+                top_level.append((submenu_key, ("submenu", app_names[app_instance_name])))
+                submenus[submenu_key] = [
+                    (("command", command_name), ("command", command_name))
+                    for command_name in command_names
+                ]
+
+        return (top_level, submenus)
+
+    def _context_title(self):
+        """
+        Returns the title of the context submenu.
+        """
+        return "%s" % self._engine.context
+
+    ##########################################################################################
+    # diffing
+
+    def _sync(self, menu_key, menu, desired):
+        """
+        Applies the difference between the existing and the desired actions
+        of a menu.
+
+        :param menu_key: Key of the menu, None for the Shotgun menu itself.
+        :param menu: QMenu to update.
+        :param list desired: List of ``(key, signature)`` tuples in order.
+        """
+        existing = self._items.get(menu_key, {})
+        desired_signatures = dict(desired)
+
+        current = {}
+        for (key, (signature, action)) in existing.items():
+            if desired_signatures.get(key) == signature:
+                current[key] = (signature, action)
+            elif signature[0] == "submenu" and desired_signatures.get(key, ("",))[0] == "submenu":
+                # same submenu with a new title
+                action.menu().setTitle(desired_signatures[key][1])
+                current[key] = (desired_signatures[key], action)
+            else:
+                menu.removeAction(action)
+                if signature[0] != "submenu":
+                    action.deleteLater()
+
+        ordered = []
+        for (key, signature) in desired:
+            if key not in current:
+                current[key] = (signature, self._create_action(key, signature, menu))
+            ordered.append(current[key][1])
+        self._items[menu_key] = current
+
+        if menu is self._menu:
+            # the disabled item always comes first
+            ordered.insert(0, self._disabled_action)
+
+        # Move the actions that are out of place, for an unchanged menu
+        # this is a single pass without any Qt modification.
+        actions = menu.actions()
+        for (index, action) in enumerate(ordered):
+            if index < len(actions) and actions[index] == action:
+                continue
+            if action in actions:
+                menu.removeAction(action)
+                actions = menu.actions()
+            before = actions[index] if index < len(actions) else None
+            menu.insertAction(before, action)
+            actions = menu.actions()
+
+    def _create_action(self, key, signature, menu):
+        """
+        Creates the action described by a layout entry.
+        """
+        kind = signature[0]
+
+        if kind == "separator":
+            action = QtGui.QAction(menu)
+            action.setSeparator(True)
+        elif kind == "submenu":
+            action = self._get_submenu(key).menuAction()
+            action.menu().setTitle(signature[1])
+        elif kind == "command":
+            command_name = signature[1]
+            action = QtGui.QAction(command_name, menu)
+            # Look the callback up when triggered, a context change replaces
+            # the callbacks without changing the menu.
+            action.triggered.connect(lambda checked=False: self._run_command(command_name))
+        elif key == ("jump", "shotgun"):
+            action = QtGui.QAction(signature[0], menu)
+            action.triggered.connect(self._jump_to_sg)
+        else:
+            action = QtGui.QAction(signature[0], menu)
+            action.triggered.connect(self._jump_to_fs)
+
+        action.setVisible(self._enabled)
+        return action
+
+    def _get_submenu(self, submenu_key):
+        """
+        Returns the QMenu of a submenu, creating it if needed.
+        """
+        submenu = self._submenus.get(submenu_key)
+        if submenu is None:
+            submenu = QtGui.QMenu(self._menu)
+            self._submenus[submenu_key] = submenu
+        return submenu
+
+    def _forget_menu(self):
+        """
+        Drops the handles to the menu and its actions.
+        """
+        self._menu_bar = None
+        self._menu_action = None
+        self._menu = None
+        self._disabled_action = None
+        self._items = {}
+        self._submenus = {}
+
+    ##########################################################################################
+    # callbacks
+
+    def _on_about_to_show(self):
+        """
+        Updates the menu right before it is shown.
+        """
+        self.update()
+
+    def _run_command(self, command_name):
+        """
+        Runs a registered command, logging any error it raises.
+        """
+        command = self._engine.commands.get(command_name)
+        if command is None:
+            self._engine.logger.warning("Command %s is no longer registered.", command_name)
+            return
+
+        metrics = self._engine.metrics
+        try:
+            with metrics.timer("commands.run"), metrics.timer("commands.run.%s" % command_name):
+                command["callback"]()
+        except Exception:
+            metrics.increment("commands.failed")
+            self._engine.logger.exception("Failed to run command %s.", command_name)
+
+    def _jump_to_sg(self):
+        """
+        Opens the current context in Shotgun.
+        """
+        url = self._engine.context.shotgun_url
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl(url))
+
+    def _jump_to_fs(self):
+        """
+        Opens the folders of the current context in the file browser.
+        """
+        for path in self._engine.context.filesystem_locations:
+            if os.path.isdir(path):
+                QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(path))
@@ -0,0 +1,253 @@
+"""
+Counters, histograms and timers of what the engine does during a session.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets, from 10 microseconds doubling up
+# to about three minutes, suited to durations in seconds. Larger values
+# land in a last, unbounded bucket.
+BUCKET_BOUNDS = tuple(0.00001 * 2 ** index for index in range(25))
+
+
+class _NullTimer(object):
+    """
+    Context manager doing nothing, handed out while metrics are disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    """
+    Context manager recording its duration in a histogram.
+    """
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = self._registry._clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe(self._name, self._registry._clock() - self._start)
+        return False
+
+
+class Histogram(object):
+    """
+    Distribution of observed values, in fixed buckets so that recording a
+    value never allocates.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, value):
+        """
+        Records a value.
+        """
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+
+    def percentile(self, fraction):
+        """
+        Estimates a percentile, as the upper bound of the bucket it falls in.
+
+        :param float fraction: Percentile between 0 and 1.
+        :returns: The estimate, None without values.
+        """
+        if not self.count:
+            return None
+
+        rank = fraction * self.count
+        seen = 0
+        for (index, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKET_BOUNDS[index], self.max) if index < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns the summary of the histogram.
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry(object):
+    """
+    Collects counters and histograms by name.
+
+    Timers are histograms of durations in seconds. While the registry is
+    disabled every method returns at once, so that instrumented code costs
+    next to nothing. The registry can be enabled and inspected at any time,
+    e.g. from Krita's scripter::
+
+        engine = sgtk.platform.current_engine()
+        engine.metrics.enabled = True
+        engine.metrics.snapshot()
+    """
+
+    def __init__(self, enabled=False, clock=None):
+        """
+        :param bool enabled: Whether metrics are recorded.
+        :param clock: Function returning the current time in seconds,
+            ``time.time`` when omitted.
+        """
+        self.enabled = enabled
+        self._clock = clock or time.time
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._started = self._clock()
+
+    def increment(self, name, value=1):
+        """
+        Adds to a counter.
+
+        :param str name: Name of the counter.
+        :param int value: Amount to add.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Records a value in a histogram.
+
+        :param str name: Name of the histogram.
+        :param float value: Value to record.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name):
+        """
+        Returns a context manager recording how long its block takes::
+
+            with metrics.timer("menu.update"):
+                ...
+
+        :param str name: Name of the histogram of durations.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name, func, *args, **kwargs):
+        """
+        Calls a function and records how long it took.
+
+        :param str name: Name of the histogram of durations.
+        :returns: What the function returned.
+        """
+        with self.timer(name):
+            return func(*args, **kwargs)
+
+    def counter(self, name):
+        """
+        Returns the value of a counter, 0 if it was never incremented.
+        """
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def histogram(self, name):
+        """
+        Returns the summary of a histogram, None if nothing was recorded.
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            return histogram.to_dict() if histogram else None
+
+    def snapshot(self):
+        """
+        Returns all the metrics.
+
+        :returns: Dictionary with the ``counters`` and the summary of the
+            ``histograms`` by name, and the number of seconds they were
+            collected over as ``duration``.
+        """
+        with self._lock:
+            return {
+                "duration": self._clock() - self._started,
+                "counters": dict(self._counters),
+                "histograms": dict(
+                    (name, histogram.to_dict()) for (name, histogram) in self._histograms.items()
+                ),
+            }
+
+    def reset(self):
+        """
+        Forgets every metric.
+        """
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started = self._clock()
+
+    def dump(self, path, metadata=None):
+        """
+        Writes a snapshot to a JSON file, replacing the previous one.
+
+        :param str path: Path of the file.
+        :param dict metadata: Extra values stored along, e.g. the engine
+            version, to compare sessions with.
+        """
+        data = dict(metadata or {})
+        data["time"] = self._clock()
+        data.update(self.snapshot())
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as fh:
+            json.dump(data, fh, indent=2, sort_keys=True)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Windows won't rename over an existing file.
+            os.remove(path)
+            os.rename(tmp_path, path)
@@ -0,0 +1,238 @@
+"""
+Pipeline work triggered by saving documents, run off Krita's UI thread.
+"""
+
+import collections
+import os
+import re
+import time
+
+from sgtk.platform.qt import QtCore
+
+# Group of the tasks running the save hooks on the task runner.
+SAVE_TASK_GROUP = "save_hooks"
+
+# Krita writes the autosave of ``folder/name.kra`` to
+# ``folder/.name.kra-autosave.kra``.
+AUTOSAVE_PATTERN = re.compile(r"^\.(?P<name>.+)-autosave\.kra$", re.IGNORECASE)
+
+# Outcome of running the hooks after one or more saves of a document.
+# ``saves`` is the number of saves coalesced into the job, ``autosave`` is
+# True when they were all autosaves, ``results`` and ``errors`` map the hook
+# names to what they returned or the error they raised, and ``duration`` is
+# the time the hooks took, in seconds.
+SaveResult = collections.namedtuple(
+    "SaveResult", "path saves autosave results errors duration"
+)
+
+
+def document_path(path):
+    """
+    Returns the path of the document a saved file belongs to, the document
+    itself for an autosave.
+
+    :param str path: Path of the saved file.
+    :returns: Tuple of the normalized document path and whether the file is
+        an autosave.
+    """
+    path = os.path.normpath(os.path.abspath(path))
+    (folder, file_name) = os.path.split(path)
+    match = AUTOSAVE_PATTERN.match(file_name)
+    if match:
+        return (os.path.join(folder, match.group("name")), True)
+    return (path, False)
+
+
+class SaveQueue(object):
+    """
+    Runs registered hooks when documents are saved, on the task runner.
+
+    Saves are queued per document. Every save restarts a single shot timer
+    and the queued documents are only handed to the hooks once saving went
+    quiet, so a burst of saves and autosaves of a document makes a single
+    job. A document saved again while its hooks are running is queued
+    again and processed once they completed, never twice at the same time.
+
+    Hooks are called on a worker thread as ``hook(path, saves, autosave)``
+    and must not touch Krita's API. Their results are handed to the
+    listeners on the main thread as a :class:`SaveResult`.
+
+    Without an event loop, e.g. in batch mode, the queue is synchronous:
+    the hooks run on the calling thread as soon as a document is saved.
+    """
+
+    def __init__(self, task_runner, logger, delay=2000, timer=None, synchronous=False):
+        """
+        :param task_runner: :class:`TaskRunner` running the hooks.
+        :param logger: Logger to report to.
+        :param int delay: Milliseconds without saves before the queued
+            documents are processed.
+        :param timer: Single shot timer to use, a ``QtCore.QTimer`` is
+            created when omitted. It must provide ``start(msec)``,
+            ``stop()`` and a ``timeout`` signal.
+        :param bool synchronous: Whether saves are processed at once, on
+            the calling thread, rather than from the timer and the task
+            runner.
+        """
+        self._task_runner = task_runner
+        self._logger = logger
+        self._delay = delay
+        self._synchronous = synchronous
+
+        if timer is None:
+            timer = QtCore.QTimer()
+            timer.setSingleShot(True)
+        self._timer = timer
+        self._timer.timeout.connect(self._flush)
+
+        self._hooks = collections.OrderedDict()
+        self._listeners = []
+        # document path -> [number of saves, whether all were autosaves]
+        self._queued = collections.OrderedDict()
+        # document path -> running task
+        self._running = {}
+
+    def register(self, name, hook):
+        """
+        Registers a hook, replacing the one registered under the same name.
+        Hooks run in the order they were first registered.
+
+        :param str name: Name of the hook, the key of its result.
+        :param hook: Callable taking the document path, the number of saves
+            and whether they were all autosaves.
+        """
+        self._hooks[name] = hook
+
+    def unregister(self, name):
+        """
+        Removes a hook.
+
+        :param str name: Name the hook was registered under.
+        """
+        self._hooks.pop(name, None)
+
+    def connect(self, listener):
+        """
+        Adds a listener, called on the main thread with the
+        :class:`SaveResult` of every job.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def disconnect(self, listener):
+        """
+        Removes a listener.
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def pending(self):
+        """
+        Returns the paths of the documents queued or being processed.
+        """
+        return sorted(set(self._queued) | set(self._running))
+
+    def notify(self, path):
+        """
+        Queues a saved file, called on the main thread, e.g. from Krita's
+        ``imageSaved`` notification.
+
+        :param str path: Path of the saved file.
+        """
+        if not path or not self._hooks:
+            return
+
+        (path, autosave) = document_path(path)
+        entry = self._queued.get(path)
+        if entry:
+            entry[0] += 1
+            entry[1] = entry[1] and autosave
+        else:
+            self._queued[path] = [1, autosave]
+
+        if self._synchronous:
+            self._flush()
+        else:
+            self._timer.start(self._delay)
+
+    def flush(self):
+        """
+        Processes the queued documents now rather than once saving went quiet.
+        """
+        self._timer.stop()
+        self._flush()
+
+    def stop(self):
+        """
+        Drops the queued documents and cancels the hooks that didn't start.
+        """
+        self._timer.stop()
+        if self._queued:
+            self._logger.debug("Dropping the save hooks of %d documents.", len(self._queued))
+        self._queued.clear()
+        self._task_runner.cancel_group(SAVE_TASK_GROUP)
+        self._running.clear()
+
+    def _flush(self):
+        """
+        Submits a job for each queued document whose hooks aren't running.
+        """
+        for path in list(self._queued):
+            if path in self._running:
+                # picked up again once the running job completed
+                continue
+            (saves, autosave) = self._queued.pop(path)
+            if self._synchronous:
+                self._on_done(_run_hooks(path, saves, autosave, list(self._hooks.items())))
+                continue
+            self._running[path] = self._task_runner.submit(
+                _run_hooks,
+                (path, saves, autosave, list(self._hooks.items())),
+                group=SAVE_TASK_GROUP,
+                callback=self._on_done,
+                errback=lambda error, path=path: self._on_failed(path, error),
+            )
+
+    def _on_done(self, result):
+        """
+        Hands the result of a job to the listeners, on the main thread.
+        """
+        self._running.pop(result.path, None)
+        for (name, error) in result.errors.items():
+            self._logger.warning("Save hook %s failed for %s: %s", name, result.path, error)
+
+        for listener in list(self._listeners):
+            try:
+                listener(result)
+            except Exception:
+                self._logger.exception("Save hook listener %r failed.", listener)
+
+        if result.path in self._queued:
+            self._timer.start(self._delay)
+
+    def _on_failed(self, path, error):
+        """
+        Reports a job that failed as a whole, which _run_hooks shouldn't allow.
+        """
+        self._running.pop(path, None)
+        self._logger.error("Failed to run the save hooks of %s: %s", path, error)
+        if path in self._queued:
+            self._timer.start(self._delay)
+
+
+def _run_hooks(path, saves, autosave, hooks):
+    """
+    Runs the hooks of a saved document in order, on a worker thread. The
+    error of a hook doesn't stop the next ones.
+
+    :returns: :class:`SaveResult`.
+    """
+    start = time.time()
+    results = {}
+    errors = {}
+    for (name, hook) in hooks:
+        try:
+            results[name] = hook(path, saves, autosave)
+        except Exception as e:
+            errors[name] = "%s: %s" % (e.__class__.__name__, e)
+    return SaveResult(path, saves, autosave, results, errors, time.time() - start)
@@ -0,0 +1,121 @@
+"""
+Scheduling of the commands listed in the run_at_startup setting.
+"""
+
+import heapq
+import itertools
+import time
+
+from sgtk.platform.qt import QtCore
+
+
+class StartupCommandScheduler(object):
+    """
+    Runs startup commands one at a time from Krita's event loop.
+
+    Every command runs from its own timer callback, which gives Qt a chance
+    to process pending events between two commands. Commands with a higher
+    priority run first, commands with the same priority run in the order
+    they were added.
+
+    The duration of every command is recorded in :attr:`timings` and a
+    warning is logged for commands going over the time budget.
+    """
+
+    def __init__(self, logger, budget=None, schedule=None):
+        """
+        :param logger: Logger to report timings to.
+        :param float budget: Seconds a command may take before a warning is
+            logged. No warnings are logged when None.
+        :param schedule: Callable invoked as ``schedule(msec, callback)`` to
+            run a callback from the event loop. Defaults to
+            ``QtCore.QTimer.singleShot``.
+        """
+        self._logger = logger
+        self._budget = budget
+        self._schedule = schedule or QtCore.QTimer.singleShot
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = False
+
+        # list of (label, seconds) tuples, in execution order
+        self.timings = []
+
+    def add(self, label, callback, priority=0):
+        """
+        Queues a command.
+
+        :param str label: Name of the command, used when reporting.
+        :param callback: Callable to run.
+        :param int priority: Commands with a higher priority run first.
+        """
+        heapq.heappush(self._queue, (-priority, next(self._counter), label, callback))
+
+    def start(self):
+        """
+        Starts running the queued commands from the event loop.
+        """
+        if self._queue and not self._running:
+            self._running = True
+            self._schedule(0, self._run_next)
+
+    def run(self):
+        """
+        Runs the queued commands at once, for when there is no event loop to
+        run them from, e.g. in batch mode.
+        """
+        if self._running:
+            return
+
+        while self._queue:
+            self._run_one()
+        self._report()
+
+    @property
+    def pending(self):
+        """
+        Number of commands that didn't run yet.
+        """
+        return len(self._queue)
+
+    def _run_next(self):
+        """
+        Runs the next command and schedules the one after it.
+        """
+        self._run_one()
+        if self._queue:
+            self._schedule(0, self._run_next)
+        else:
+            self._running = False
+            self._report()
+
+    def _run_one(self):
+        """
+        Runs the next command and records its duration.
+        """
+        (_, _, label, callback) = heapq.heappop(self._queue)
+
+        start = time.time()
+        try:
+            callback()
+        except Exception:
+            self._logger.exception("Startup command %s failed.", label)
+        duration = time.time() - start
+
+        self.timings.append((label, duration))
+        if self._budget is not None and duration > self._budget:
+            self._logger.warning(
+                "Startup command %s took %.3fs, over its %.3fs budget.",
+                label, duration, self._budget
+            )
+        else:
+            self._logger.debug("Startup command %s took %.3fs.", label, duration)
+
+    def _report(self):
+        """
+        Logs how long the commands took once they all ran.
+        """
+        self._logger.debug(
+            "Ran %d startup commands in %.3fs.",
+            len(self.timings), sum(duration for (_, duration) in self.timings)
+        )
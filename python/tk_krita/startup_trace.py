@@ -0,0 +1,143 @@
+"""
+Timing of the startup phases, from the launcher to the running engine.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+# Environment variables shared with the launcher and the startup plugin.
+LAUNCH_TIME_ENV_VAR = "SG_KRITA_LAUNCH_TIME"
+TRACE_SPANS_ENV_VAR = "SG_KRITA_STARTUP_TRACE"
+
+# Thread ids used to lay the spans out in the trace viewer.
+_CATEGORY_TIDS = {
+    "launcher": 1,
+    "krita": 2,
+    "plugin": 3,
+    "engine": 4,
+}
+
+
+class StartupTrace(object):
+    """
+    Collects the spans of the startup phases and writes them as a Chrome
+    trace (``chrome://tracing`` or https://ui.perfetto.dev).
+
+    The launcher and the startup plugin can't reach the engine directly,
+    so they pass their spans through the ``SG_KRITA_STARTUP_TRACE``
+    environment variable as a JSON list of
+    ``{"name": ..., "cat": ..., "start": ..., "end": ...}`` dictionaries,
+    with times in seconds since the epoch.
+    """
+
+    def __init__(self):
+        self._spans = []
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Creates a trace holding the spans recorded before the engine started.
+
+        :returns: :class:`StartupTrace` instance.
+        """
+        trace = cls()
+        try:
+            spans = json.loads(os.environ.get(TRACE_SPANS_ENV_VAR) or "[]")
+        except ValueError:
+            spans = []
+
+        for span in spans:
+            try:
+                trace.add_span(span["name"], span["start"], span["end"], span.get("cat", "krita"))
+            except (KeyError, TypeError):
+                continue
+        return trace
+
+    @property
+    def launch_time(self):
+        """
+        Time at which the launcher started Krita, or None if unknown.
+        """
+        try:
+            return float(os.environ[LAUNCH_TIME_ENV_VAR])
+        except (KeyError, ValueError):
+            return None
+
+    def add_span(self, name, start, end, category="engine"):
+        """
+        Records a finished phase.
+
+        :param str name: Name of the phase.
+        :param float start: Start time in seconds since the epoch.
+        :param float end: End time in seconds since the epoch.
+        :param str category: Part of the startup the phase belongs to, one
+            of ``launcher``, ``krita``, ``plugin`` or ``engine``.
+        """
+        self._spans.append((name, start, end, category))
+
+    @property
+    def spans(self):
+        """
+        List of the recorded ``(name, start, end, category)`` tuples.
+        """
+        return list(self._spans)
+
+    @contextlib.contextmanager
+    def span(self, name, category="engine"):
+        """
+        Context manager recording the phase running in its body.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.time(), category)
+
+    def to_chrome_trace(self, metadata=None):
+        """
+        Returns the trace in the Chrome trace event format.
+
+        :param dict metadata: Extra information stored along the events.
+        :returns: Dictionary ready to be serialized to JSON.
+        """
+        pid = os.getpid()
+        events = []
+        for (name, start, end, category) in sorted(self._spans, key=lambda span: span[1]):
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start * 1e6),
+                "dur": max(0, int((end - start) * 1e6)),
+                "pid": pid,
+                "tid": _CATEGORY_TIDS.get(category, 0),
+            })
+
+        data = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+        }
+        if metadata:
+            data["otherData"] = metadata
+        return data
+
+    def write(self, folder, metadata=None):
+        """
+        Writes the trace to a new file in a folder.
+
+        :param str folder: Folder to write the trace in, created if needed.
+        :param dict metadata: Extra information stored along the events.
+        :returns: Path to the written file.
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        path = os.path.join(
+            folder,
+            "startup_%s_%d.json" % (time.strftime("%Y%m%d_%H%M%S"), os.getpid())
+        )
+        with open(path, "w") as fh:
+            json.dump(self.to_chrome_trace(metadata), fh)
+        return path
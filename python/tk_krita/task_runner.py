@@ -0,0 +1,299 @@
+"""
+Background execution of blocking work on behalf of the engine and its apps.
+"""
+
+import heapq
+import itertools
+import sys
+import threading
+
+
+class TaskCancelled(Exception):
+    """
+    Raised by :meth:`Task.wait` when the task was cancelled.
+    """
+
+
+class Task(object):
+    """
+    Handle of a function submitted to a :class:`TaskRunner`.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, func, args, kwargs, priority, group, callback, errback, lock):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self.priority = priority
+        self.group = group
+        self._callback = callback
+        self._errback = errback
+        self._state = self.PENDING
+        self._cancel_requested = False
+        self._result = None
+        self._error = None
+        self._finished = threading.Event()
+        # the lock of the runner, held while a worker takes the task
+        self._lock = lock
+
+    @property
+    def state(self):
+        """
+        One of ``PENDING``, ``RUNNING``, ``DONE``, ``FAILED`` or ``CANCELLED``.
+        """
+        return self._state
+
+    @property
+    def cancelled(self):
+        """
+        True once the task was cancelled, a long running function can poll it
+        to stop early.
+        """
+        return self._cancel_requested
+
+    def cancel(self):
+        """
+        Cancels the task. A pending task never runs, the result of a running
+        one is discarded rather than delivered.
+
+        :returns: True if the function won't run, False if it is running or
+            already completed.
+        """
+        with self._lock:
+            if self._state in (self.DONE, self.FAILED, self.CANCELLED):
+                return False
+
+            self._cancel_requested = True
+            if self._state == self.RUNNING:
+                return False
+            self._state = self.CANCELLED
+        self._finished.set()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Waits for the task to complete, from any thread but the one delivering
+        the results.
+
+        :param float timeout: Seconds to wait, forever when None.
+        :returns: The value returned by the function.
+        :raises TaskCancelled: If the task was cancelled.
+        :raises: The exception raised by the function.
+        """
+        if not self._finished.wait(timeout) and not self._finished.is_set():
+            raise RuntimeError("Timed out waiting for task %r." % self)
+        if self._state == self.CANCELLED:
+            raise TaskCancelled()
+        if self._state == self.FAILED:
+            raise self._error[1]
+        return self._result
+
+    def _start(self):
+        """
+        Marks the task as running, called by a worker taking it with the lock
+        of the runner held.
+
+        :returns: False if the task was cancelled.
+        """
+        if self._cancel_requested:
+            return False
+        self._state = self.RUNNING
+        return True
+
+    def _run(self):
+        """
+        Runs the function in the calling thread, once :meth:`_start` marked
+        the task as running.
+        """
+        try:
+            self._result = self._func(*self._args, **self._kwargs)
+            state = self.DONE
+        except Exception:
+            self._error = sys.exc_info()
+            state = self.FAILED
+
+        with self._lock:
+            self._state = self.CANCELLED if self._cancel_requested else state
+        self._finished.set()
+
+    def _deliver(self):
+        """
+        Calls the callback or errback, on the thread the runner posts to.
+        """
+        if self._state == self.DONE and self._callback:
+            self._callback(self._result)
+        elif self._state == self.FAILED and self._errback:
+            self._errback(self._error[1])
+
+    def __repr__(self):
+        return "<Task %s %s>" % (getattr(self._func, "__name__", self._func), self._state)
+
+
+class TaskRunner(object):
+    """
+    Runs functions on a bounded pool of worker threads.
+
+    Pending tasks run by decreasing priority, then in submission order. The
+    callback or errback of a task is handed to ``post``, which the engine
+    sets to a function queueing it to the Qt main thread, so it can safely
+    touch the UI. Tasks submitted with a group can be cancelled together,
+    which is how a request superseding the previous one drops it.
+    """
+
+    def __init__(self, logger, post=None, max_workers=4):
+        """
+        :param logger: Logger to report failures without an errback to.
+        :param post: Callable taking a function and its arguments, queueing
+            the call to the thread results are delivered on. The results are
+            delivered on the worker thread when omitted.
+        :param int max_workers: Maximum number of worker threads, started as
+            work is submitted.
+        """
+        self._logger = logger
+        self._post = post
+        self._max_workers = max_workers
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._idle = 0
+        self._stopped = False
+
+    def submit(self, func, args=(), kwargs=None, priority=0, group=None, callback=None, errback=None):
+        """
+        Queues a function to run on a worker thread.
+
+        :param func: Function to run, it must not touch Qt widgets.
+        :param tuple args: Positional arguments of the function.
+        :param dict kwargs: Keyword arguments of the function.
+        :param int priority: Higher priorities run first.
+        :param str group: Optional name to cancel the task with :meth:`cancel_group`.
+        :param callback: Called with the function's result.
+        :param errback: Called with the exception the function raised, which
+            is logged when omitted.
+        :returns: The :class:`Task`.
+        """
+        task = Task(func, args, kwargs or {}, priority, group, callback, errback, self._condition)
+
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("The task runner was stopped.")
+
+            heapq.heappush(self._heap, (-priority, next(self._sequence), task))
+            # idle workers only leave the count once they woke up, so the
+            # tasks queued meanwhile are already taken
+            if len(self._heap) > self._idle and len(self._workers) < self._max_workers:
+                worker = threading.Thread(
+                    target=self._work, name="tk-krita task runner %d" % len(self._workers)
+                )
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify()
+
+        return task
+
+    def cancel_group(self, group):
+        """
+        Cancels the pending and running tasks of a group.
+
+        :param str group: Name given to :meth:`submit`.
+        :returns: Number of tasks cancelled before they ran.
+        """
+        with self._condition:
+            tasks = [entry[2] for entry in self._heap if entry[2].group == group]
+            tasks.extend(self._running(group))
+        return len([task for task in tasks if task.cancel()])
+
+    def pending(self):
+        """
+        Returns the number of tasks waiting for a worker.
+        """
+        with self._condition:
+            return len([entry for entry in self._heap if not entry[2].cancelled])
+
+    def stop(self, timeout=2.0):
+        """
+        Cancels the pending tasks and waits for the running ones. Results not
+        delivered yet are dropped.
+
+        :param float timeout: Seconds to wait for each worker.
+        """
+        with self._condition:
+            self._stopped = True
+            for entry in self._heap:
+                entry[2].cancel()
+            self._heap = []
+            self._condition.notify_all()
+            workers = self._workers
+            self._workers = []
+
+        for worker in workers:
+            worker.join(timeout)
+
+    def _running(self, group):
+        """
+        Returns the running tasks of a group, tracked on their worker thread.
+        """
+        return [
+            worker.task for worker in self._workers
+            if getattr(worker, "task", None) is not None and worker.task.group == group
+        ]
+
+    def _work(self):
+        """
+        Runs queued tasks until the runner is stopped.
+        """
+        worker = threading.current_thread()
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._heap and not self._stopped:
+                    self._condition.wait()
+                self._idle -= 1
+                if self._stopped:
+                    return
+                task = heapq.heappop(self._heap)[2]
+                # a task is cancelled while pending or while running, never
+                # in between
+                if not task._start():
+                    continue
+                worker.task = task
+
+            task._run()
+            worker.task = None
+            if not task.cancelled:
+                self._dispatch(task)
+
+    def _dispatch(self, task):
+        """
+        Hands the result of a completed task to the delivering thread.
+        """
+        if task.state == Task.FAILED and not task._errback:
+            self._logger.error(
+                "Background task %r failed: %s", task, task._error[1], exc_info=task._error
+            )
+            return
+
+        if self._post:
+            self._post(self._deliver, task)
+        else:
+            self._deliver(task)
+
+    def _deliver(self, task):
+        """
+        Delivers a result unless the task was cancelled or the runner stopped
+        since it completed.
+        """
+        if task.cancelled or self._stopped:
+            return
+
+        try:
+            task._deliver()
+        except Exception:
+            self._logger.exception("Failed to deliver the result of %r.", task)
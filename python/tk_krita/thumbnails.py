@@ -0,0 +1,245 @@
+"""
+Thumbnails of Krita documents, downsampled off the main thread and cached.
+"""
+
+import collections
+import os
+import time
+
+from sgtk.platform.qt import QtCore, QtGui
+
+try:
+    import numpy
+except ImportError:
+    # Krita doesn't always bundle NumPy, Qt does the whole resampling then.
+    numpy = None
+
+# Bytes per pixel of the projections that can be read directly, 8 bit RGBA
+# documents, whose pixel data is laid out like a 32 bit ARGB QImage.
+_BYTES_PER_PIXEL = 4
+
+
+def fit_size(width, height, size):
+    """
+    Returns the dimensions of an image scaled to fit a square.
+
+    :param int width: Width of the image.
+    :param int height: Height of the image.
+    :param int size: Side of the square, images smaller than it are kept
+        at their size.
+    :returns: Tuple of the width and height.
+    """
+    scale = min(1.0, float(size) / max(width, height, 1))
+    return (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+
+
+def downsample(data, width, height, sizes):
+    """
+    Downsamples the pixels of an 8 bit RGBA projection to several sizes.
+
+    With NumPy the pixels are first averaged over blocks of whole pixels,
+    which is where most of the reduction happens, and Qt smoothly scales
+    the much smaller result to the exact size. Each size is made from the
+    previous larger one.
+
+    :param bytes data: Pixels, as returned by ``Document.pixelData``.
+    :param int width: Width of the projection.
+    :param int height: Height of the projection.
+    :param sizes: Sides of the squares the thumbnails must fit.
+    :returns: Dictionary of the ``QImage`` thumbnails by size.
+    """
+    pixels = None
+    if numpy is not None:
+        pixels = numpy.frombuffer(data, numpy.uint8).reshape(height, width, _BYTES_PER_PIXEL)
+
+    thumbnails = {}
+    for size in sorted(set(sizes), reverse=True):
+        (target_width, target_height) = fit_size(width, height, size)
+
+        if pixels is not None:
+            factor = min(pixels.shape[1] // target_width, pixels.shape[0] // target_height)
+            if factor > 1:
+                pixels = _reduce(pixels, factor)
+            image = _to_image(pixels.tobytes(), pixels.shape[1], pixels.shape[0])
+        else:
+            image = _to_image(data, width, height)
+
+        if (image.width(), image.height()) != (target_width, target_height):
+            image = image.scaled(
+                target_width, target_height, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+            )
+        thumbnails[size] = image
+
+    return thumbnails
+
+
+def _reduce(pixels, factor):
+    """
+    Averages the pixels over square blocks of ``factor`` pixels, dropping the
+    incomplete blocks at the right and bottom edges.
+    """
+    height = pixels.shape[0] // factor
+    width = pixels.shape[1] // factor
+    blocks = pixels[:height * factor, :width * factor].reshape(
+        height, factor, width, factor, _BYTES_PER_PIXEL
+    )
+    return blocks.mean(axis=(1, 3), dtype=numpy.float32).round().astype(numpy.uint8)
+
+
+def _to_image(data, width, height):
+    """
+    Returns a ``QImage`` owning a copy of the pixels.
+    """
+    image = QtGui.QImage(data, width, height, width * _BYTES_PER_PIXEL, QtGui.QImage.Format_ARGB32)
+    return image.copy()
+
+
+class ThumbnailCache(object):
+    """
+    Produces thumbnails of documents and keeps the most recent ones.
+
+    The projection is read on the main thread, which is a copy in memory,
+    and downsampled on the task runner. Thumbnails are cached by file name
+    and state: the size and modification time of the saved file, the
+    dimensions of the image and whether it has unsaved changes. Krita
+    doesn't report individual edits, so the thumbnails of a modified
+    document are only reused for ``modified_max_age`` seconds. Unsaved
+    documents have no name to be cached by.
+    """
+
+    def __init__(self, task_runner, logger, max_entries=32, modified_max_age=5.0, clock=None):
+        """
+        :param task_runner: :class:`TaskRunner` downsampling the pixels.
+        :param logger: Logger to report to.
+        :param int max_entries: Number of documents to keep thumbnails of.
+        :param float modified_max_age: Seconds thumbnails of a document with
+            unsaved changes are reused for.
+        :param clock: Function returning the current time, ``time.time``
+            when omitted.
+        """
+        self._task_runner = task_runner
+        self._logger = logger
+        self._max_entries = max_entries
+        self._modified_max_age = modified_max_age
+        self._clock = clock or time.time
+        # file name -> (state, capture time, {size: QImage})
+        self._entries = collections.OrderedDict()
+
+    def request(self, document, sizes, callback, errback=None):
+        """
+        Requests thumbnails of a document.
+
+        :param document: Krita ``Document``.
+        :param sizes: Sides of the squares the thumbnails must fit.
+        :param callback: Called on the main thread with a dictionary of the
+            ``QImage`` thumbnails by size.
+        :param errback: Called on the main thread with the exception raised
+            while downsampling.
+        :returns: The :class:`Task` producing the thumbnails, None when they
+            were all cached and the callback was already called.
+        """
+        sizes = list(sizes)
+        key = document.fileName()
+        state = self._state(document) if key else None
+
+        thumbnails = {}
+        entry = self._entries.get(key) if key else None
+        if entry and entry[0] == state and not self._expired(state, entry[1]):
+            # most recently used last
+            self._entries[key] = self._entries.pop(key)
+            thumbnails = dict((size, entry[2][size]) for size in sizes if size in entry[2])
+            if len(thumbnails) == len(set(sizes)):
+                callback(thumbnails)
+                return None
+
+        missing = [size for size in sizes if size not in thumbnails]
+        captured = self._clock()
+        (function, args) = self._capture(document, missing)
+
+        def completed(result):
+            if key:
+                self._store(key, state, captured, result)
+            result.update(thumbnails)
+            callback(result)
+
+        return self._task_runner.submit(function, args, callback=completed, errback=errback)
+
+    def forget_document(self, file_name):
+        """
+        Drops the thumbnails of a document, when it gets closed.
+
+        :param str file_name: File name of the document.
+        """
+        self._entries.pop(file_name, None)
+
+    def clear(self):
+        """
+        Drops all the thumbnails.
+        """
+        self._entries.clear()
+
+    def _capture(self, document, sizes):
+        """
+        Reads the pixels of a document on the main thread.
+
+        :returns: Tuple of the function making the thumbnails on a worker
+            thread and its arguments.
+        """
+        width = document.width()
+        height = document.height()
+
+        if document.colorModel() == "RGBA" and document.colorDepth() == "U8":
+            data = bytes(document.pixelData(0, 0, width, height))
+            return (downsample, (data, width, height, sizes))
+
+        # other color spaces are converted by Krita, at the largest size
+        # requested rather than the full resolution.
+        (largest_width, largest_height) = fit_size(width, height, max(sizes))
+        image = document.thumbnail(largest_width, largest_height)
+        return (_scale_image, (image, sizes))
+
+    def _state(self, document):
+        """
+        Returns what identifies the content of a document, short of reading
+        its pixels.
+        """
+        try:
+            stat = os.stat(document.fileName())
+            saved = (stat.st_size, stat.st_mtime)
+        except OSError:
+            saved = None
+        return (saved, document.width(), document.height(), bool(document.modified()))
+
+    def _expired(self, state, captured):
+        """
+        Whether thumbnails of a document with unsaved changes got too old.
+        """
+        return state[-1] and self._clock() - captured > self._modified_max_age
+
+    def _store(self, key, state, captured, thumbnails):
+        """
+        Adds thumbnails to the cache, evicting the least recently used ones.
+        """
+        entry = self._entries.pop(key, None)
+        if entry and entry[0] == state:
+            merged = dict(entry[2])
+            merged.update(thumbnails)
+            thumbnails = merged
+
+        self._entries[key] = (state, captured, thumbnails)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+def _scale_image(image, sizes):
+    """
+    Scales a ``QImage`` to several sizes.
+
+    :returns: Dictionary of the ``QImage`` thumbnails by size.
+    """
+    thumbnails = {}
+    for size in sorted(set(sizes), reverse=True):
+        (width, height) = fit_size(image.width(), image.height(), size)
+        image = image.scaled(width, height, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+        thumbnails[size] = image
+    return thumbnails
@@ -0,0 +1,12 @@
+"""
+Helpers used by the Krita software launcher (startup.py).
+
+These modules run inside the launching process and must not depend on
+Krita or on an engine instance.
+"""
+
+from .appimage_metadata import AppImageMetadataCache, appimage_key, is_appimage, read_appimage_metadata
+from .discovery import DiscoveryTimeout, find_root_executables, map_concurrently, probe_version
+from .import_paths import dedupe_paths, import_cache_folder
+from .software_index import SoftwareIndex
+from .squashfs import SquashFsError, SquashFsImage
@@ -0,0 +1,372 @@
+"""
+Metadata of Krita AppImages, read from their embedded file system and
+cached by content.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from .discovery import VERSION_REGEX
+from .squashfs import SquashFsError, SquashFsImage, appimage_offset
+
+# Bump this whenever the layout of the cache file changes.
+CACHE_VERSION = 2
+
+# Bytes hashed at the start and at the end of an AppImage to tell builds
+# with the same size and modification time apart.
+PARTIAL_HASH_SIZE = 64 * 1024
+
+# Where the AppStream data listing the Krita releases can be found.
+APPDATA_PATHS = (
+    "usr/share/metainfo/org.kde.krita.appdata.xml",
+    "usr/share/appdata/org.kde.krita.appdata.xml",
+)
+
+# Where the icon named by the desktop entry can be found, in order.
+ICON_PATHS = (
+    "%s.png",
+    "%s.svg",
+    "usr/share/icons/hicolor/256x256/apps/%s.png",
+    "usr/share/icons/hicolor/scalable/apps/%s.svg",
+)
+
+
+def is_appimage(executable_path):
+    """
+    Whether an executable is an AppImage, from its name.
+    """
+    return executable_path.lower().endswith(".appimage")
+
+
+def appimage_key(executable_path, size, mtime):
+    """
+    Returns the key of an AppImage in the metadata cache.
+
+    :param str executable_path: Path to the AppImage.
+    :param int size: Size of the file.
+    :param float mtime: Modification time of the file.
+    :returns: Key as a string.
+    """
+    digest = hashlib.sha1()
+    with open(executable_path, "rb") as fh:
+        digest.update(fh.read(PARTIAL_HASH_SIZE))
+        if size > PARTIAL_HASH_SIZE:
+            fh.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+            digest.update(fh.read(PARTIAL_HASH_SIZE))
+    return "%d-%r-%s" % (size, mtime, digest.hexdigest())
+
+
+def read_appimage_metadata(executable_path):
+    """
+    Reads the version, desktop entry and icon of an AppImage without
+    mounting or running it.
+
+    The version comes from the ``X-AppImage-Version`` key of the desktop
+    entry, or from the latest release listed in the AppStream data.
+
+    :param str executable_path: Path to the AppImage.
+    :returns: Dictionary with the ``version`` (None if not found), the
+        ``desktop_entry`` keys, the ``icon`` content (None if not found) and
+        the ``icon_extension``.
+    :raises SquashFsError: If the AppImage can't be read.
+    """
+    with open(executable_path, "rb") as fh:
+        image = SquashFsImage(fh, appimage_offset(fh))
+
+        desktop_entry = {}
+        desktop_files = sorted(name for name in image.listdir() if name.endswith(".desktop"))
+        if desktop_files:
+            desktop_entry = parse_desktop_entry(image.read_file(desktop_files[0]))
+
+        version = _match_version(desktop_entry.get("X-AppImage-Version"))
+        if not version:
+            version = _appdata_version(image)
+
+        (icon, icon_extension) = _read_icon(image, desktop_entry.get("Icon") or "krita")
+
+    return {
+        "version": version,
+        "desktop_entry": desktop_entry,
+        "icon": icon,
+        "icon_extension": icon_extension,
+    }
+
+
+def parse_desktop_entry(data):
+    """
+    Returns the keys of the ``Desktop Entry`` group of a desktop file,
+    without the localized ones.
+
+    :param bytes data: Content of the desktop file.
+    :returns: Dictionary of the values by key.
+    """
+    entry = {}
+    in_group = False
+    for line in data.decode("utf-8", "replace").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("["):
+            in_group = line == "[Desktop Entry]"
+            continue
+        if in_group and "=" in line:
+            (key, value) = line.split("=", 1)
+            key = key.strip()
+            if "[" not in key:
+                entry[key] = value.strip()
+    return entry
+
+
+def _match_version(value):
+    """
+    Returns the version in a string, None if there is none.
+    """
+    match = VERSION_REGEX.search(value or "")
+    return match.group(1) if match else None
+
+
+def _appdata_version(image):
+    """
+    Returns the latest release listed in the AppStream data of an image.
+    """
+    for path in APPDATA_PATHS:
+        if not image.exists(path):
+            continue
+        try:
+            root = ElementTree.fromstring(image.read_file(path))
+        except ElementTree.ParseError:
+            continue
+        # releases are listed newest first
+        for release in root.iter("release"):
+            version = _match_version(release.get("version"))
+            if version:
+                return version
+    return None
+
+
+def _read_icon(image, icon_name):
+    """
+    Returns the content and extension of the icon of an image.
+    """
+    paths = [".DirIcon"] + [path % icon_name for path in ICON_PATHS]
+    for path in paths:
+        if not image.exists(path):
+            continue
+        try:
+            data = image.read_file(path)
+        except SquashFsError:
+            continue
+        if data.startswith(b"\x89PNG"):
+            return (data, "png")
+        if b"<svg" in data[:1024]:
+            return (data, "svg")
+    return (None, None)
+
+
+class AppImageMetadataCache(object):
+    """
+    Caches the metadata read from Krita AppImages between launcher sessions.
+
+    Reading an AppImage means decompressing parts of its file system, so
+    the results are kept by :func:`appimage_key`: the size, modification
+    time and a hash of the start and end of the file. The cache isn't tied
+    to a path, the same build copied elsewhere with its modification time
+    preserved is only read once. Icons are extracted next to the cache
+    file, named after the key.
+
+    The key each path had is remembered as well, with the size and
+    modification time of the file, so that AppImages which didn't change
+    are only hashed again when they did.
+    """
+
+    def __init__(self, path, logger):
+        """
+        :param str path: Path to the cache file.
+        :param logger: Logger to report problems to.
+        """
+        self._path = path
+        self._icon_folder = os.path.join(os.path.dirname(path), "appimage_icons")
+        self._logger = logger
+        self._entries = {}
+        # path -> [size, mtime, key]
+        self._paths = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def default_path(cls, cache_root):
+        """
+        Returns the cache path below the given cache root.
+
+        :param str cache_root: Root folder of the local Toolkit cache.
+        :returns: Path to the cache file as a string.
+        """
+        return os.path.join(cache_root, "tk-krita", "appimage_metadata.json")
+
+    def get(self, key):
+        """
+        Returns the cached metadata of an AppImage.
+
+        :param str key: Key of the AppImage, see :func:`appimage_key`.
+        :returns: Dictionary with the ``version``, ``name`` and path of the
+            extracted ``icon``, any of which may be None, or None if the
+            AppImage wasn't read yet or its icon went missing.
+        """
+        entry = self._entries.get(key)
+        if not entry or (entry["icon"] and not os.path.exists(entry["icon"])):
+            return None
+        return dict(entry)
+
+    def find_key(self, executable_path, size, mtime):
+        """
+        Returns the key an AppImage had when last seen, without reading it.
+
+        :param str executable_path: Path to the AppImage.
+        :param int size: Size of the file.
+        :param float mtime: Modification time of the file.
+        :returns: The key, None if the file wasn't seen with this size and
+            modification time or its metadata is no longer cached.
+        """
+        entry = self._paths.get(executable_path)
+        if not entry or entry[0] != size or entry[1] != mtime or entry[2] not in self._entries:
+            return None
+        return entry[2]
+
+    def set_path(self, executable_path, size, mtime, key):
+        """
+        Records the key of the AppImage found at a path, see :meth:`find_key`.
+
+        :param str executable_path: Path to the AppImage.
+        :param int size: Size of the file.
+        :param float mtime: Modification time of the file.
+        :param str key: Key of the AppImage, see :func:`appimage_key`.
+        """
+        entry = [size, mtime, key]
+        if self._paths.get(executable_path) != entry:
+            self._paths[executable_path] = entry
+            self._dirty = True
+
+    def read(self, executable_path, key):
+        """
+        Reads the metadata of an AppImage and extracts its icon.
+
+        Safe to call from worker threads, the result must be recorded with
+        :meth:`set` afterwards.
+
+        :param str executable_path: Path to the AppImage.
+        :param str key: Key of the AppImage, see :func:`appimage_key`.
+        :returns: Dictionary like the ones returned by :meth:`get`.
+        """
+        try:
+            metadata = read_appimage_metadata(executable_path)
+        except (IOError, OSError, SquashFsError, ValueError) as e:
+            self._logger.debug("Could not read AppImage %s: %s", executable_path, e)
+            return {"version": None, "name": None, "icon": None}
+
+        icon_path = None
+        if metadata["icon"]:
+            icon_path = os.path.join(self._icon_folder, "%s.%s" % (key, metadata["icon_extension"]))
+            try:
+                _write_file(icon_path, metadata["icon"])
+            except (IOError, OSError) as e:
+                self._logger.debug("Could not extract the icon of %s: %s", executable_path, e)
+                icon_path = None
+
+        return {
+            "version": metadata["version"],
+            "name": metadata["desktop_entry"].get("Name"),
+            "icon": icon_path,
+        }
+
+    def set(self, key, metadata):
+        """
+        Records the metadata of an AppImage.
+
+        :param str key: Key of the AppImage, see :func:`appimage_key`.
+        :param dict metadata: Metadata returned by :meth:`read`.
+        """
+        self._entries[key] = dict(metadata)
+        self._dirty = True
+
+    def prune(self, keys):
+        """
+        Drops the entries, and their icons, of AppImages no longer found,
+        along with the paths they were found at.
+
+        :param keys: Keys of the AppImages to keep.
+        """
+        keys = set(keys)
+        for key in list(self._entries):
+            if key in keys:
+                continue
+            icon_path = self._entries.pop(key)["icon"]
+            self._dirty = True
+            if icon_path:
+                try:
+                    os.remove(icon_path)
+                except OSError:
+                    pass
+
+        for (executable_path, entry) in list(self._paths.items()):
+            if entry[2] not in keys:
+                del self._paths[executable_path]
+                self._dirty = True
+
+    def save(self):
+        """
+        Writes the cache to disk if it changed since it was loaded.
+        """
+        if not self._dirty:
+            return
+
+        data = {"version": CACHE_VERSION, "entries": self._entries, "paths": self._paths}
+        try:
+            _write_file(self._path, json.dumps(data).encode("utf-8"))
+        except (IOError, OSError) as e:
+            self._logger.debug("Could not write AppImage metadata cache %s: %s", self._path, e)
+            return
+
+        self._dirty = False
+
+    def _load(self):
+        """
+        Reads the cache from disk, discarding it when it is unusable.
+        """
+        try:
+            with open(self._path, "r") as fh:
+                data = json.load(fh)
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            self._logger.debug("Ignoring corrupt AppImage metadata cache %s: %s", self._path, e)
+            return
+
+        if data.get("version") == CACHE_VERSION:
+            self._entries = data.get("entries") or {}
+            self._paths = data.get("paths") or {}
+
+
+def _write_file(path, data):
+    """
+    Writes a file through a temporary file, creating its folder if needed.
+    """
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    # icons are extracted from worker threads
+    tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Windows won't rename over an existing file.
+        os.remove(path)
+        os.rename(tmp_path, path)
@@ -0,0 +1,178 @@
+"""
+Concurrent discovery of Krita executables and probing of their versions.
+"""
+
+import glob
+import heapq
+import os
+import re
+import subprocess
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+# Matches the version printed by "krita --version", e.g. "krita 4.0.1".
+VERSION_REGEX = re.compile(r"(\d+(?:\.\d+)+)")
+
+
+class DiscoveryTimeout(Exception):
+    """
+    Raised when a discovery job didn't finish in time.
+    """
+
+
+def find_root_executables(root, patterns):
+    """
+    Returns the executables matching any of the patterns below a root.
+
+    :param str root: Directory to look into.
+    :param list patterns: Glob patterns relative to the root.
+    :returns: Sorted list of executable paths.
+    """
+    executables = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(root, pattern)):
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                executables.add(path)
+    return sorted(executables)
+
+
+def probe_version(executable_path, timeout):
+    """
+    Runs an executable with ``--version`` and parses the reported version.
+
+    :param str executable_path: Path to the Krita executable.
+    :param float timeout: Seconds to wait before killing the process.
+    :returns: Version string or None if it couldn't be determined.
+    """
+    try:
+        process = subprocess.Popen(
+            [executable_path, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+    except (IOError, OSError):
+        return None
+
+    # subprocess has no timeout support in python 2, so kill the process
+    # from a timer instead.
+    timer = threading.Timer(timeout, _kill_process, (process,))
+    timer.start()
+    try:
+        output = process.communicate()[0]
+    finally:
+        timer.cancel()
+
+    if not isinstance(output, str):
+        output = output.decode("utf-8", "replace")
+
+    for line in output.splitlines():
+        if "krita" in line.lower():
+            match = VERSION_REGEX.search(line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def map_concurrently(func, items, timeout, max_workers):
+    """
+    Calls a function for each item on worker threads.
+
+    Every item gets ``timeout`` seconds, counted from the moment its call
+    starts rather than from the moment it was queued, so items waiting for
+    a worker behind slow ones still get their full time. The worker of a
+    call that timed out is abandoned and replaced: the daemon thread
+    finishes the call on its own and then exits.
+
+    :param func: Callable taking a single item.
+    :param list items: Items to process.
+    :param float timeout: Seconds each item is allowed to take.
+    :param int max_workers: Maximum number of worker threads.
+    :returns: List of ``(item, result, error)`` tuples in item order, where
+        ``error`` is None on success.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    results = [None] * len(items)
+    tasks = queue.Queue()
+    for index in range(len(items)):
+        tasks.put(index)
+    finished = queue.Queue()
+    lock = threading.Lock()
+    # heap of the (deadline, index) of the calls that started, including
+    # the completed ones until they come up
+    deadlines = []
+    timed_out = set()
+
+    def work():
+        while True:
+            try:
+                index = tasks.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                heapq.heappush(deadlines, (time.time() + timeout, index))
+            try:
+                finished.put((index, func(items[index]), None))
+            except Exception as e:
+                finished.put((index, None, e))
+            with lock:
+                if index in timed_out:
+                    # replaced by another worker meanwhile
+                    return
+
+    def start_worker():
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+
+    for _ in range(max(1, min(max_workers, len(items)))):
+        start_worker()
+
+    remaining = len(items)
+    while remaining:
+        with lock:
+            while deadlines and results[deadlines[0][1]] is not None:
+                heapq.heappop(deadlines)
+            next_deadline = deadlines[0][0] if deadlines else None
+        wait = max(0.0, next_deadline - time.time()) if next_deadline is not None else timeout
+        try:
+            (index, result, error) = finished.get(timeout=wait)
+        except queue.Empty:
+            now = time.time()
+            expired = []
+            with lock:
+                while deadlines and deadlines[0][0] <= now:
+                    (_, index) = heapq.heappop(deadlines)
+                    if results[index] is None:
+                        expired.append(index)
+                timed_out.update(expired)
+            for index in expired:
+                results[index] = (items[index], None, DiscoveryTimeout("timed out after %ss" % timeout))
+                remaining -= 1
+                start_worker()
+            continue
+
+        # calls that timed out may still report back
+        if results[index] is None:
+            results[index] = (items[index], result, error)
+            remaining -= 1
+
+    return results
+
+
+def _kill_process(process):
+    """
+    Kills a process that may already have exited.
+    """
+    try:
+        process.kill()
+    except OSError:
+        pass
@@ -0,0 +1,40 @@
+"""
+Import path handed to the Krita session.
+"""
+
+import os
+import socket
+
+
+def dedupe_paths(paths):
+    """
+    Returns paths without the empty and repeated ones, in their order.
+
+    The first occurrence of a path wins, like it does when importing, so
+    dropping the later ones doesn't change which modules are found.
+
+    :param paths: Iterable of paths.
+    :returns: List of normalized paths.
+    """
+    result = []
+    seen = set()
+    for path in paths:
+        if not path:
+            continue
+        path = os.path.normpath(path)
+        key = os.path.normcase(path)
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def import_cache_folder(cache_root):
+    """
+    Returns the folder the Krita session caches module locations and
+    bytecode in, for this host.
+
+    :param str cache_root: Root folder of the local Toolkit cache.
+    :returns: Folder path as a string.
+    """
+    return os.path.join(cache_root, "tk-krita", "imports", socket.gethostname())
@@ -0,0 +1,259 @@
+"""
+Persistent on-disk index of the Krita executables found by the launcher.
+"""
+
+import errno
+import json
+import os
+import socket
+
+# Bump this whenever the layout of the index file changes so stale
+# indexes written by older engine versions are ignored.
+INDEX_VERSION = 2
+
+
+class SoftwareIndex(object):
+    """
+    Caches the executable matches of each executable template and
+    discovery root between launcher sessions, along with the probed
+    version of every executable.
+
+    Globbing install directories is slow on network shares, so every
+    entry remembers the modification time of the directory it globs in.
+    An entry is only reused while that directory is unchanged, which means
+    adding or removing an install invalidates exactly the entries pointing
+    at it. Probed versions are keyed on the executable's size and mtime.
+    """
+
+    def __init__(self, path, salt, logger):
+        """
+        :param str path: Path to the index file.
+        :param str salt: String describing anything besides the templates
+            that affects matching (e.g. the component regexes). An index
+            written with a different salt is discarded.
+        :param logger: Logger to report problems to.
+        """
+        self._path = path
+        self._salt = salt
+        self._logger = logger
+        self._entries = {}
+        self._versions = {}
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def default_path(cls, cache_root):
+        """
+        Returns the index path for this host below the given cache root.
+
+        Install locations differ between machines while the cache root is
+        often a shared home directory, hence the host name in the file name.
+
+        :param str cache_root: Root folder of the local Toolkit cache.
+        :returns: Path to the index file as a string.
+        """
+        return os.path.join(
+            cache_root,
+            "tk-krita",
+            "software_index_%s.json" % socket.gethostname()
+        )
+
+    @staticmethod
+    def template_directory(executable_template):
+        """
+        Returns the deepest directory of a template without placeholders.
+
+        e.g. ``/opt/krita-{version}/bin/krita`` gives ``/opt``.
+
+        :param str executable_template: Executable template string.
+        :returns: Directory path as a string.
+        """
+        return os.path.dirname(executable_template.split("{", 1)[0])
+
+    @staticmethod
+    def directory_stamp(path):
+        """
+        Returns the current stamp of a directory.
+
+        The stamp should be taken before globbing so a directory modified
+        during the scan is picked up again by the next one.
+
+        :param str path: Directory path.
+        :returns: Modification time of the directory or None if it
+            doesn't exist.
+        """
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def stamp(self, executable_template):
+        """
+        Returns the current stamp of the directory a template globs in.
+
+        :param str executable_template: Executable template string.
+        :returns: See :meth:`directory_stamp`.
+        """
+        return self.directory_stamp(self.template_directory(executable_template))
+
+    def get_matches(self, executable_template, stamp):
+        """
+        Returns the indexed matches for a template if they are still valid.
+
+        Discovery roots are indexed the same way, using the root directory
+        as the template.
+
+        :param str executable_template: Executable template string.
+        :param stamp: Current stamp as returned by :meth:`stamp`.
+        :returns: List of ``(executable_path, key_dict)`` tuples or None
+            when the template needs to be scanned again.
+        """
+        entry = self._entries.get(executable_template)
+        if not entry or entry["stamp"] != stamp:
+            return None
+        return [(path, dict(key_dict)) for (path, key_dict) in entry["matches"]]
+
+    def set_matches(self, executable_template, stamp, matches):
+        """
+        Records the matches found for a template.
+
+        :param str executable_template: Executable template string.
+        :param stamp: Stamp taken before the template was scanned.
+        :param list matches: List of ``(executable_path, key_dict)`` tuples.
+        """
+        self._entries[executable_template] = {
+            "stamp": stamp,
+            "matches": [[path, key_dict] for (path, key_dict) in matches],
+        }
+        self._dirty = True
+
+    def get_version(self, executable_path, size, mtime):
+        """
+        Returns the probed version of an executable if it is still valid.
+
+        :param str executable_path: Path to the executable.
+        :param int size: Current size of the executable.
+        :param float mtime: Current modification time of the executable.
+        :returns: Version string, an empty string if the executable was
+            probed without reporting a version, or None if it needs to be
+            probed.
+        """
+        entry = self._versions.get(executable_path)
+        if not entry or entry[0] != size or entry[1] != mtime:
+            return None
+        return entry[2]
+
+    def set_version(self, executable_path, size, mtime, version):
+        """
+        Records the probed version of an executable.
+
+        :param str executable_path: Path to the executable.
+        :param int size: Size of the executable when it was probed.
+        :param float mtime: Modification time of the executable when it
+            was probed.
+        :param str version: Probed version, None if the executable didn't
+            report one.
+        """
+        self._versions[executable_path] = [size, mtime, version or ""]
+        self._dirty = True
+
+    def prune(self, executable_templates, executable_paths=None):
+        """
+        Drops the entries of templates that are no longer in use.
+
+        :param executable_templates: Templates to keep.
+        :param executable_paths: Executables whose probed versions should be
+            kept. Probed versions are left untouched when omitted.
+        """
+        for executable_template in list(self._entries):
+            if executable_template not in executable_templates:
+                del self._entries[executable_template]
+                self._dirty = True
+
+        if executable_paths is None:
+            return
+
+        for executable_path in list(self._versions):
+            if executable_path not in executable_paths:
+                del self._versions[executable_path]
+                self._dirty = True
+
+    def clear(self):
+        """
+        Forgets every indexed template and probed version.
+        """
+        if self._entries or self._versions:
+            self._entries = {}
+            self._versions = {}
+            self._dirty = True
+
+    def save(self):
+        """
+        Writes the index to disk if it changed since it was loaded.
+
+        Failing to write the index is not fatal, the next launch simply
+        scans again.
+        """
+        if not self._dirty:
+            return
+
+        data = {
+            "version": INDEX_VERSION,
+            "salt": self._salt,
+            "entries": self._entries,
+            "versions": self._versions,
+        }
+        tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        try:
+            _ensure_folder_exists(os.path.dirname(self._path))
+            with open(tmp_path, "w") as fh:
+                json.dump(data, fh)
+            _replace_file(tmp_path, self._path)
+        except (IOError, OSError) as e:
+            self._logger.debug("Could not write software index %s: %s", self._path, e)
+            return
+
+        self._dirty = False
+
+    def _load(self):
+        """
+        Reads the index from disk, discarding it when it is unusable.
+        """
+        try:
+            with open(self._path, "r") as fh:
+                data = json.load(fh)
+        except (IOError, OSError):
+            return
+        except ValueError as e:
+            self._logger.debug("Ignoring corrupt software index %s: %s", self._path, e)
+            return
+
+        if data.get("version") != INDEX_VERSION or data.get("salt") != self._salt:
+            self._logger.debug("Ignoring outdated software index %s.", self._path)
+            return
+
+        self._entries = data.get("entries") or {}
+        self._versions = data.get("versions") or {}
+
+
+def _ensure_folder_exists(path):
+    """
+    Creates a folder and its parents if needed.
+    """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _replace_file(src, dst):
+    """
+    Moves ``src`` over ``dst``, replacing it if it exists.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Windows won't rename over an existing file.
+        os.remove(dst)
+        os.rename(src, dst)
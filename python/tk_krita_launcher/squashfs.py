@@ -0,0 +1,391 @@
+"""
+Read-only access to the SquashFS file system embedded in an AppImage.
+
+Only what the launcher needs is supported: looking files up by path,
+reading them, following symbolic links and listing directories. Images
+compressed with gzip are always readable; xz and zstd images need the
+``lzma`` and ``zstandard`` modules.
+"""
+
+import struct
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SQUASHFS_MAGIC = b"hsqs"
+
+# Compression ids of the superblock.
+GZIP_COMPRESSION = 1
+XZ_COMPRESSION = 4
+ZSTD_COMPRESSION = 6
+
+# Inode types.
+BASIC_DIRECTORY = 1
+BASIC_FILE = 2
+BASIC_SYMLINK = 3
+EXTENDED_DIRECTORY = 8
+EXTENDED_FILE = 9
+EXTENDED_SYMLINK = 10
+
+_SUPERBLOCK = struct.Struct("<4sIIIIHHHHHHQQQQQQQQ")
+_INODE_HEADER = struct.Struct("<HHHHII")
+_METADATA_BLOCK_SIZE = 8192
+_NO_FRAGMENT = 0xFFFFFFFF
+_UNCOMPRESSED_BLOCK = 1 << 24
+_UNCOMPRESSED_METADATA = 1 << 15
+
+# Symbolic links followed before a lookup gives up.
+_MAX_SYMLINKS = 8
+
+# Bytes searched for the SquashFS magic when the ELF header can't tell
+# where the runtime of an AppImage ends.
+_MAGIC_SEARCH_SIZE = 4 * 1024 * 1024
+
+
+class SquashFsError(Exception):
+    """
+    Raised when an image can't be read.
+    """
+
+
+def appimage_offset(handle):
+    """
+    Returns the offset of the SquashFS image in a type 2 AppImage.
+
+    The image follows the ELF runtime, which ends with its section headers.
+
+    :param handle: File opened in binary mode.
+    :returns: Offset in bytes.
+    :raises SquashFsError: If the file doesn't look like an AppImage.
+    """
+    handle.seek(0)
+    header = handle.read(64)
+    if header[:4] != b"\x7fELF":
+        raise SquashFsError("Not an ELF executable.")
+
+    endian = "<" if header[5:6] == b"\x01" else ">"
+    if header[4:5] == b"\x02":
+        (section_offset,) = struct.unpack(endian + "Q", header[0x28:0x30])
+        (entry_size, entry_count) = struct.unpack(endian + "HH", header[0x3A:0x3E])
+    else:
+        (section_offset,) = struct.unpack(endian + "I", header[0x20:0x24])
+        (entry_size, entry_count) = struct.unpack(endian + "HH", header[0x2E:0x32])
+
+    offset = section_offset + entry_size * entry_count
+    handle.seek(offset)
+    if handle.read(4) == SQUASHFS_MAGIC:
+        return offset
+
+    # some runtimes are padded, look for the superblock instead
+    handle.seek(0)
+    data = handle.read(_MAGIC_SEARCH_SIZE)
+    offset = data.find(SQUASHFS_MAGIC)
+    if offset < 0:
+        raise SquashFsError("No SquashFS image found.")
+    return offset
+
+
+class SquashFsImage(object):
+    """
+    SquashFS 4.0 image read from an open file.
+
+    Metadata blocks are kept once decompressed, since looking up several
+    files reads the same directory and inode blocks again.
+    """
+
+    def __init__(self, handle, offset=0):
+        """
+        :param handle: File opened in binary mode. It must stay open while
+            the image is used.
+        :param int offset: Offset of the image in the file.
+        :raises SquashFsError: If the superblock is invalid or the
+            compression isn't supported.
+        """
+        self._handle = handle
+        self._offset = offset
+
+        handle.seek(offset)
+        data = handle.read(_SUPERBLOCK.size)
+        if len(data) < _SUPERBLOCK.size:
+            raise SquashFsError("Truncated superblock.")
+
+        fields = _SUPERBLOCK.unpack(data)
+        if fields[0] != SQUASHFS_MAGIC:
+            raise SquashFsError("Bad SquashFS magic.")
+        if fields[9] != 4:
+            raise SquashFsError("Unsupported SquashFS version %d.%d." % (fields[9], fields[10]))
+
+        self.block_size = fields[3]
+        self._compression = fields[5]
+        self._root_inode = fields[11]
+        self._inode_table = fields[15]
+        self._directory_table = fields[16]
+        self._fragment_table = fields[17]
+        self._decompress = self._decompressor(self._compression)
+        self._metadata_cache = {}
+
+    def read_file(self, path):
+        """
+        Returns the content of a file, following symbolic links.
+
+        :param str path: Path of the file in the image, ``/`` separated.
+        :returns: Content as bytes.
+        :raises SquashFsError: If the file doesn't exist or isn't a file.
+        """
+        inode = self._lookup(path)
+        if inode["type"] not in (BASIC_FILE, EXTENDED_FILE):
+            raise SquashFsError("%s is not a file." % path)
+        return self._read_data(inode)
+
+    def listdir(self, path=""):
+        """
+        Returns the names of the entries of a directory.
+
+        :param str path: Path of the directory in the image, the root when
+            empty.
+        :returns: List of names.
+        :raises SquashFsError: If the directory doesn't exist.
+        """
+        inode = self._lookup(path)
+        if inode["type"] not in (BASIC_DIRECTORY, EXTENDED_DIRECTORY):
+            raise SquashFsError("%s is not a directory." % path)
+        return [name for (name, _) in self._entries(inode)]
+
+    def exists(self, path):
+        """
+        Whether a path exists in the image, following symbolic links.
+        """
+        try:
+            self._lookup(path)
+        except SquashFsError:
+            return False
+        return True
+
+    def _lookup(self, path):
+        """
+        Returns the inode of a path, following symbolic links.
+        """
+        components = [component for component in path.split("/") if component]
+        parents = []
+        inode = self._read_inode(self._root_inode)
+        links = 0
+
+        while components:
+            name = components.pop(0)
+            if name == ".":
+                continue
+            if name == "..":
+                inode = parents.pop() if parents else inode
+                continue
+            if inode["type"] not in (BASIC_DIRECTORY, EXTENDED_DIRECTORY):
+                raise SquashFsError("%s is not a directory." % path)
+
+            entries = dict(self._entries(inode))
+            if name not in entries:
+                raise SquashFsError("%s does not exist." % path)
+
+            child = self._read_inode(entries[name])
+            if child["type"] in (BASIC_SYMLINK, EXTENDED_SYMLINK):
+                links += 1
+                if links > _MAX_SYMLINKS:
+                    raise SquashFsError("Too many symbolic links in %s." % path)
+                target = child["target"]
+                if target.startswith("/"):
+                    parents = []
+                    inode = self._read_inode(self._root_inode)
+                components = [c for c in target.split("/") if c] + components
+                continue
+
+            parents.append(inode)
+            inode = child
+
+        return inode
+
+    def _entries(self, inode):
+        """
+        Yields the ``(name, inode reference)`` of a directory's entries.
+        """
+        # the listing size accounts for the "." and ".." entries, which are
+        # not stored.
+        size = inode["file_size"] - 3
+        if size <= 0:
+            return
+
+        data = self._read_metadata(self._directory_table, inode["block_start"], inode["block_offset"], size)
+        position = 0
+        while position < len(data):
+            (count, start, _) = struct.unpack_from("<III", data, position)
+            position += 12
+            for _ in range(count + 1):
+                (offset, _, _, name_size) = struct.unpack_from("<HhHH", data, position)
+                position += 8
+                name = data[position:position + name_size + 1].decode("utf-8", "replace")
+                position += name_size + 1
+                yield (name, (start << 16) | offset)
+
+    def _read_inode(self, reference):
+        """
+        Reads the inode of a reference, as a dictionary of its fields.
+        """
+        block = reference >> 16
+        offset = reference & 0xFFFF
+        data = self._read_metadata(self._inode_table, block, offset, _INODE_HEADER.size + 40)
+        inode_type = _INODE_HEADER.unpack_from(data)[0]
+        body = _INODE_HEADER.size
+
+        if inode_type == BASIC_DIRECTORY:
+            (block_start, _, file_size, block_offset, _) = struct.unpack_from("<IIHHI", data, body)
+        elif inode_type == EXTENDED_DIRECTORY:
+            (_, file_size, block_start, _, _, block_offset) = struct.unpack_from("<IIIIHH", data, body)
+        elif inode_type == BASIC_FILE:
+            (blocks_start, fragment, fragment_offset, file_size) = struct.unpack_from("<IIII", data, body)
+            return self._file_inode(inode_type, reference, body + 16, blocks_start, fragment, fragment_offset, file_size)
+        elif inode_type == EXTENDED_FILE:
+            (blocks_start, file_size, _, _, fragment, fragment_offset, _) = struct.unpack_from("<QQQIIII", data, body)
+            return self._file_inode(inode_type, reference, body + 40, blocks_start, fragment, fragment_offset, file_size)
+        elif inode_type in (BASIC_SYMLINK, EXTENDED_SYMLINK):
+            (_, target_size) = struct.unpack_from("<II", data, body)
+            data = self._read_metadata(self._inode_table, block, offset, body + 8 + target_size)
+            return {
+                "type": inode_type,
+                "target": data[body + 8:body + 8 + target_size].decode("utf-8", "replace"),
+            }
+        else:
+            return {"type": inode_type}
+
+        return {
+            "type": inode_type,
+            "block_start": block_start,
+            "block_offset": block_offset,
+            "file_size": file_size,
+        }
+
+    def _file_inode(self, inode_type, reference, header_size, blocks_start, fragment, fragment_offset, file_size):
+        """
+        Returns the fields of a file inode, including its block sizes.
+        """
+        if fragment == _NO_FRAGMENT:
+            block_count = (file_size + self.block_size - 1) // self.block_size
+        else:
+            block_count = file_size // self.block_size
+
+        data = self._read_metadata(
+            self._inode_table, reference >> 16, reference & 0xFFFF, header_size + 4 * block_count
+        )
+        return {
+            "type": inode_type,
+            "blocks_start": blocks_start,
+            "block_sizes": struct.unpack_from("<%dI" % block_count, data, header_size),
+            "fragment": fragment,
+            "fragment_offset": fragment_offset,
+            "file_size": file_size,
+        }
+
+    def _read_data(self, inode):
+        """
+        Reads the content of a file inode from its blocks and fragment.
+        """
+        chunks = []
+        position = inode["blocks_start"]
+        remaining = inode["file_size"]
+        for block_size in inode["block_sizes"]:
+            size = block_size & ~_UNCOMPRESSED_BLOCK
+            if not size:
+                # sparse block
+                chunks.append(b"\0" * min(self.block_size, remaining))
+            else:
+                chunks.append(self._read_block(position, block_size))
+                position += size
+            remaining -= len(chunks[-1])
+
+        if inode["fragment"] != _NO_FRAGMENT and remaining > 0:
+            fragment = self._read_fragment(inode["fragment"])
+            start = inode["fragment_offset"]
+            chunks.append(fragment[start:start + remaining])
+
+        return b"".join(chunks)
+
+    def _read_fragment(self, index):
+        """
+        Returns the decompressed fragment block of an index.
+        """
+        self._handle.seek(self._offset + self._fragment_table + 8 * (index // 512))
+        (location,) = struct.unpack("<Q", self._handle.read(8))
+        data = self._read_metadata(location, 0, (index % 512) * 16, 16)
+        (start, size, _) = struct.unpack_from("<QII", data)
+        return self._read_block(start, size)
+
+    def _read_block(self, position, encoded_size):
+        """
+        Reads a data block, decompressing it unless it is stored as is.
+        """
+        size = encoded_size & ~_UNCOMPRESSED_BLOCK
+        self._handle.seek(self._offset + position)
+        data = self._handle.read(size)
+        if encoded_size & _UNCOMPRESSED_BLOCK:
+            return data
+        return self._decompress(data)
+
+    def _read_metadata(self, table_start, block, offset, length):
+        """
+        Reads bytes of a metadata table, which spans consecutive metadata
+        blocks.
+
+        :param int table_start: Position of the table in the image.
+        :param int block: Position of the first block, relative to the table.
+        :param int offset: Offset in the first decompressed block.
+        :param int length: Number of bytes to read, less are returned when
+            the table ends.
+        """
+        position = table_start + block
+        data = b""
+        while len(data) < offset + length:
+            (block_data, next_position) = self._metadata_block(position)
+            if not block_data:
+                break
+            data += block_data
+            position = next_position
+        return data[offset:offset + length]
+
+    def _metadata_block(self, position):
+        """
+        Returns a decompressed metadata block and the position of the next.
+        """
+        cached = self._metadata_cache.get(position)
+        if cached:
+            return cached
+
+        self._handle.seek(self._offset + position)
+        header = self._handle.read(2)
+        if len(header) < 2:
+            return (b"", position)
+
+        (encoded_size,) = struct.unpack("<H", header)
+        size = encoded_size & ~_UNCOMPRESSED_METADATA
+        data = self._handle.read(size)
+        if not encoded_size & _UNCOMPRESSED_METADATA:
+            data = self._decompress(data)
+
+        self._metadata_cache[position] = (data, position + 2 + size)
+        return self._metadata_cache[position]
+
+    @staticmethod
+    def _decompressor(compression):
+        """
+        Returns the function decompressing the blocks of an image.
+        """
+        if compression == GZIP_COMPRESSION:
+            return zlib.decompress
+        if compression == XZ_COMPRESSION and lzma:
+            return lambda data: lzma.LZMADecompressor().decompress(data)
+        if compression == ZSTD_COMPRESSION and zstandard:
+            return lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        raise SquashFsError("Unsupported SquashFS compression %d." % compression)
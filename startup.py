@@ -1,9 +1,28 @@
+import json
 import os
 import sys
+import time
 
 import sgtk
 from sgtk.platform import SoftwareLauncher, SoftwareVersion, LaunchInformation
 
+# the launcher helpers live next to the engine's python modules
+_LAUNCHER_PYTHON_PATH = os.path.join(os.path.dirname(__file__), "python")
+if _LAUNCHER_PYTHON_PATH not in sys.path:
+    sys.path.append(_LAUNCHER_PYTHON_PATH)
+
+from tk_krita_launcher import (
+    AppImageMetadataCache,
+    SoftwareIndex,
+    appimage_key,
+    dedupe_paths,
+    find_root_executables,
+    import_cache_folder,
+    is_appimage,
+    map_concurrently,
+    probe_version
+)
+
 
 class KritaLauncher(SoftwareLauncher):
     """
@@ -33,6 +52,31 @@ class KritaLauncher(SoftwareLauncher):
         "linux2": ["/home/jeroenh/Applications/krita-{version}-{mach}.appimage"]
     }
 
+    # Glob patterns, relative to a discovery root, matching the Krita
+    # executables installed in that root. Unlike the executable templates
+    # these don't carry the version, it is probed from the executable.
+    ROOT_EXECUTABLE_PATTERNS = {
+        "darwin": ["*.app/Contents/MacOS/krita", "*/*.app/Contents/MacOS/krita"],
+        "win32": ["bin/krita.exe", "*/bin/krita.exe"],
+        "linux2": ["krita*.appimage", "krita*.AppImage", "bin/krita", "*/bin/krita"]
+    }
+
+    # Setting this environment variable makes the launcher ignore the
+    # software index and scan every install location again.
+    REFRESH_INDEX_ENV_VAR = "SG_KRITA_REFRESH_SOFTWARE_INDEX"
+
+    # Extra discovery roots, separated by os.pathsep, added to the ones
+    # from the discovery_roots setting.
+    DISCOVERY_ROOTS_ENV_VAR = "SG_KRITA_DISCOVERY_ROOTS"
+
+    # Seconds a single template or root may take to be scanned, and a
+    # single executable may take to report its version.
+    DISCOVERY_TIMEOUT = 10.0
+    VERSION_PROBE_TIMEOUT = 10.0
+
+    # Maximum number of threads used to scan and probe concurrently.
+    DISCOVERY_THREADS = 8
+
     @property
     def minimum_supported_version(self):
         """
@@ -50,25 +94,56 @@ class KritaLauncher(SoftwareLauncher):
         :param str file_to_open: (optional) Full path name of a file to open on launch.
         :returns: :class:`LaunchInformation` instance
         """
+        prepare_start = time.time()
         required_env = {}
 
-        # Run the engine's userSetup.py file when Maya starts up
-        # by appending it to the env PYTHONPATH.
+        # Load the startup plugin when Krita starts up by appending it to
+        # the PYTHONPATH of the Krita session. Every entry is looked into on
+        # each import, so repeated ones are dropped.
         startup_path = os.path.join(self.disk_location, "startup")
-        sgtk.util.append_path_to_env_var("PYTHONPATH", startup_path)
-        required_env["SG_PYTHONPATH"] = os.environ["PYTHONPATH"]
+        python_path = dedupe_paths(
+            os.environ.get("PYTHONPATH", "").split(os.pathsep) + [startup_path]
+        )
+        required_env["PYTHONPATH"] = os.pathsep.join(python_path)
+        required_env["SG_PYTHONPATH"] = required_env["PYTHONPATH"]
+
+        # Remember where modules were found and keep their bytecode locally,
+        # rather than next to sources that are often on a read only share.
+        if self.get_setting("import_cache"):
+            cache_folder = import_cache_folder(
+                sgtk.util.LocalFileStorageManager.get_global_root(
+                    sgtk.util.LocalFileStorageManager.CACHE
+                )
+            )
+            required_env["SG_KRITA_IMPORT_CACHE"] = cache_folder
+            required_env["PYTHONPYCACHEPREFIX"] = os.path.join(cache_folder, "bytecode")
+
+        # Let Krita finish starting before Toolkit is brought up.
+        if self.get_setting("deferred_bootstrap"):
+            required_env["SG_KRITA_DEFERRED_BOOTSTRAP"] = "1"
+
+        # Stamp the launch so the engine can time the whole startup.
+        launch_time = time.time()
+        required_env["SG_KRITA_LAUNCH_TIME"] = repr(launch_time)
+        required_env["SG_KRITA_STARTUP_TRACE"] = json.dumps([{
+            "name": "prepare_launch",
+            "cat": "launcher",
+            "start": prepare_start,
+            "end": launch_time,
+        }])
 
         return LaunchInformation(exec_path, args, required_env)
 
     ##########################################################################################
     # private methods
 
-    def _icon_from_executable(self, exec_path):
+    def _icon_from_executable(self, exec_path, bundled_icon=None):
         """
         Find the application icon based on the executable path and
         current platform.
 
         :param exec_path: Full path to the executable.
+        :param bundled_icon: Path to the icon extracted from an AppImage.
 
         :returns: Full path to application icon as a string or None.
         """
@@ -76,58 +151,58 @@ class KritaLauncher(SoftwareLauncher):
         # the engine icon in case we need to use it as a fallback
         engine_icon = os.path.join(self.disk_location, "icon_256.png")
 
-        return engine_icon
+        if bundled_icon and os.path.exists(bundled_icon):
+            return bundled_icon
 
-        self.logger.debug(
-            "Looking for Application icon for executable '%s' ..." %
-            exec_path
-        )
-        icon_base_path = ""
-        if sys.platform == "darwin" and "Maya.app" in exec_path:
-            # e.g. /Applications/Autodesk/maya2016.5/Maya.app/Contents
-            icon_base_path = os.path.join(
-                "".join(exec_path.partition("Maya.app")[0:2]),
-                "Contents"
+        icon_path = None
+        if sys.platform in ["win32", "linux2"] and os.path.basename(os.path.dirname(exec_path)) == "bin":
+            # e.g. /opt/krita/bin/krita uses
+            #      /opt/krita/share/icons/hicolor/256x256/apps/krita.png
+            icon_path = os.path.join(
+                os.path.dirname(os.path.dirname(exec_path)),
+                "share", "icons", "hicolor", "256x256", "apps", "krita.png"
             )
 
-        elif sys.platform in ["win32", "linux2"] and "bin" in exec_path:
-            # e.g. C:\Program Files\Autodesk\Maya2017\  or
-            #      /usr/autodesk/maya2017/
-            icon_base_path = "".join(exec_path.partition("bin")[0:1])
-
-        if not icon_base_path:
-            # use the bundled engine icon
-            self.logger.debug("Couldn't find bundled icon. Using engine icon.")
+        if not icon_path or not os.path.exists(icon_path):
+            self.logger.debug("Couldn't find the icon of %s. Using engine icon.", exec_path)
             return engine_icon
 
-        # Append the standard icon to the base path and
-        # return that path if it exists, else None.
-        icon_path = os.path.join(icon_base_path, "icons", "mayaico.png")
-        if not os.path.exists(icon_path):
-            self.logger.debug(
-                "Icon path '%s' resolved from executable '%s' does not exist!"
-                "Falling back on engine icon." % (icon_path, exec_path)
-            )
-            return engine_icon
-
-        # Record what the resolved icon path was.
-        self.logger.debug(
-            "Resolved icon path '%s' from input executable '%s'." %
-            (icon_path, exec_path)
-        )
         return icon_path
 
     def scan_software(self):
         """
         Scan the filesystem for krita executables.
 
+        Install locations that didn't change since the previous scan are
+        served from the software index. Set ``SG_KRITA_REFRESH_SOFTWARE_INDEX``
+        in the environment or call :meth:`rescan_software` to bypass it.
+
+        :return: A list of :class:`SoftwareVersion` objects.
+        """
+        force_refresh = bool(os.environ.get(self.REFRESH_INDEX_ENV_VAR))
+        return self._scan_software(force_refresh)
+
+    def rescan_software(self):
+        """
+        Scan the filesystem for krita executables, ignoring and refreshing
+        the software index.
+
+        :return: A list of :class:`SoftwareVersion` objects.
+        """
+        return self._scan_software(force_refresh=True)
+
+    def _scan_software(self, force_refresh):
+        """
+        Scan for krita executables and filter out unsupported versions.
+
+        :param bool force_refresh: Whether to ignore the software index.
         :return: A list of :class:`SoftwareVersion` objects.
         """
 
         self.logger.debug("Scanning for Krita executables...")
 
         supported_sw_versions = []
-        for sw_version in self._find_software():
+        for sw_version in self._find_software(force_refresh):
             (supported, reason) = self._is_supported(sw_version)
             if supported:
                 supported_sw_versions.append(sw_version)
@@ -139,40 +214,244 @@ class KritaLauncher(SoftwareLauncher):
 
         return supported_sw_versions
 
-    def _find_software(self):
+    def _get_software_index(self):
         """
-        Find executables in the default install locations.
+        Returns the software index for this host.
+
+        :returns: :class:`SoftwareIndex` instance.
         """
+        cache_root = sgtk.util.LocalFileStorageManager.get_global_root(
+            sgtk.util.LocalFileStorageManager.CACHE
+        )
+        return SoftwareIndex(
+            SoftwareIndex.default_path(cache_root),
+            repr(sorted(self.COMPONENT_REGEX_LOOKUP.items())),
+            self.logger
+        )
 
-        # all the executable templates for the current OS
-        executable_templates = self.EXECUTABLE_TEMPLATES.get(sys.platform, [])
+    def _get_discovery_roots(self):
+        """
+        Returns the directories to look for Krita installs in, on top of
+        the executable templates.
 
-        # all the discovered executables
-        sw_versions = []
+        :returns: List of directory paths, without duplicates.
+        """
+        roots = list(self.get_setting("discovery_roots") or [])
+        roots.extend(os.environ.get(self.DISCOVERY_ROOTS_ENV_VAR, "").split(os.pathsep))
+
+        discovery_roots = []
+        for root in roots:
+            if not root:
+                continue
+            root = os.path.normpath(os.path.expanduser(os.path.expandvars(root)))
+            if root not in discovery_roots:
+                discovery_roots.append(root)
+        return discovery_roots
+
+    def _scan_source(self, software_index, source):
+        """
+        Finds the executables of an executable template or discovery root.
 
-        for executable_template in executable_templates:
+        Runs in a worker thread and must not modify the software index.
 
-            self.logger.debug("Processing template %s.", executable_template)
+        :param software_index: :class:`SoftwareIndex` to look matches up in.
+        :param tuple source: ``(is_template, template_or_root)`` tuple.
+        :returns: ``(stamp, matches, indexed)`` tuple, where ``matches`` is a
+            list of ``(executable_path, key_dict)`` tuples.
+        """
+        (is_template, template_or_root) = source
+
+        if is_template:
+            stamp = software_index.stamp(template_or_root)
+        else:
+            stamp = software_index.directory_stamp(template_or_root)
 
+        executable_matches = software_index.get_matches(template_or_root, stamp)
+        if executable_matches is not None:
+            return (stamp, executable_matches, True)
+
+        if is_template:
             executable_matches = self._glob_and_match(
-                executable_template,
+                template_or_root,
                 self.COMPONENT_REGEX_LOOKUP
             )
+        else:
+            executable_matches = [
+                (executable_path, {}) for executable_path in find_root_executables(
+                    template_or_root,
+                    self.ROOT_EXECUTABLE_PATTERNS.get(sys.platform, [])
+                )
+            ]
+        return (stamp, executable_matches, False)
+
+    def _get_appimage_metadata_cache(self):
+        """
+        Returns the cache of the metadata read from AppImages.
+
+        :returns: :class:`AppImageMetadataCache` instance.
+        """
+        cache_root = sgtk.util.LocalFileStorageManager.get_global_root(
+            sgtk.util.LocalFileStorageManager.CACHE
+        )
+        return AppImageMetadataCache(AppImageMetadataCache.default_path(cache_root), self.logger)
+
+    def _probe_executable(self, software_index, metadata_cache, executable_path):
+        """
+        Determines the real version of an executable.
+
+        The version and icon of an AppImage are read from its embedded file
+        system rather than by running it, which would unpack all of Krita.
+        AppImages are only hashed when their size or modification time
+        changed since they were last seen at their path.
+
+        Runs in a worker thread and must not modify the software index or the
+        metadata cache.
+
+        :param software_index: :class:`SoftwareIndex` to look versions up in.
+        :param metadata_cache: :class:`AppImageMetadataCache` to look AppImages
+            up in.
+        :param str executable_path: Path to the executable.
+        :returns: ``(size, mtime, version, indexed, appimage)`` tuple. The
+            version is None if the executable didn't report one. ``appimage``
+            is None for other executables, a ``(key, metadata, cached)`` tuple
+            otherwise.
+        """
+        stat = os.stat(executable_path)
+
+        appimage = None
+        if is_appimage(executable_path):
+            key = metadata_cache.find_key(executable_path, stat.st_size, stat.st_mtime)
+            if key is None:
+                key = appimage_key(executable_path, stat.st_size, stat.st_mtime)
+            metadata = metadata_cache.get(key)
+            appimage = (key, metadata or metadata_cache.read(executable_path, key), metadata is not None)
+            if appimage[1]["version"]:
+                return (stat.st_size, stat.st_mtime, appimage[1]["version"], True, appimage)
+
+        version = software_index.get_version(executable_path, stat.st_size, stat.st_mtime)
+        if version is not None:
+            return (stat.st_size, stat.st_mtime, version or None, True, appimage)
+
+        version = probe_version(executable_path, self.VERSION_PROBE_TIMEOUT)
+        return (stat.st_size, stat.st_mtime, version, False, appimage)
+
+    def _find_software(self, force_refresh=False):
+        """
+        Find executables in the default install locations and the
+        discovery roots.
+
+        Templates and roots are scanned concurrently, then the version of
+        every executable found is probed concurrently. Both steps reuse the
+        software index where possible.
+
+        :param bool force_refresh: Whether to scan every template and root
+            and probe every executable again instead of using the software
+            index.
+        """
+
+        # all the executable templates for the current OS
+        executable_templates = self.EXECUTABLE_TEMPLATES.get(sys.platform, [])
+        discovery_roots = self._get_discovery_roots()
+
+        software_index = self._get_software_index()
+        metadata_cache = self._get_appimage_metadata_cache()
+        if force_refresh:
+            software_index.clear()
+            metadata_cache.prune([])
+
+        sources = [(True, template) for template in executable_templates]
+        sources.extend((False, root) for root in discovery_roots)
+
+        # all the discovered executables, mapped to the version found in
+        # their path if any.
+        executable_versions = {}
+        executable_paths = []
+        complete = True
+
+        scan_results = map_concurrently(
+            lambda source: self._scan_source(software_index, source),
+            sources,
+            self.DISCOVERY_TIMEOUT,
+            self.DISCOVERY_THREADS
+        )
+        for ((is_template, template_or_root), result, error) in scan_results:
+            if error:
+                self.logger.warning("Skipping Krita install location %s: %s", template_or_root, error)
+                complete = False
+                continue
+
+            (stamp, executable_matches, indexed) = result
+            if indexed:
+                self.logger.debug("Using indexed matches for %s.", template_or_root)
+            else:
+                self.logger.debug("Processed %s.", template_or_root)
+                software_index.set_matches(template_or_root, stamp, executable_matches)
 
-            # Extract all products from that executable.
             for (executable_path, key_dict) in executable_matches:
+                if executable_path not in executable_versions:
+                    executable_paths.append(executable_path)
+                    # extract the matched keys form the key_dict (default to None if
+                    # not included)
+                    executable_versions[executable_path] = key_dict.get("version")
+
+        probe_results = map_concurrently(
+            lambda executable_path: self._probe_executable(software_index, metadata_cache, executable_path),
+            executable_paths,
+            self.VERSION_PROBE_TIMEOUT,
+            self.DISCOVERY_THREADS
+        )
 
-                # extract the matched keys form the key_dict (default to None if
-                # not included)
-                executable_version = key_dict.get("version")
-
-                sw_versions.append(
-                    SoftwareVersion(
-                        executable_version,
-                        "Krita",
-                        executable_path,
-                        self._icon_from_executable(executable_path)
-                    )
+        sw_versions = []
+        # the AppImages seen, the others are dropped from the metadata cache
+        # unless some executable couldn't be probed.
+        appimage_keys = []
+        probed_all = complete
+        for (executable_path, result, error) in probe_results:
+            executable_version = executable_versions[executable_path]
+            bundled_icon = None
+
+            if error:
+                self.logger.debug("Could not probe %s: %s", executable_path, error)
+                probed_all = False
+            else:
+                (size, mtime, probed_version, indexed, appimage) = result
+                if appimage:
+                    (key, metadata, cached) = appimage
+                    if not cached:
+                        metadata_cache.set(key, metadata)
+                    metadata_cache.set_path(executable_path, size, mtime, key)
+                    appimage_keys.append(key)
+                    bundled_icon = metadata["icon"]
+                if not indexed:
+                    # remember executables without a version as well, they
+                    # would be probed on every scan otherwise.
+                    software_index.set_version(executable_path, size, mtime, probed_version)
+                if probed_version:
+                    executable_version = probed_version
+
+            if not executable_version:
+                self.logger.debug("Could not determine the version of %s.", executable_path)
+                continue
+
+            sw_versions.append(
+                SoftwareVersion(
+                    executable_version,
+                    "Krita",
+                    executable_path,
+                    self._icon_from_executable(executable_path, bundled_icon)
                 )
+            )
+
+        # only forget probed versions when we know every executable
+        # there is, a timed out share would be probed again otherwise.
+        software_index.prune(
+            executable_templates + discovery_roots,
+            executable_paths if complete else None
+        )
+        software_index.save()
+
+        if probed_all:
+            metadata_cache.prune(appimage_keys)
+        metadata_cache.save()
 
         return sw_versions
@@ -0,0 +1,183 @@
+import importlib.machinery
+import importlib.util
+import json
+import os
+import sys
+import threading
+
+# Layout version of the module location cache.
+CACHE_VERSION = 1
+
+
+def dedupe_paths(paths):
+    """
+    Returns paths without the empty and repeated ones, in their order.
+
+    The first occurrence of a path wins, like it does when importing, so
+    dropping the later ones doesn't change which modules are found.
+
+    :param paths: Iterable of paths.
+    :returns: List of normalized paths.
+    """
+    result = []
+    seen = set()
+    for path in paths:
+        if not path:
+            continue
+        path = os.path.normpath(path)
+        key = os.path.normcase(path)
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def extend_sys_path(paths):
+    """
+    Appends paths to ``sys.path``, skipping the ones it already has.
+
+    :param paths: Iterable of paths.
+    :returns: List of the paths added.
+    """
+    present = set(os.path.normcase(os.path.normpath(path)) for path in sys.path if path)
+    added = [path for path in dedupe_paths(paths) if os.path.normcase(path) not in present]
+    sys.path.extend(added)
+    return added
+
+
+class ModuleLocationCache(object):
+    """
+    Meta path finder remembering where the top level modules of some paths
+    were found, across Krita sessions.
+
+    Finding a module through ``sys.path`` looks into every entry before the
+    one that has it, each of them a stat at least, and the Toolkit entries
+    are often on network shares. Known modules are loaded straight from the
+    file they were found in last time instead, which only costs checking
+    that the file is still there. Unknown modules are found by the regular
+    path finder, and remembered when they come from one of the cached
+    paths. The cache is discarded when ``sys.path`` changes or when a
+    module is added to or removed from one of the cached paths, which
+    changes the modification time of its folder.
+    """
+
+    def __init__(self, path, cached_paths):
+        """
+        :param str path: Path to the cache file.
+        :param cached_paths: Entries of ``sys.path`` whose modules are
+            remembered.
+        """
+        self._path = path
+        self._cached_paths = tuple(
+            os.path.normcase(os.path.join(os.path.normpath(p), "")) for p in cached_paths
+        )
+        self._key = [CACHE_VERSION, sys.version, list(sys.path), [_mtime(p) for p in cached_paths]]
+        self._locations = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def default_path(folder):
+        """
+        Returns the cache file path in the folder the launcher passed in
+        SG_KRITA_IMPORT_CACHE, which is specific to the host.
+        """
+        return os.path.join(folder, "module_locations.json")
+
+    def install(self):
+        """
+        Puts the finder in front of the regular path finder.
+        """
+        if self in sys.meta_path:
+            return
+        index = len(sys.meta_path)
+        if importlib.machinery.PathFinder in sys.meta_path:
+            index = sys.meta_path.index(importlib.machinery.PathFinder)
+        sys.meta_path.insert(index, self)
+
+    def uninstall(self):
+        """
+        Removes the finder.
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        # submodules are searched in their package only, which is cheap
+        if path is not None:
+            return None
+
+        location = self._locations.get(fullname)
+        if location:
+            (origin, search_location) = location
+            if os.path.isfile(origin):
+                return importlib.util.spec_from_file_location(
+                    fullname,
+                    origin,
+                    submodule_search_locations=[search_location] if search_location else None,
+                )
+            with self._lock:
+                self._locations.pop(fullname, None)
+                self._dirty = True
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, None, target)
+        if spec and spec.has_location and spec.origin and self._is_cached(spec.origin):
+            search_locations = spec.submodule_search_locations
+            if search_locations is None or len(search_locations) == 1:
+                with self._lock:
+                    self._locations[fullname] = [
+                        spec.origin,
+                        search_locations[0] if search_locations else None,
+                    ]
+                    self._dirty = True
+        return spec
+
+    def save(self):
+        """
+        Writes the cache if it changed. Failing to write it is not fatal,
+        the modules are found through ``sys.path`` again next time.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"key": self._key, "locations": dict(self._locations)}
+            self._dirty = False
+
+        tmp_path = "{}.{}.tmp".format(self._path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(tmp_path, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp_path, self._path)
+        except OSError:
+            pass
+
+    def _is_cached(self, origin):
+        """
+        Whether a module file is in one of the cached paths.
+        """
+        return os.path.normcase(origin).startswith(self._cached_paths)
+
+    def _load(self):
+        """
+        Reads the cache, ignoring it when it was written for another path.
+        """
+        try:
+            with open(self._path, "r") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+
+        if data.get("key") == self._key:
+            self._locations = data.get("locations") or {}
+
+
+def _mtime(path):
+    """
+    Returns the modification time of a path, None if it doesn't exist.
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -1,72 +1,210 @@
 import sys
 import os
+import json
+import threading
+import time
+
+# Time at which Krita loaded this plugin, the end of Krita's own boot.
+_PLUGIN_LOADED = time.time()
 
 from krita import *
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QAction, QMenu
 
+from .import_cache import ModuleLocationCache, dedupe_paths, extend_sys_path
+
+_trace_lock = threading.Lock()
+
+
+def _record_span(name, start, end, category="plugin"):
+    """
+    Adds a span to the startup trace the engine writes out, which is handed
+    over through the SG_KRITA_STARTUP_TRACE environment variable.
+    """
+    with _trace_lock:
+        try:
+            spans = json.loads(os.environ.get("SG_KRITA_STARTUP_TRACE") or "[]")
+        except ValueError:
+            spans = []
+        spans.append({"name": name, "cat": category, "start": start, "end": end})
+        os.environ["SG_KRITA_STARTUP_TRACE"] = json.dumps(spans)
+
 
 class ShotgunExtension(Extension):
     """
     Note: The Shotgun integration requires shotgun to be python3 compatible.
     
     Up until then, we can keep this extension enabled.
+
+    By default Toolkit is imported and the engine started while Krita starts
+    up. When the SG_KRITA_DEFERRED_BOOTSTRAP environment variable is set,
+    Toolkit is imported in a background thread instead and the engine is
+    started on the main thread once Krita's event loop runs, with a
+    "Loading..." Shotgun menu showing in the meantime.
     """
 
+    # Setting this environment variable enables the deferred bootstrap.
+    DEFERRED_BOOTSTRAP_ENV_VAR = "SG_KRITA_DEFERRED_BOOTSTRAP"
+
+    # Milliseconds between checks whether the background import finished.
+    IMPORT_POLL_INTERVAL = 50
+
     def __init__(self, parent):
         """ constructor """
         super().__init__(parent)
         
         self._use_shotgun = False
+        self._deferred = bool(os.environ.get(self.DEFERRED_BOOTSTRAP_ENV_VAR))
+        self._import_thread = None
+        self._engine_requested = False
+        self._loading_action = None
+        self._module_cache = None
 
     def setup(self):
         """
         Make sure we load shotgun
         """
+        launch_time = os.environ.get("SG_KRITA_LAUNCH_TIME")
+        if launch_time:
+            _record_span("krita_boot", float(launch_time), _PLUGIN_LOADED, "krita")
+
+        if self._deferred:
+            # Importing Toolkit doesn't touch Qt, so it can happen while Krita
+            # builds its UI.
+            self._import_thread = threading.Thread(
+                target=self._import_toolkit,
+                name="ShotgunBootstrap"
+            )
+            self._import_thread.daemon = True
+            self._import_thread.start()
+        else:
+            self._import_toolkit()
+
+    def _import_toolkit(self):
+        """
+        Makes Toolkit importable and initializes its file logging.
+        """
+        start = time.time()
         try:
-            if os.environ.get('SG_PYTHONPATH'):
-                paths = os.environ.get('SG_PYTHONPATH').split(os.pathsep)
-                for p in paths:
-                    sys.path.append(p)
+            paths = dedupe_paths(os.environ.get('SG_PYTHONPATH', '').split(os.pathsep))
+            extend_sys_path(paths)
+
+            cache_folder = os.environ.get('SG_KRITA_IMPORT_CACHE')
+            if cache_folder:
+                self._module_cache = ModuleLocationCache(
+                    ModuleLocationCache.default_path(cache_folder), paths
+                )
+                self._module_cache.install()
+
             import sgtk
             sgtk.LogManager().initialize_base_file_handler("tk-krita")
-        except:
+        except Exception:
             self._use_shotgun = False
             # for debugging we raise the error
+        else:
+            self._use_shotgun = True
+        _record_span("import_toolkit", start, time.time())
 
     def createActions(self, window):
         """
         Post startup script
         """
-        if self._use_shotgun:
+        # Krita calls this for every window, the engine only starts once.
+        if self._engine_requested:
+            return
+        self._engine_requested = True
+
+        if self._deferred:
+            # let Krita finish starting before doing anything else
+            QTimer.singleShot(0, lambda: self._show_loading_menu(window))
+            QTimer.singleShot(0, self._continue_bootstrap)
+        elif self._use_shotgun:
+            self._start_engine()
+
+    def _show_loading_menu(self, window):
+        """
+        Adds a placeholder Shotgun menu that the engine takes over once it
+        is started.
+        """
+        menu_bar = window.qwindow().menuBar()
+
+        menu = QMenu("Shotgun", menu_bar)
+        menu.setObjectName("shotgun")
+
+        self._loading_action = QAction("Loading...", menu)
+        self._loading_action.setEnabled(False)
+        menu.addAction(self._loading_action)
+
+        menu_action = menu_bar.addMenu(menu)
+        menu_action.setObjectName("shotgun")
+
+    def _continue_bootstrap(self):
+        """
+        Starts the engine once the background import finished.
+        """
+        if self._import_thread.is_alive():
+            QTimer.singleShot(self.IMPORT_POLL_INTERVAL, self._continue_bootstrap)
+            return
+
+        if not self._use_shotgun:
+            self._set_loading_text("Shotgun failed to load.")
+            return
+
+        try:
+            self._start_engine()
+        except Exception as e:
             import sgtk
-            logger = sgtk.LogManager.get_logger(__name__)
-            
-            env_engine = os.environ.get('SGTK_ENGINE')
-            env_context = os.environ.get('SGTK_CONTEXT')
-            if not env_engine:
-                raise Exception("Shotgun: Missing required environment "
-                                  "variable SGTK_ENGINE")
-            if not env_context:
-                raise Exception("Shotgun: Missing required environment "
-                                  "variable SGTK_CONTEXT")
-                                  
-            try:
-                context = sgtk.context.deserialize(env_context)
-            except Exception as e:
-                raise Exception("Shotgun: Could not create context! "
-                                  "Shotgun Pipeline Toolkit will be disabled. "
-                                  "Details: {}".format(e))
-            
-            try:
-                logger.debug("Launching engine instance '{0}' "
-                             "for context '{1}'".format(env_engine, 
-                                                        env_context))
-                engine = sgtk.platform.start_engine(env_engine,
-                                                    context.sgtk,
-                                                    context)
-            except Exception as e:
-                raise Exception("Shotgun: Could not start engine: "
-                                  "\n{}".format(e))
+            sgtk.LogManager.get_logger(__name__).exception(e)
+            self._set_loading_text("Shotgun failed to start.")
+
+    def _set_loading_text(self, text):
+        """
+        Updates the placeholder menu item, if the engine didn't replace it.
+        """
+        try:
+            self._loading_action.setText(text)
+        except (AttributeError, RuntimeError):
+            pass
+
+    def _start_engine(self):
+        """
+        Starts the engine for the context passed by the launcher.
+        """
+        import sgtk
+        logger = sgtk.LogManager.get_logger(__name__)
+        
+        env_engine = os.environ.get('SGTK_ENGINE')
+        env_context = os.environ.get('SGTK_CONTEXT')
+        if not env_engine:
+            raise Exception("Shotgun: Missing required environment "
+                              "variable SGTK_ENGINE")
+        if not env_context:
+            raise Exception("Shotgun: Missing required environment "
+                              "variable SGTK_CONTEXT")
+                              
+        try:
+            context = sgtk.context.deserialize(env_context)
+        except Exception as e:
+            raise Exception("Shotgun: Could not create context! "
+                              "Shotgun Pipeline Toolkit will be disabled. "
+                              "Details: {}".format(e))
+        
+        try:
+            logger.debug("Launching engine instance '{0}' "
+                         "for context '{1}'".format(env_engine, 
+                                                    env_context))
+            start = time.time()
+            engine = sgtk.platform.start_engine(env_engine,
+                                                context.sgtk,
+                                                context)
+            _record_span("start_engine", start, time.time())
+        except Exception as e:
+            raise Exception("Shotgun: Could not start engine: "
+                              "\n{}".format(e))
+        finally:
+            # most of what Toolkit and the apps import is known by now
+            if self._module_cache:
+                self._module_cache.save()
 
 # And add the extension to Krita's list of extensions:
 Krita.instance().addExtension(ShotgunExtension(Krita.instance())) 
@@ -0,0 +1,130 @@
+"""
+Tests of the engine and launcher, run against the stand-in ``krita`` and
+``sgtk`` modules of ``benchmarks/fakes``::
+
+    python -m pytest tests
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+TESTS_ROOT = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTS_ROOT)
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks", "fakes"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "python"))
+
+
+def _load_module(name, file_name):
+    """
+    Loads one of the engine's top level files as a module.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def engine_module():
+    return _load_module("tk_krita_engine", "engine.py")
+
+
+@pytest.fixture(scope="session")
+def startup_module():
+    return _load_module("tk_krita_startup", "startup.py")
+
+
+class App(object):
+    """
+    Stand-in for an app instance registering one command, named after the
+    app. What happens to the app is appended to ``log``: ``("init", name)``,
+    ``("run", name)`` when its command runs and ``("destroy", name)``.
+    """
+
+    def __init__(self, instance_name, settings, log):
+        self.instance_name = instance_name
+        self.display_name = instance_name
+        self.version = "v1.0.0"
+        self.settings = settings
+        self.engine = None
+        self._log = log
+
+    def init_app(self):
+        self._log.append(("init", self.instance_name))
+        self.engine.register_command(
+            "Open %s" % self.instance_name,
+            lambda: self._log.append(("run", self.instance_name)),
+            {"app": self}
+        )
+
+    def destroy_app(self):
+        self._log.append(("destroy", self.instance_name))
+
+
+@pytest.fixture
+def app_log():
+    """
+    What happened to the apps made by :func:`make_app`.
+    """
+    return []
+
+
+@pytest.fixture
+def make_app(app_log):
+    """
+    Makes a stand-in app, logging to :func:`app_log`.
+    """
+    def make_app(instance_name, settings=None):
+        return App(instance_name, settings or {}, app_log)
+    return make_app
+
+
+@pytest.fixture
+def start_engine(engine_module, qt, tmp_path, monkeypatch):
+    """
+    Starts the engine in a fresh stand-in Krita, caching below the test's
+    temporary folder. Engines still running at the end of the test are
+    destroyed.
+    """
+    import sgtk
+    from krita import Krita
+
+    monkeypatch.setattr(sgtk.util.LocalFileStorageManager, "root", str(tmp_path / "cache"))
+    engines = []
+
+    def start_engine(settings=None, apps=(), context=None, environment=None):
+        Krita.reset()
+        engine_settings = {
+            "automatic_context_switch": False,
+            "startup_trace": False,
+            "run_at_startup": [],
+            "run_at_startup_budget": 0,
+            "menu_favourites": [],
+            "entity_cache": False,
+        }
+        engine_settings.update(settings or {})
+        if context is None:
+            tk = sgtk.Sgtk(os.path.join(os.sep, "projects", "demo"))
+            context = sgtk.Context(tk, tk.project)
+        engine = engine_module.KritaEngine(
+            context.sgtk, context, "tk-krita", engine_settings, list(apps), environment
+        )
+        engines.append(engine)
+        return engine
+
+    yield start_engine
+    for engine in engines:
+        if sgtk.platform.current_engine() is engine:
+            engine.destroy()
+
+
+@pytest.fixture
+def qt():
+    from sgtk.platform import qt
+    del qt._pending[:]
+    yield qt
+    del qt._pending[:]
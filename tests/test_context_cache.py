@@ -0,0 +1,35 @@
+import logging
+import os
+
+import sgtk
+
+from tk_krita import ContextCache, TaskRunner
+
+
+def test_changed_configurations_are_dropped_off_the_lookup_path(tmp_path, qt, monkeypatch):
+    core = tmp_path / "demo" / "config" / "core"
+    core.mkdir(parents=True)
+    (core / "templates.yml").write_text(u"keys: {}\n")
+    tk = sgtk.Sgtk(str(tmp_path / "demo"))
+    path = str(tmp_path / "demo" / "sh010" / "paint.kra")
+    other_path = str(tmp_path / "demo" / "sh010" / "comp.kra")
+    cache = ContextCache(logging.getLogger("test"))
+    cache.store(path, None, tk, tk.context_from_path(path))
+
+    os.utime(str(core / "templates.yml"), (0, 0))
+    stats = []
+    monkeypatch.setattr(os.path, "getmtime", lambda name: stats.append(name) or 0)
+    # looking up doesn't read the configuration
+    assert cache.lookup(path, None)[0] is tk
+    assert cache.lookup(other_path, None)[0] is tk
+    assert stats == []
+    monkeypatch.undo()
+
+    runner = TaskRunner(logging.getLogger("test"), lambda func, *args: qt._pending.append(lambda: func(*args)))
+    try:
+        cache.check_configurations(runner).wait(5)
+        qt.process_events()
+    finally:
+        runner.stop()
+    assert cache.lookup(path, None) is None
+    assert cache.lookup(other_path, None) is None
@@ -0,0 +1,83 @@
+import logging
+import os
+import re
+
+import pytest
+import sgtk
+
+
+@pytest.fixture
+def contexts():
+    tk = sgtk.Sgtk(os.path.join(os.sep, "projects", "demo"))
+    return [
+        sgtk.Context(tk, tk.project, {"type": "Shot", "id": index, "name": "sh%03d" % index}) for index in range(2)
+    ]
+
+
+@pytest.fixture
+def environment(make_app):
+    def environment(context):
+        # the second shot has a review app instead of the publisher
+        shot = context.entity["id"]
+        return [
+            make_app("tk-multi-loader"),
+            make_app("tk-multi-publish" if shot == 0 else "tk-multi-review"),
+            make_app("tk-multi-workfiles", {"shot": shot}),
+        ]
+    return environment
+
+
+def _menu_actions(engine):
+    """
+    Returns the actions of the Shotgun menu by text.
+    """
+    (menu_action,) = [action for action in engine._get_dialog_parent().menuBar().actions() if action.menu()]
+    return dict((action.text(), action) for action in menu_action.menu().actions())
+
+
+def test_commands_of_the_new_apps_are_indexed(start_engine, contexts, environment):
+    engine = start_engine(context=contexts[0], apps=environment(contexts[0]), environment=environment)
+    engine.change_context(contexts[1])
+
+    command_index = engine._command_index
+    assert not command_index.is_stale(engine.commands)
+    assert command_index.commands_for_app("tk-multi-publish") == {}
+    assert list(command_index.commands_for_app("tk-multi-review")) == ["Open tk-multi-review"]
+    command = command_index.find("tk-multi-workfiles", "Open tk-multi-workfiles")
+    assert command["properties"]["app"] is engine.apps["tk-multi-workfiles"]
+
+
+def test_only_the_changed_menu_entries_are_updated(start_engine, contexts, environment, app_log):
+    engine = start_engine(context=contexts[0], apps=environment(contexts[0]), environment=environment)
+    engine._menu_generator.update()
+    before = _menu_actions(engine)
+
+    engine.change_context(contexts[1])
+    after = _menu_actions(engine)
+    assert "Open tk-multi-publish" not in after
+    assert "Open tk-multi-review" in after
+    assert after["Open tk-multi-loader"] is before["Open tk-multi-loader"]
+    assert after["Open tk-multi-workfiles"] is before["Open tk-multi-workfiles"]
+
+    # the kept action runs the command of the app loaded again
+    del app_log[:]
+    after["Open tk-multi-workfiles"].trigger()
+    assert app_log == [("run", "tk-multi-workfiles")]
+    assert engine.commands["Open tk-multi-workfiles"]["properties"]["app"] is engine.apps["tk-multi-workfiles"]
+
+
+def test_reused_apps_are_reported(start_engine, contexts, environment, app_log, caplog, monkeypatch):
+    engine = start_engine(context=contexts[0], apps=environment(contexts[0]), environment=environment)
+    # the engine logger doesn't propagate to the captured records
+    monkeypatch.setattr(engine, "logger", logging.getLogger("test_context_change"))
+    caplog.set_level(logging.DEBUG, logger="test_context_change")
+    del app_log[:]
+
+    engine.change_context(contexts[1])
+    assert sorted(app_log) == [
+        ("destroy", "tk-multi-publish"),
+        ("destroy", "tk-multi-workfiles"),
+        ("init", "tk-multi-review"),
+        ("init", "tk-multi-workfiles"),
+    ]
+    assert [message for message in caplog.messages if re.match(r"Changed context .* reused 1 apps and loaded 2", message)]
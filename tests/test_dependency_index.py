@@ -0,0 +1,60 @@
+import logging
+import multiprocessing
+import zipfile
+
+from tk_krita import DependencyIndex
+from tk_krita.dependency_index import normalize_path, read_references
+
+
+def _write_kra(path, layers):
+    maindoc = (
+        '<?xml version="1.0" encoding="UTF-8"?><DOC><IMAGE width="16" height="16">'
+        '<layers>%s</layers></IMAGE></DOC>' % layers
+    )
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("maindoc.xml", maindoc)
+
+
+def test_references_of_nested_layers(tmp_path):
+    path = str(tmp_path / "paint.kra")
+    _write_kra(
+        path,
+        '<layer name="Group" nodetype="grouplayer"><layers>'
+        '<layer name="Plate" nodetype="filelayer" source="plates/bg.png"/>'
+        '</layers></layer>'
+        '<layer name="Paint" nodetype="paintlayer" filename="layer1"/>'
+        '<layer name="Ref" nodetype="filelayer" source="ref.jpg"/>'
+    )
+    assert read_references(path) == sorted([
+        normalize_path(str(tmp_path / "plates" / "bg.png")),
+        normalize_path(str(tmp_path / "ref.jpg")),
+    ])
+
+
+def test_unreadable_documents_are_not_indexed(tmp_path):
+    index = DependencyIndex(str(tmp_path / "index.json"), logging.getLogger("test"))
+    path = str(tmp_path / "paint.kra")
+    with open(path, "w") as fh:
+        fh.write("not a zip file")
+
+    assert index.update([path]) == 1
+    assert index.documents() == []
+
+    _write_kra(path, '<layer name="Ref" nodetype="filelayer" source="ref.jpg"/>')
+    assert index.update([path]) == 1
+    assert index.referenced_by(str(tmp_path / "ref.jpg")) == [normalize_path(path)]
+
+
+def test_headless_indexing_does_not_spawn_processes(engine_module, start_engine, monkeypatch, tmp_path):
+    def spawned_pool(*args, **kwargs):
+        raise AssertionError("spawned processes can't import the modules Toolkit loaded")
+
+    monkeypatch.setattr(multiprocessing, "Pool", spawned_pool)
+    monkeypatch.setenv(engine_module.KritaEngine.HEADLESS_ENV_VAR, "1")
+    engine = start_engine()
+    folder = tmp_path / "shot"
+    folder.mkdir()
+    _write_kra(str(folder / "paint.kra"), '<layer name="Ref" nodetype="filelayer" source="ref.jpg"/>')
+
+    index = engine.index_kra_files(str(folder))
+    assert index.referenced_by(str(folder / "ref.jpg")) == [normalize_path(str(folder / "paint.kra"))]
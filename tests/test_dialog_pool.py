@@ -0,0 +1,123 @@
+import logging
+
+from sgtk.platform.qt import QtCore, Signal
+
+from tk_krita import DialogPool
+
+
+class _Widget(object):
+    def __init__(self):
+        self.hidden = False
+
+    def isHidden(self):
+        return self.hidden
+
+    def show(self):
+        self.hidden = False
+
+    def hide(self):
+        self.hidden = True
+
+
+class _Dialog(_Widget):
+    """
+    Dialog closing like a Toolkit dialog: closing it sends a close event
+    to its filters, ``done`` hides it and emits ``finished``.
+    """
+
+    def __init__(self, widget):
+        _Widget.__init__(self)
+        self.widget = widget
+        self.finished = Signal()
+        self.closed = False
+        self._filters = []
+        self._parent = None
+
+    def parent(self):
+        return self._parent
+
+    def setParent(self, parent, flags=None):
+        self._parent = parent
+
+    def windowFlags(self):
+        return 0
+
+    def findChildren(self, object_class):
+        return []
+
+    def raise_(self):
+        pass
+
+    def activateWindow(self):
+        pass
+
+    def installEventFilter(self, event_filter):
+        self._filters.append(event_filter)
+
+    def removeEventFilter(self, event_filter):
+        self._filters.remove(event_filter)
+
+    def close(self):
+        event = QtCore.QEvent(QtCore.QEvent.Close)
+        if not any(event_filter.eventFilter(self, event) for event_filter in self._filters):
+            self.closed = True
+            self.hide()
+
+    def done(self, result):
+        self.hide()
+        self.finished.emit(result)
+
+
+def _open(pool, key):
+    pooled = pool.acquire(key, None)
+    if pooled:
+        return pooled[0]
+    dialog = _Dialog(_Widget())
+    pool.add(key, dialog, dialog.widget)
+    return dialog
+
+
+def test_closed_dialog_is_reused_with_its_widget_shown():
+    pool = DialogPool(logging.getLogger("test"), 4, 1024, estimate=lambda dialog: 1)
+    dialog = _open(pool, "key")
+
+    # the app closes its widget, which closes the dialog
+    dialog.widget.hide()
+    dialog.close()
+    assert not dialog.closed
+
+    assert _open(pool, "key") is dialog
+    assert not dialog.widget.isHidden()
+
+
+def test_finished_dialog_leaves_the_pool():
+    pool = DialogPool(logging.getLogger("test"), 4, 1024, estimate=lambda dialog: 1)
+    dialog = _open(pool, "key")
+
+    dialog.done(0)
+    dialog.close()
+    assert dialog.closed
+
+    assert _open(pool, "key") is not dialog
+
+
+def test_dialogs_are_not_reused_after_a_context_change(start_engine, make_app, monkeypatch):
+    app = make_app("tk-multi-a")
+    engine = start_engine({"dialog_pool_size": 4}, [app], environment=lambda context: [app])
+    dialogs = []
+
+    def create_dialog_with_widget(title, bundle, widget_class, *args, **kwargs):
+        dialogs.append(_Dialog(widget_class()))
+        return (dialogs[-1], dialogs[-1].widget)
+
+    # not part of the stand-in engine
+    monkeypatch.setattr(engine, "_create_dialog_with_widget", create_dialog_with_widget, raising=False)
+
+    widget = engine.show_dialog("A", app, _Widget)
+    dialogs[-1].close()
+    assert engine.show_dialog("A", app, _Widget) is widget
+
+    engine.change_context(engine.context)
+    dialogs[0].close()
+    assert dialogs[0].closed
+    assert engine.show_dialog("A", app, _Widget) is not widget
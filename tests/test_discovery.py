@@ -0,0 +1,31 @@
+import time
+
+from tk_krita_launcher import DiscoveryTimeout, map_concurrently
+
+
+def test_timeout_starts_when_the_item_runs():
+    results = map_concurrently(lambda item: time.sleep(0.1) or item, [1, 2, 3], 0.25, 1)
+    assert results == [
+        (1, 1, None), (2, 2, None), (3, 3, None)
+    ]
+
+
+def test_stuck_item_does_not_hold_the_queue():
+    def func(item):
+        time.sleep(5 if item == "stuck" else 0.01)
+        return item
+
+    start = time.time()
+    results = map_concurrently(func, ["stuck", "a", "b"], 0.2, 1)
+    assert time.time() - start < 1
+    assert isinstance(results[0][2], DiscoveryTimeout)
+    assert [result for (_, result, _) in results[1:]] == ["a", "b"]
+
+
+def test_errors_are_returned():
+    def func(item):
+        raise ValueError(item)
+
+    [(item, result, error)] = map_concurrently(func, ["x"], 1, 4)
+    assert (item, result) == ("x", None)
+    assert isinstance(error, ValueError)
@@ -0,0 +1,32 @@
+import logging
+
+from krita import Document, Krita
+from tk_krita import DocumentWatcher
+
+
+def test_refresh_dropped_as_stale_is_retried(qt):
+    Krita.reset()
+    krita = Krita.instance()
+    krita.setActiveDocument(Document("/projects/demo/sh010/paint.kra"))
+    refreshes = []
+    watcher = DocumentWatcher(krita, lambda path, is_stale: refreshes.append((path, is_stale)), logging.getLogger())
+    watcher.start()
+
+    watcher.notify()
+    qt.process_events()
+    assert len(refreshes) == 1
+
+    # a notification arrives while the context is being resolved
+    watcher.notify()
+    assert refreshes[0][1]()
+    qt.process_events()
+
+    # the first refresh was dropped, so the same path is resolved again
+    assert len(refreshes) == 2
+    assert not refreshes[1][1]()
+    watcher.applied(refreshes[1][0])
+
+    watcher.notify()
+    qt.process_events()
+    assert len(refreshes) == 2
+    watcher.stop()
@@ -0,0 +1,112 @@
+import datetime
+import logging
+
+import pytest
+import sgtk
+
+from tk_krita import EntityCache
+from tk_krita.entity_cache import UTC
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def shotgun(monkeypatch):
+    monkeypatch.setattr(sgtk, "SIMULATED_LATENCY", 0)
+    monkeypatch.setattr(sgtk.Shotgun, "entities", {
+        ("Shot", 1): {"type": "Shot", "id": 1, "code": "sh001", "sg_status_list": "ip"},
+        ("Shot", 2): {"type": "Shot", "id": 2, "code": "sh002", "sg_status_list": "wtg"},
+    })
+    monkeypatch.setattr(sgtk.Shotgun, "events", [])
+    monkeypatch.setitem(sgtk.call_counts, "shotgun", 0)
+    return sgtk.Shotgun()
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def cache(tmp_path, shotgun, clock):
+    cache = EntityCache(
+        str(tmp_path / "entity_cache.sqlite"), lambda: shotgun, logging.getLogger("test"), ttl=60, clock=clock
+    )
+    yield cache
+    cache.close()
+
+
+def _add_events(shotgun, entities):
+    for entity in entities:
+        shotgun.events.append(
+            {"id": len(shotgun.events) + 1, "entity": entity, "event_type": "Shotgun_Shot_Change"}
+        )
+
+
+def test_fields_are_read_from_shotgun_once(cache):
+    assert cache.find_one("Shot", 1, ["code"])["code"] == "sh001"
+    assert sgtk.call_counts["shotgun"] == 1
+
+    assert cache.find_one("Shot", 1, ["code"])["code"] == "sh001"
+    assert sgtk.call_counts["shotgun"] == 1
+
+    # only the field that isn't cached is queried
+    assert cache.find_one("Shot", 1, ["code", "sg_status_list"])["sg_status_list"] == "ip"
+    assert sgtk.call_counts["shotgun"] == 2
+
+
+def test_expired_fields_are_fetched_again(cache, clock):
+    cache.find_one("Shot", 1, ["code"])
+    clock.now += 61
+    assert cache.get("Shot", 1, ["code"]) == {"type": "Shot", "id": 1}
+
+    cache.find_one("Shot", 1, ["code"])
+    assert sgtk.call_counts["shotgun"] == 2
+
+
+def test_datetimes_are_read_back_as_datetimes(cache):
+    created = datetime.datetime(2024, 3, 1, 12, 30, 15, 250, tzinfo=UTC)
+    updated = datetime.datetime(2024, 3, 2, 8, 0)
+    cache.store({"type": "Shot", "id": 1, "created_at": created, "updated_at": updated, "due_date": "2024-04-01"})
+
+    entity = cache.get("Shot", 1, ["created_at", "updated_at", "due_date"])
+    assert entity["created_at"] == created
+    assert entity["created_at"].tzinfo is not None
+    assert entity["updated_at"] == updated
+    assert entity["updated_at"].tzinfo is None
+    assert entity["due_date"] == "2024-04-01"
+
+
+def test_events_forget_the_changed_entities(cache, shotgun):
+    _add_events(shotgun, [{"type": "Shot", "id": 2}])
+    assert cache.sync_events() == 0
+
+    cache.prefetch([{"type": "Shot", "id": 1}, {"type": "Shot", "id": 2}], {"Shot": ["code"]})
+    _add_events(shotgun, [{"type": "Shot", "id": 2}, None])
+
+    assert cache.sync_events() == 2
+    assert cache.get("Shot", 1, ["code"])["code"] == "sh001"
+    assert cache.get("Shot", 2, ["code"]) == {"type": "Shot", "id": 2}
+    assert cache.sync_events() == 0
+
+
+def test_event_backlog_is_capped(cache, shotgun, monkeypatch):
+    monkeypatch.setattr("tk_krita.entity_cache.EVENT_PAGE_SIZE", 2)
+    cache.sync_events()
+    cache.prefetch([{"type": "Shot", "id": 1}, {"type": "Shot", "id": 2}], {"Shot": ["code"]})
+    _add_events(shotgun, [{"type": "Project", "id": 1}] * 7)
+
+    calls = sgtk.call_counts["shotgun"]
+    assert cache.sync_events(max_events=4) == 4
+    # two pages and the lookup of the latest event
+    assert sgtk.call_counts["shotgun"] - calls == 3
+    assert cache.get("Shot", 1, ["code"]) == {"type": "Shot", "id": 1}
+
+    # the skipped events aren't read later
+    assert cache.sync_events(max_events=4) == 0
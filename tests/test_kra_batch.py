@@ -0,0 +1,80 @@
+import importlib.util
+import multiprocessing
+import struct
+import sys
+import zipfile
+
+import pytest
+
+from tk_krita import kra_batch
+
+
+def _png(width, height):
+    # only the header is read
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height)
+
+
+def _write_kra(path, layer_count=2):
+    layers = "".join(
+        '<layer name="Layer %d" filename="layer%d" nodetype="paintlayer"/>' % (index, index)
+        for index in range(layer_count)
+    )
+    maindoc = (
+        '<?xml version="1.0" encoding="UTF-8"?><DOC><IMAGE width="320" height="200" '
+        'colorspacename="RGBA" x-res="300" y-res="150"><layers>%s</layers></IMAGE></DOC>' % layers
+    )
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/x-krita")
+        archive.writestr("maindoc.xml", maindoc)
+        archive.writestr("mergedimage.png", _png(320, 200))
+        archive.writestr("preview.png", _png(256, 160))
+    return path
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = [_write_kra(str(tmp_path / ("paint%d.kra" % index)), index + 1) for index in range(3)]
+    broken = tmp_path / "broken.kra"
+    broken.write_bytes(b"not a zip file")
+    return paths + [str(broken)]
+
+
+def test_metadata_is_read_from_the_archive(tmp_path):
+    path = _write_kra(str(tmp_path / "paint.kra"))
+    assert kra_batch.read_metadata(path) == {
+        "width": 320,
+        "height": 200,
+        "color_space": "RGBA",
+        "resolution": (300.0, 150.0),
+        "layer_count": 2,
+        "layers": ["Layer 0", "Layer 1"],
+        "merged_image": (320, 200),
+        "preview": (256, 160),
+    }
+
+
+@pytest.mark.parametrize("use_threads", [None, True])
+def test_every_file_is_reported(paths, use_threads):
+    report = kra_batch.process_files(paths, processes=2, use_threads=use_threads)
+
+    assert report.files == 4
+    assert report.failed == 1
+    results = dict((result.path, result) for result in report.results)
+    assert [results[path].result["layer_count"] for path in paths[:3]] == [1, 2, 3]
+    assert results[paths[3]].result is None
+    assert results[paths[3]].error.startswith("BadZipFile")
+    assert report.latency["max"] is not None
+
+
+def test_module_loaded_under_another_name(paths, monkeypatch):
+    # like Toolkit's import_module, the module gets a name that can't be
+    # imported in a new process
+    spec = importlib.util.spec_from_file_location("tkimp_test_kra_batch", kra_batch.__file__)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    # a platform whose processes are spawned by default
+    monkeypatch.setattr(multiprocessing, "Pool", multiprocessing.get_context("spawn").Pool)
+
+    report = module.process_files(paths, processes=2)
+    assert (report.files, report.failed) == (4, 1)
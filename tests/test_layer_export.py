@@ -0,0 +1,69 @@
+import logging
+import os
+import time
+
+from krita import Document, Node
+
+from tk_krita import LayerExporter
+
+
+class _Document(Document):
+    def __init__(self, layers, resolution=300.0):
+        Document.__init__(self, os.path.join(os.sep, "projects", "demo", "paint.kra"), 16, 16, layers)
+        self.resolution = resolution
+
+    def xRes(self):
+        return self.resolution
+
+    def yRes(self):
+        return self.resolution
+
+
+def _cached_files(root):
+    return sorted(
+        os.path.join(folder, file_name) for (folder, _, file_names) in os.walk(root) for file_name in file_names
+    )
+
+
+def test_resolution_is_part_of_the_key(tmp_path):
+    exporter = LayerExporter(str(tmp_path / "cache"), logging.getLogger("test"))
+    layers = [Node("Layer", 16, 16, fill=1)]
+
+    assert exporter.export(_Document(layers), str(tmp_path / "a")).written == 1
+    assert exporter.export(_Document(layers), str(tmp_path / "b")).written == 0
+    assert exporter.export(_Document(layers, 72.0), str(tmp_path / "c")).written == 1
+
+
+def test_least_recently_used_layers_are_evicted(tmp_path):
+    layer_size = 16 * 16 * 4
+    cache_root = str(tmp_path / "cache")
+    exporter = LayerExporter(cache_root, logging.getLogger("test"), max_size=2 * layer_size)
+    layers = [Node("Layer %d" % index, 16, 16, fill=index) for index in range(3)]
+
+    exporter.export(_Document(layers[:2]), str(tmp_path / "a"))
+    (first, second) = _cached_files(cache_root)
+    past = time.time() - 60
+    os.utime(first, (past, past))
+    os.utime(second, (past, past))
+
+    # using the first layer again keeps it over the second one
+    exporter.export(_Document([layers[0], layers[2]]), str(tmp_path / "b"))
+    files = _cached_files(cache_root)
+    assert len(files) == 2
+    assert first in files and second not in files
+    # exported files outlive the cache
+    assert os.path.exists(str(tmp_path / "a" / "Layer 1.png"))
+
+
+def test_layers_unused_for_too_long_are_evicted(tmp_path):
+    cache_root = str(tmp_path / "cache")
+    exporter = LayerExporter(cache_root, logging.getLogger("test"), max_age=3600)
+
+    exporter.export(_Document([Node("Layer", 16, 16, fill=1)]), str(tmp_path / "a"))
+    (old,) = _cached_files(cache_root)
+    past = time.time() - 7200
+    os.utime(old, (past, past))
+
+    exporter.export(_Document([Node("Layer", 16, 16, fill=2)]), str(tmp_path / "b"))
+    files = _cached_files(cache_root)
+    assert len(files) == 1 and old not in files
@@ -0,0 +1,30 @@
+import os
+
+import sgtk
+
+
+def test_stubs_are_checked_against_the_new_context(start_engine, make_app, app_log):
+    tk = sgtk.Sgtk(os.path.join(os.sep, "projects", "demo"))
+    shot = {"type": "Shot", "id": 1, "name": "sh001"}
+    paint = sgtk.Context(tk, tk.project, shot, step={"type": "Step", "id": 3})
+    comp = sgtk.Context(tk, tk.project, shot, step={"type": "Step", "id": 4})
+    other_shot = sgtk.Context(tk, tk.project, dict(shot, id=2), step={"type": "Step", "id": 3})
+
+    def inits():
+        return [name for (event, name) in app_log if event == "init"]
+
+    # the commands are recorded on the first start
+    start_engine({"lazy_apps": True}, [make_app("tk-multi-a")], paint).destroy()
+    assert inits() == ["tk-multi-a"]
+
+    engine = start_engine({"lazy_apps": True}, [make_app("tk-multi-a")], paint)
+    assert engine.lazy_apps.deferred == ["tk-multi-a"]
+
+    # same entity type and step
+    engine.change_context(other_shot)
+    assert engine.lazy_apps.deferred == ["tk-multi-a"]
+
+    engine.change_context(comp)
+    assert engine.lazy_apps.deferred == []
+    assert inits() == ["tk-multi-a", "tk-multi-a"]
+    assert engine.command_index.find("tk-multi-a", "Open tk-multi-a")["properties"]["app"] is engine.apps["tk-multi-a"]
@@ -0,0 +1,52 @@
+import logging
+import threading
+
+from tk_krita import LogSink
+
+
+class _SlowStream(object):
+    """
+    Stream whose first write waits until it is released.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, text):
+        if not self.writing.is_set():
+            self.writing.set()
+            self.release.wait(5)
+        self.lines.extend(text.splitlines())
+
+    def flush(self):
+        pass
+
+
+def _writers():
+    return [thread for thread in threading.enumerate() if thread.name == "tk-krita log writer"]
+
+
+def test_only_one_writer_runs_after_stopping_times_out():
+    stream = _SlowStream()
+    sink = LogSink(stream)
+    sink.start()
+    sink.write(logging.INFO, 0, "first")
+    assert stream.writing.wait(1)
+
+    sink.stop(timeout=0.01)
+    sink.start()
+    assert len(_writers()) == 1
+    # written directly meanwhile
+    sink.write(logging.INFO, 0, "second")
+
+    stream.release.set()
+    sink.stop()
+    assert _writers() == []
+    assert sorted(stream.lines) == ["first", "second"]
+
+    sink.start()
+    sink.write(logging.INFO, 0, "third")
+    sink.stop()
+    assert stream.lines[-1] == "third"
@@ -0,0 +1,36 @@
+import logging
+import os
+
+from tk_krita import SaveQueue, TaskRunner
+
+
+def test_saves_are_processed_at_once_when_synchronous(qt):
+    runner = TaskRunner(logging.getLogger("test"))
+    queue = SaveQueue(runner, logging.getLogger("test"), synchronous=True)
+    calls = []
+    results = []
+    queue.register("hook", lambda path, saves, autosave: calls.append((path, saves, autosave)) or "ok")
+    queue.connect(results.append)
+
+    path = os.path.abspath(os.path.join(os.sep, "projects", "demo", "paint.kra"))
+    queue.notify(path)
+    queue.notify(os.path.join(os.path.dirname(path), ".paint.kra-autosave.kra"))
+
+    assert calls == [(path, 1, False), (path, 1, True)]
+    assert [result.results for result in results] == [{"hook": "ok"}, {"hook": "ok"}]
+    assert queue.pending() == []
+    assert qt._pending == []
+    runner.stop()
+
+
+def test_saves_in_krita_run_the_save_hooks(engine_module, start_engine, monkeypatch):
+    from krita import Krita
+
+    monkeypatch.setenv(engine_module.KritaEngine.HEADLESS_ENV_VAR, "1")
+    engine = start_engine()
+    calls = []
+    engine.register_save_hook("hook", lambda path, saves, autosave: calls.append(path))
+
+    path = os.path.abspath(os.path.join(os.sep, "projects", "demo", "paint.kra"))
+    Krita.instance().notifier().imageSaved.emit(path)
+    assert calls == [path]
@@ -0,0 +1,54 @@
+import logging
+import os
+
+import pytest
+
+from tk_krita_launcher import SoftwareIndex
+
+
+@pytest.fixture
+def install_root(tmp_path):
+    install_root = tmp_path / "install"
+    install_root.mkdir()
+    (install_root / "krita-4.2.0").mkdir()
+    return install_root
+
+
+def _index(tmp_path, salt="salt"):
+    return SoftwareIndex(str(tmp_path / "index.json"), salt, logging.getLogger("test"))
+
+
+def _template(install_root):
+    return os.path.join(str(install_root), "krita-{version}", "bin", "krita")
+
+
+def test_matches_are_reused_while_the_directory_is_unchanged(tmp_path, install_root):
+    index = _index(tmp_path)
+    template = _template(install_root)
+    assert index.template_directory(template) == str(install_root)
+
+    stamp = index.stamp(template)
+    assert index.get_matches(template, stamp) is None
+    matches = [(os.path.join(str(install_root), "krita-4.2.0", "bin", "krita"), {"version": "4.2.0"})]
+    index.set_matches(template, stamp, matches)
+    assert index.get_matches(template, index.stamp(template)) == matches
+
+    # installing another version changes the directory
+    (install_root / "krita-4.3.0").mkdir()
+    os.utime(str(install_root), (stamp + 10, stamp + 10))
+    assert index.get_matches(template, index.stamp(template)) is None
+
+
+def test_index_is_kept_between_sessions(tmp_path, install_root):
+    index = _index(tmp_path)
+    template = _template(install_root)
+    stamp = index.stamp(template)
+    index.set_matches(template, stamp, [])
+    index.set_matches("/gone/krita-{version}", None, [])
+    index.prune([template])
+    index.save()
+
+    assert _index(tmp_path).get_matches(template, stamp) == []
+    assert _index(tmp_path).get_matches("/gone/krita-{version}", None) is None
+    # written for other component regexes
+    assert _index(tmp_path, salt="other").get_matches(template, stamp) is None
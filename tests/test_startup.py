@@ -0,0 +1,48 @@
+import glob
+import os
+import sys
+
+import pytest
+import sgtk
+
+
+@pytest.fixture
+def launcher(startup_module, tmp_path, monkeypatch):
+    install_root = tmp_path / "install"
+    install_root.mkdir()
+    for index in range(3):
+        (install_root / ("krita-4.%d.0-x86_64.appimage" % index)).write_bytes(b"")
+    monkeypatch.setattr(sgtk.util.LocalFileStorageManager, "root", str(tmp_path / "cache"))
+
+    class Launcher(startup_module.KritaLauncher):
+        EXECUTABLE_TEMPLATES = {
+            sys.platform: [os.path.join(str(install_root), "krita-{version}-{mach}.appimage")]
+        }
+
+    return Launcher(None, None, "tk-krita", str(tmp_path))
+
+
+def test_warm_scan_does_not_hash_appimages(startup_module, launcher, monkeypatch):
+    assert len(launcher.rescan_software()) == 3
+
+    hashed = []
+    appimage_key = startup_module.appimage_key
+    monkeypatch.setattr(
+        startup_module, "appimage_key", lambda *args: hashed.append(args[0]) or appimage_key(*args)
+    )
+    assert len(launcher.scan_software()) == 3
+    assert hashed == []
+
+
+def test_warm_scan_does_not_glob(launcher, monkeypatch):
+    assert len(launcher.rescan_software()) == 3
+
+    patterns = []
+    glob_glob = glob.glob
+    monkeypatch.setattr(glob, "glob", lambda pattern, *args: patterns.append(pattern) or glob_glob(pattern, *args))
+    assert len(launcher.scan_software()) == 3
+    assert patterns == []
+
+    # the index is bypassed when refreshing
+    launcher.rescan_software()
+    assert patterns
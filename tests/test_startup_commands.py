@@ -0,0 +1,32 @@
+import os
+
+import sgtk
+
+
+def test_commands_run_from_the_event_loop(start_engine, make_app, app_log, qt):
+    start_engine(
+        {"run_at_startup": [{"app_instance": "tk-multi-a", "name": ""}]}, [make_app("tk-multi-a")]
+    )
+    assert ("run", "tk-multi-a") not in app_log
+    qt.process_events()
+    assert ("run", "tk-multi-a") in app_log
+
+
+def test_commands_run_at_once_without_ui(engine_module, start_engine, make_app, app_log, monkeypatch):
+    monkeypatch.setenv(engine_module.KritaEngine.HEADLESS_ENV_VAR, "1")
+    engine = start_engine(
+        {"run_at_startup": [
+            {"app_instance": "tk-multi-a", "name": ""},
+            {"app_instance": "tk-multi-b", "name": "", "priority": 1},
+        ]},
+        [make_app("tk-multi-a"), make_app("tk-multi-b")]
+    )
+    assert not engine.has_ui
+    assert [name for (event, name) in app_log if event == "run"] == ["tk-multi-b", "tk-multi-a"]
+
+
+def test_startup_trace_is_written_at_once_without_ui(engine_module, start_engine, monkeypatch, tmp_path):
+    monkeypatch.setenv(engine_module.KritaEngine.HEADLESS_ENV_VAR, "1")
+    monkeypatch.setattr(sgtk.LogManager, "log_folder", str(tmp_path))
+    start_engine({"startup_trace": True})
+    assert os.listdir(str(tmp_path / "tk-krita" / "startup_traces"))
@@ -0,0 +1,62 @@
+import logging
+import threading
+
+import pytest
+
+from tk_krita import Task, TaskCancelled, TaskRunner
+
+
+def test_tasks_queued_before_an_idle_worker_wakes_get_their_own_worker():
+    runner = TaskRunner(logging.getLogger("test"), max_workers=2)
+    try:
+        runner.submit(lambda: None).wait(5)
+
+        started = [threading.Event(), threading.Event()]
+        release = threading.Event()
+
+        def block(index):
+            started[index].set()
+            release.wait(5)
+
+        # the idle worker can't wake up before both tasks are queued
+        with runner._condition:
+            tasks = [runner.submit(block, (index,)) for index in range(2)]
+
+        assert all(event.wait(1) for event in started)
+        release.set()
+        for task in tasks:
+            task.wait(5)
+    finally:
+        runner.stop()
+
+
+def test_cancelling_reports_whether_the_function_runs(monkeypatch):
+    runner = TaskRunner(logging.getLogger("test"), max_workers=1)
+    try:
+        started = threading.Event()
+        release = threading.Event()
+        blocker = runner.submit(lambda: started.set() or release.wait(5))
+        assert started.wait(1)
+        calls = []
+        pending = runner.submit(calls.append, ("pending",))
+        assert pending.cancel()
+
+        # a cancel arriving once a worker took the task
+        cancels = []
+        run = Task._run
+        monkeypatch.setattr(Task, "_run", lambda task: cancels.append(task.cancel()) or run(task))
+        delivered = []
+        taken = runner.submit(calls.append, ("taken",), callback=delivered.append)
+        release.set()
+        blocker.wait(5)
+
+        with pytest.raises(TaskCancelled):
+            taken.wait(5)
+        assert cancels == [False]
+        assert calls == ["taken"]
+        assert taken.cancelled
+        assert delivered == []
+        with pytest.raises(TaskCancelled):
+            pending.wait(0)
+    finally:
+        runner.stop()
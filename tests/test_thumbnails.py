@@ -0,0 +1,42 @@
+import os
+import time
+
+from krita import Document, Krita
+
+from tk_krita import thumbnails
+
+
+def test_downsampling_without_numpy(monkeypatch):
+    monkeypatch.setattr(thumbnails, "numpy", None)
+    data = bytes(bytearray(range(256))) * (120 * 80 * 4 // 256)
+
+    images = thumbnails.downsample(data, 120, 80, [64, 16, 256])
+    assert dict((size, (image.width(), image.height())) for (size, image) in images.items()) == {
+        256: (120, 80),
+        64: (64, 43),
+        16: (16, 11),
+    }
+
+
+def _capture(engine, qt, document):
+    results = []
+    engine.capture_thumbnail([32], results.append, document=document)
+    deadline = time.time() + 5
+    while not results and time.time() < deadline:
+        qt.process_events()
+        time.sleep(0.001)
+    return results
+
+
+def test_thumbnails_of_closed_documents_are_dropped(start_engine, qt, tmp_path):
+    engine = start_engine()
+    path = str(tmp_path / "paint.kra")
+    open(path, "wb").close()
+    document = Document(path)
+    Krita.instance().setActiveDocument(document)
+
+    assert _capture(engine, qt, document)
+    assert engine.capture_thumbnail([32], lambda result: None, document=document) is None
+
+    Krita.instance().closeDocument(document)
+    assert engine.capture_thumbnail([32], lambda result: None, document=document) is not None